@@ -0,0 +1,65 @@
+# Render time for the in-process Apple II display: a full redraw against a
+# frame where one text row or one hi-res line changed, and cycles per
+# second for a program storing to the text page with the display attached.
+#
+#     python -m benchmarks.apple_video
+from __future__ import print_function
+import timeit
+
+from wednesday.apple_video import AppleVideo, FRAME_CYCLES, HIRES, TEXT_OFF
+from wednesday.cpu6502 import CPU, Memory
+from benchmarks.common import assemble, best_of, report
+
+
+FRAMES = 100
+START = 0x0800
+
+# fills the first text row over and over
+TEXT_LOOP = '''
+    MAIN:
+      LDX #$00
+    LOOP:
+      TXA
+      STA $0400, x
+      INX
+      CPX #$28
+      BNE LOOP
+      JMP MAIN
+'''
+
+
+def render_time(video, touch):
+    def frame():
+        touch()
+        video.render()
+    return min(timeit.repeat(frame, number=FRAMES, repeat=5)) / FRAMES
+
+
+def main():
+    memory = Memory()
+    video = AppleVideo(memory).attach()
+    for name, touch in [
+            ('text, full redraw', video.invalidate),
+            ('text, one row', lambda: memory.write_byte(0, 0x0400, 0xC1))]:
+        print('{:<32} {:>9.1f} us/frame'.format(name, render_time(video, touch) * 1e6))
+    memory.read_byte(0, TEXT_OFF)
+    memory.read_byte(0, HIRES)
+    for name, touch in [
+            ('hi-res, full redraw', video.invalidate),
+            ('hi-res, one line', lambda: memory.write_byte(0, 0x2000, 0x7F))]:
+        print('{:<32} {:>9.1f} us/frame'.format(name, render_time(video, touch) * 1e6))
+
+    memory = Memory()
+    memory.load(START, assemble(TEXT_LOOP, START))
+    memory.rom.load(CPU.RESET_VECTOR, [START & 0xFF, START >> 8])
+    video = AppleVideo(memory).attach()
+    cpu = CPU(None, memory)
+
+    def run():
+        for frame in range(FRAMES):
+            video.tick(cpu.run_cycles(FRAME_CYCLES))
+    report('text loop, rendering each frame', FRAMES * FRAME_CYCLES, best_of(run, 3), 'cycles/s')
+
+
+if __name__ == '__main__':
+    main()
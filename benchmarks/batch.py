@@ -0,0 +1,41 @@
+# Emulated cycles per second when driving the CPU one next() at a time
+# against the batch run_cycles API.
+#
+#     python -m benchmarks.batch
+from __future__ import print_function
+
+from wednesday.cpu6502 import CPU
+from wednesday.translator import BlockCPU
+from benchmarks.common import ALU_LOOP, best_of, load_program, report
+
+
+CYCLES = 1000000
+
+
+def step_loop(cpu_class):
+    cpu = load_program(ALU_LOOP, cpu_class)
+    executor = cpu.run()
+
+    def run():
+        cycles = 0
+        while cycles < CYCLES:
+            cycles += next(executor)[0]
+    return run
+
+
+def batch_loop(cpu_class):
+    cpu = load_program(ALU_LOOP, cpu_class)
+    return lambda: cpu.run_cycles(CYCLES)
+
+
+def main():
+    for name, loop, cpu_class in [
+            ('interpreter, next()', step_loop, CPU),
+            ('interpreter, run_cycles', batch_loop, CPU),
+            ('translator, next()', step_loop, BlockCPU),
+            ('translator, run_cycles', batch_loop, BlockCPU)]:
+        report(name, CYCLES, best_of(loop(cpu_class)), 'cycles/s')
+
+
+if __name__ == '__main__':
+    main()
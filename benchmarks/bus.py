@@ -0,0 +1,94 @@
+# Wall time, sends and bytes for the v1 and v2 bus protocols over a local
+# socket pair and for the shared memory ring, with a device thread on the
+# other end. Each emulated frame redraws the text page and polls the
+# keyboard once.
+#
+#     python -m benchmarks.bus
+from __future__ import print_function
+import socket
+import threading
+import time
+
+from wednesday.bus import (
+    BusV1, BusV2, FrameParser, SharedMemoryBus, SharedMemoryDevice)
+
+
+FRAMES = 60
+FRAME_CYCLES = 17030
+
+
+def socket_device(sock):
+    parser = FrameParser()
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            break
+        for event in parser.feed(data):
+            if event[0] == 'read':
+                sock.sendall(b'\x00')
+
+
+def socket_transport(bus_class):
+    cpu_end, device_end = socket.socketpair()
+    thread = threading.Thread(target=socket_device, args=(device_end,))
+    thread.start()
+
+    def close():
+        cpu_end.close()
+        thread.join()
+        device_end.close()
+    return bus_class(cpu_end), close
+
+
+def ring_transport():
+    bus = SharedMemoryBus()
+    done = threading.Event()
+
+    def poll():
+        device = SharedMemoryDevice(bus.name)
+        while not done.is_set():
+            if not device.poll():
+                time.sleep(0.0005)
+        device.poll()
+        device.close()
+    thread = threading.Thread(target=poll)
+    thread.start()
+
+    def close():
+        done.set()
+        thread.join()
+        bus.close()
+    return bus, close
+
+
+def run(transport, *args):
+    bus, close = transport(*args)
+    start = time.time()
+    cycle = 0
+    for frame in range(FRAMES):
+        for address in range(0x0400, 0x0800):
+            bus.write(cycle, address, 0xA0)
+            cycle += 4
+        bus.read(cycle, 0xC000)
+        bus.tick(FRAME_CYCLES)
+    bus.flush()
+    seconds = time.time() - start
+    close()
+    return seconds, bus.stats
+
+
+def main():
+    transports = [('v1 (before)', socket_transport, BusV1),
+                  ('v2', socket_transport, BusV2),
+                  ('shared memory', ring_transport)]
+    for row in transports:
+        seconds, stats = run(*row[1:])
+        rates = stats.per_emulated_second()
+        print('{:<14} {:>8.3f}s {:>10,.0f} sends/s {:>12,.0f} bytes/s '
+              '{:>6,.0f} round trips/s (per emulated second)'.format(
+                  row[0], seconds, rates['sends'], rates['bytes_sent'],
+                  rates['round_trips']))
+
+
+if __name__ == '__main__':
+    main()
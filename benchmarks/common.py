@@ -0,0 +1,42 @@
+from __future__ import print_function
+import timeit
+
+from nesasm.compiler import lexical, semantic, syntax, Cartridge
+from wednesday.cpu6502 import BasicMemory, CPU
+
+
+# a tight loop mixing loads, ALU work, indexed stores and a branch
+ALU_LOOP = '''
+    MAIN:
+      LDX #$00
+    LOOP:
+      LDA $10, x
+      CLC
+      ADC #$01
+      STA $0200, x
+      INX
+      BNE LOOP
+      JMP MAIN
+'''
+
+
+def assemble(source, start_addr=0xC000):
+    cart = Cartridge()
+    cart.set_org(start_addr)
+    return semantic(syntax(lexical(source)), False, cart)
+
+
+def load_program(source, cpu_class=CPU, start_addr=0xC000, memory=None):
+    if memory is None:
+        memory = BasicMemory()
+    memory.load(start_addr, assemble(source, start_addr))
+    memory.load(CPU.RESET_VECTOR, [start_addr & 0xFF, start_addr >> 8])
+    return cpu_class(None, memory)
+
+
+def best_of(func, repeat=5):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def report(name, count, seconds, unit='instructions/s'):
+    print('{:<32} {:>12,.0f} {}'.format(name, count / seconds, unit))
@@ -0,0 +1,41 @@
+# CPU construction time and bytes per instance, for the slots-based register
+# file against the same class with a per-instance __dict__.
+#
+#     python -m benchmarks.construction
+from __future__ import print_function
+import sys
+import timeit
+
+from wednesday.cpu6502 import BasicMemory, CPU
+
+
+INSTANCES = 20000
+
+
+# the same methods and properties, with the attributes in a __dict__
+DictCPU = type('DictCPU', (object,), dict(
+    (name, value) for name, value in vars(CPU).items()
+    if name not in CPU.__slots__ and name != '__slots__'))
+
+
+def instance_size(cpu):
+    # the registers are small ints and everything else is shared
+    size = sys.getsizeof(cpu)
+    if hasattr(cpu, '__dict__'):
+        size += sys.getsizeof(cpu.__dict__)
+    return size
+
+
+def main():
+    memory = BasicMemory()
+    for name, cpu_class in [('dict (before)', DictCPU),
+                            ('slots (after)', CPU)]:
+        seconds = min(timeit.repeat(lambda: cpu_class(None, memory),
+                                    number=INSTANCES, repeat=5))
+        print('{:<14} {:>8.2f} us/instance {:>6} bytes/instance'.format(
+            name, seconds / INSTANCES * 1e6,
+            instance_size(cpu_class(None, memory))))
+
+
+if __name__ == '__main__':
+    main()
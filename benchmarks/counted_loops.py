@@ -0,0 +1,88 @@
+# Boots per second for typical NES init code: clear the 2K of RAM, copy a
+# page of sprites, load the palettes and fill a nametable through $2007.
+# The block translator runs the counted loops in bulk; translation is
+# left out, the CPU is reset between boots.
+#
+#     python -m benchmarks.counted_loops
+from __future__ import print_function
+
+from wednesday.cpu6502 import CPU
+from wednesday.nes import NESMemory, RegisterFile
+from wednesday.translator import BlockCPU
+from benchmarks.common import assemble, best_of, report
+
+
+BOOTS = 20
+
+BOOT = '''
+    BOOT:
+      LDX #$00
+    CLEARMEM:
+      LDA #$00
+      STA $0000, x
+      STA $0100, x
+      STA $0300, x
+      STA $0400, x
+      STA $0500, x
+      STA $0600, x
+      STA $0700, x
+      LDA #$FE
+      STA $0200, x
+      INX
+      BNE CLEARMEM
+    LOADSPRITES:
+      LDA $E000, x
+      STA $0200, x
+      INX
+      BNE LOADSPRITES
+    LOADPALETTES:
+      LDA $E100, x
+      STA $2007
+      INX
+      CPX #32
+      BNE LOADPALETTES
+      LDY #$04
+    NAMETABLE:
+      LDX #$00
+    NAMETABLEROW:
+      LDA $E000, x
+      STA $2007
+      INX
+      BNE NAMETABLEROW
+      DEY
+      BNE NAMETABLE
+    HALT:
+      JMP HALT
+'''
+
+
+def boot(cpu_class, batch_counted_loops=True):
+    memory = NESMemory(ppu=RegisterFile(8))
+    prg = bytearray(0x4000)
+    code = assemble(BOOT, 0xC000)
+    prg[:len(code)] = bytearray(code)
+    prg[0x2000:0x2200] = bytearray(range(0x100)) * 2
+    prg[0x3FFC:0x3FFE] = bytearray([0x00, 0xC0])
+    memory.map_rom(0xC000, prg)
+    halt = 0xC000 + len(code) - 3
+
+    cpu = cpu_class(None, memory)
+    if cpu_class is BlockCPU:
+        cpu.batch_counted_loops = batch_counted_loops
+
+    def run():
+        for n in range(BOOTS):
+            cpu.reset()
+            cpu.run_until(halt, 1000000)
+    return run
+
+
+def main():
+    for name, cpu_class, batch in [('interpreter', CPU, False),
+                                   ('block translator', BlockCPU, False),
+                                   ('block translator, bulk loops', BlockCPU, True)]:
+        report(name, BOOTS, best_of(boot(cpu_class, batch)), 'boots/s')
+
+
+if __name__ == '__main__':
+    main()
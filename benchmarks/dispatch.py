@@ -0,0 +1,59 @@
+"""Instructions per second of the CPU.run loop.
+
+Compares the baseline engine, the per-instance lambda table built in
+setup_ops, against the class-level compiled dispatch table. The baseline is
+the wednesday.cpu6502 module as it was at a git revision, the repository's
+first commit unless one is given, run on its own memory and run loop.
+
+    python -m benchmarks.dispatch [revision]
+"""
+from __future__ import print_function
+import itertools
+import subprocess
+import sys
+import types
+
+from wednesday.cpu6502 import CPU
+from benchmarks.common import ALU_LOOP, assemble, best_of, load_program, report
+
+
+INSTRUCTIONS = 200000
+START = 0xC000
+
+
+def first_commit():
+    return subprocess.check_output(
+        ['git', 'rev-list', '--max-parents=0', 'HEAD']).decode().split()[-1]
+
+
+def baseline_module(revision):
+    source = subprocess.check_output(
+        ['git', 'show', '{}:wednesday/cpu6502.py'.format(revision)])
+    module = types.ModuleType('baseline_cpu6502')
+    exec(compile(source, 'baseline_cpu6502.py', 'exec'), module.__dict__)
+    return module
+
+
+def baseline_loop(module):
+    memory = module.BasicMemory()
+    memory.load(START, assemble(ALU_LOOP, START))
+    memory.load(module.CPU.RESET_VECTOR, [START & 0xFF, START >> 8])
+    executor = module.CPU(None, memory).run()
+    return lambda: list(itertools.islice(executor, INSTRUCTIONS))
+
+
+def run_loop(cpu_class):
+    cpu = load_program(ALU_LOOP, cpu_class, START)
+    executor = cpu.run()
+    return lambda: list(itertools.islice(executor, INSTRUCTIONS))
+
+
+def main():
+    revision = sys.argv[1] if len(sys.argv) > 1 else first_commit()
+    report('cpu6502 at {}'.format(revision[:7]), INSTRUCTIONS,
+           best_of(baseline_loop(baseline_module(revision))))
+    report('compiled dispatch (after)', INSTRUCTIONS, best_of(run_loop(CPU)))
+
+
+if __name__ == '__main__':
+    main()
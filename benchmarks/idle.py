@@ -0,0 +1,75 @@
+# Headless frames per second for a game shaped loop: a short burst of work
+# each frame, then BIT $2002 / BPL until the next vblank. The block
+# translator fast forwards through the polling, the interpreter runs it.
+#
+#     python -m benchmarks.idle
+from __future__ import print_function
+
+from wednesday.cpu6502 import CPU
+from wednesday.nes import NESMemory
+from wednesday.translator import BlockCPU
+from benchmarks.common import assemble, best_of, report
+
+
+FRAME_CYCLES = 29781
+FRAMES = 60
+
+FRAME_LOOP = '''
+    FRAME:
+      LDX #$00
+    WORK:
+      LDA $10, x
+      STA $0200, x
+      INX
+      BNE WORK
+    WAITVBLANK:
+      BIT $2002
+      BPL WAITVBLANK
+      JMP FRAME
+'''
+
+
+class VBlankPPU(object):
+    # the vblank flag is set from outside and cleared by reading $2002
+
+    def __init__(self):
+        self.status = 0x00
+
+    def read_register(self, cycle, register):
+        status = self.status
+        if register == 2:
+            self.status &= 0x7F
+        return status
+
+    def write_register(self, cycle, register, value):
+        pass
+
+
+def run_frames(cpu_class, skip_idle_loops=True):
+    ppu = VBlankPPU()
+    memory = NESMemory(ppu=ppu)
+    prg = bytearray(0x4000)
+    code = assemble(FRAME_LOOP, 0xC000)
+    prg[:len(code)] = bytearray(code)
+    prg[0x3FFC:0x3FFE] = bytearray([0x00, 0xC0])
+    memory.map_rom(0xC000, prg)
+    cpu = cpu_class(None, memory)
+    if cpu_class is BlockCPU:
+        cpu.skip_idle_loops = skip_idle_loops
+
+    def run():
+        for frame in range(FRAMES):
+            ppu.status |= 0x80
+            cpu.run_cycles(FRAME_CYCLES)
+    return run
+
+
+def main():
+    for name, cpu_class, skip in [('interpreter', CPU, False),
+                                  ('block translator', BlockCPU, False),
+                                  ('block translator, idle skip', BlockCPU, True)]:
+        report(name, FRAMES, best_of(run_frames(cpu_class, skip)), 'frames/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# Startup and bank switch cost for iNES images: mapping the file and
+# attaching the mapper against copying PRG into a ROM, and a UxROM bank
+# switch through the page table against slicing the bank into pages again.
+#
+#     python -m benchmarks.ines
+from __future__ import print_function
+import os
+import tempfile
+import timeit
+
+from wednesday.cpu6502 import MemoryMap, ROM
+from wednesday.ines import Cartridge
+
+
+PRG_BANKS = 32  # 512K of PRG
+
+
+def main():
+    fd, filename = tempfile.mkstemp(suffix='.nes')
+    header = bytearray(b'NES\x1a') + bytearray([PRG_BANKS, 0, 0x20, 0]) + bytearray(8)
+    os.write(fd, bytes(header) + os.urandom(PRG_BANKS * 0x4000))
+    os.close(fd)
+    try:
+        def copy():
+            rom = ROM(0, PRG_BANKS * 0x4000)
+            rom.load_file(0, filename)
+
+        def mapped():
+            Cartridge.open(filename).mapper().attach(MemoryMap())
+
+        for name, func in [('copy PRG into a ROM', copy), ('map and attach', mapped)]:
+            seconds = min(timeit.repeat(func, number=100, repeat=5)) / 100
+            print('{:<32} {:>9.1f} us'.format(name, seconds * 1e6))
+
+        memory = MemoryMap()
+        mapper = Cartridge.open(filename).mapper().attach(memory)
+        prg = mapper.cartridge.prg
+        switches = [0]
+
+        def switch():
+            switches[0] = (switches[0] + 1) % PRG_BANKS
+            memory.write_byte(0, 0x8000, switches[0])
+
+        def slice_again():
+            switches[0] = (switches[0] + 1) % PRG_BANKS
+            memory.map_rom(0x8000, prg[switches[0] * 0x4000:(switches[0] + 1) * 0x4000])
+
+        for name, func in [('map_rom slices (before)', slice_again),
+                           ('switch_pages (after)', switch)]:
+            seconds = min(timeit.repeat(func, number=10000, repeat=5)) / 10000
+            print('{:<32} {:>9.2f} us/switch'.format(name, seconds * 1e6))
+    finally:
+        os.remove(filename)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# Instructions per second with eager flag updates against lazy flags, on
+# an ALU-heavy loop, interpreted and translated.
+#
+#     python -m benchmarks.lazy_flags
+from __future__ import print_function
+import itertools
+
+from wednesday.cpu6502 import CPU
+from wednesday.lazy_flags import LazyFlagsCPU
+from wednesday.translator import BlockCPU
+from benchmarks.common import best_of, load_program, report
+
+
+INSTRUCTIONS = 200000
+
+# most results are overwritten before the BNE reads Z
+ALU_HEAVY_LOOP = '''
+    MAIN:
+      LDX #$00
+    LOOP:
+      LDA $10, x
+      CLC
+      ADC #$11
+      EOR #$5A
+      ASL A
+      ORA #$01
+      CMP #$40
+      AND #$7F
+      STA $0200, x
+      INX
+      BNE LOOP
+      JMP MAIN
+'''
+
+
+class LazyFlagsBlockCPU(LazyFlagsCPU, BlockCPU):
+    pass
+
+
+def run_loop(cpu_class):
+    cpu = load_program(ALU_HEAVY_LOOP, cpu_class)
+    executor = cpu.run()
+    # the translator yields once per iteration, the loop body being a block
+    # of 11 instructions
+    steps = INSTRUCTIONS // (11 if issubclass(cpu_class, BlockCPU) else 1)
+    return lambda: list(itertools.islice(executor, steps))
+
+
+def main():
+    for name, cpu_class in [('eager flags', CPU),
+                            ('lazy flags', LazyFlagsCPU),
+                            ('eager flags, translated', BlockCPU),
+                            ('lazy flags, translated', LazyFlagsBlockCPU)]:
+        report(name, INSTRUCTIONS, best_of(run_loop(cpu_class)))
+
+
+if __name__ == '__main__':
+    main()
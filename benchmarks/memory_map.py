@@ -0,0 +1,60 @@
+# Emulated cycles per second on the Apple II memory layout, decoding the
+# address with a chain of comparisons, with the 256 entry page table behind
+# bus calls, and with the CPU indexing RAM pages itself.
+#
+#     python -m benchmarks.memory_map
+from __future__ import print_function
+
+from wednesday.cpu6502 import CPU, Memory, NO_PAGES
+from benchmarks.common import ALU_LOOP, assemble, best_of, report
+
+
+CYCLES = 1000000
+START = 0x0800
+
+
+class ChainMemory(Memory):
+    # the comparisons Memory used before the page table
+
+    def __init__(self):
+        super(ChainMemory, self).__init__()
+        self.read_pages = self.write_pages = NO_PAGES
+
+    def read_byte(self, cycle, address):
+        if address < 0xC000:
+            return self.ram.read_byte(address)
+        elif address < 0xD000:
+            return self.bus_read(cycle, address)
+        else:
+            return self.rom.read_byte(address)
+
+    def read_word(self, cycle, address):
+        return self.read_byte(cycle, address) + (self.read_byte(cycle + 1, address + 1) << 8)
+
+    def write_byte(self, cycle, address, value):
+        if address < 0xC000:
+            self.ram.write_byte(address, value)
+        if 0x400 <= address < 0x800 or 0x2000 <= address < 0x5FFF:
+            self.bus_write(cycle, address, value)
+
+
+def apple_loop(memory_class, fast_path=True):
+    memory = memory_class()
+    memory.load(START, assemble(ALU_LOOP, START))
+    memory.rom.load(CPU.RESET_VECTOR, [START & 0xFF, START >> 8])
+    cpu = CPU(None, memory)
+    if not fast_path:
+        cpu.read_pages = cpu.write_pages = NO_PAGES
+    return lambda: cpu.run_cycles(CYCLES)
+
+
+def main():
+    for name, memory_class, fast_path in [
+            ('comparisons (before)', ChainMemory, False),
+            ('page table, bus calls', Memory, False),
+            ('page table, CPU fast path', Memory, True)]:
+        report(name, CYCLES, best_of(apple_loop(memory_class, fast_path)), 'cycles/s')
+
+
+if __name__ == '__main__':
+    main()
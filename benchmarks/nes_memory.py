@@ -0,0 +1,35 @@
+# Emulated cycles per second for the same loop on the NES memory map,
+# addressing RAM directly and through its $1800 mirror, against the flat
+# BasicMemory.
+#
+#     python -m benchmarks.nes_memory
+from __future__ import print_function
+
+from wednesday.cpu6502 import CPU
+from wednesday.nes import NESMemory
+from benchmarks.common import ALU_LOOP, assemble, best_of, load_program, report
+
+
+CYCLES = 1000000
+MIRRORED_LOOP = ALU_LOOP.replace('$10, x', '$1810, x').replace('$0200, x', '$1A00, x')
+
+
+def nes_loop(memory, source):
+    prg = bytearray(0x4000)
+    code = assemble(source, 0xC000)
+    prg[:len(code)] = bytearray(code)
+    prg[0x3FFC:0x3FFE] = bytearray([0x00, 0xC0])
+    memory.map_rom(0xC000, prg)
+    cpu = CPU(None, memory)
+    return lambda: cpu.run_cycles(CYCLES)
+
+
+def main():
+    flat = load_program(ALU_LOOP)
+    report('flat BasicMemory', CYCLES, best_of(lambda: flat.run_cycles(CYCLES)), 'cycles/s')
+    for name, source in [('NES map, direct', ALU_LOOP),
+                         ('NES map, mirrored', MIRRORED_LOOP)]:
+        report(name, CYCLES, best_of(nes_loop(NESMemory(), source)), 'cycles/s')
+
+if __name__ == '__main__':
+    main()
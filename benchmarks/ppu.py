@@ -0,0 +1,113 @@
+# Frames per second for the PPU: rendering alone, 240 lines of a busy
+# background with and without 64 sprites, and a whole machine running a
+# game shaped NROM image that uploads sprites by DMA and sets the scroll
+# every vblank, drawing every frame, every 4th or none.
+#
+#     python -m benchmarks.ppu
+from __future__ import print_function
+
+import numpy
+
+from wednesday.console import NES
+from wednesday.cpu6502 import CPU
+from wednesday.ppu import PPU, HEIGHT
+from wednesday.translator import BlockCPU
+from benchmarks.common import assemble, best_of, report
+
+
+FRAMES = 60
+
+MAIN = '''
+      LDA #$00
+      STA $2005
+      STA $2005
+      LDA #$1E
+      STA $2001
+      LDA #$80
+      STA $2000
+    FRAME:
+      LDX #$00
+    MOVE:
+      INC $0200, x
+      INX
+      INX
+      INX
+      INX
+      BNE MOVE
+      LDA $10
+    WAIT:
+      CMP $10
+      BEQ WAIT
+      JMP FRAME
+'''
+
+NMI = '''
+      PHA
+      LDA #$02
+      STA $4014
+      INC $10
+      LDA $10
+      STA $2005
+      LDA #$00
+      STA $2005
+      PLA
+      RTI
+'''
+
+
+def busy_ppu(mask):
+    ppu = PPU()
+    random = numpy.random.RandomState(6502)
+    ppu.chr[:] = random.randint(0, 0x100, 0x2000)
+    ppu.vram[:] = random.randint(0, 0x100, 0x1000)
+    ppu.palette[:] = random.randint(0, 0x40, 0x20)
+    ppu.oam[:] = random.randint(0, 0x100, 0x100)
+    ppu.mask = mask
+    return ppu
+
+
+def render_frames(mask):
+    ppu = busy_ppu(mask)
+
+    def run():
+        for frame in range(FRAMES):
+            ppu.v = ppu.t
+            for line in range(HEIGHT):
+                ppu.render_line(line)
+    return run
+
+
+def nrom_image():
+    prg = bytearray(0x4000)
+    code = assemble(MAIN, 0xC000)
+    prg[:len(code)] = bytearray(code)
+    code = assemble(NMI, 0xD000)
+    prg[0x1000:0x1000 + len(code)] = bytearray(code)
+    prg[0x3FFA:0x3FFE] = bytearray([0x00, 0xD0, 0x00, 0xC0])
+    chr = numpy.random.RandomState(2).randint(0, 0x100, 0x2000).astype(numpy.uint8)
+    header = bytearray(b'NES\x1a') + bytearray([1, 1, 0, 0]) + bytearray(8)
+    return bytes(header + prg + bytearray(chr.tobytes()))
+
+
+def run_machine(cpu_class, render_every=1):
+    nes = NES(nrom_image(), cpu_class)
+    nes.ppu.render_every = render_every
+
+    def run():
+        for frame in range(FRAMES):
+            nes.run_frame()
+    return run
+
+
+def main():
+    report('render, background', FRAMES, best_of(render_frames(0x0A)), 'frames/s')
+    report('render, with sprites', FRAMES, best_of(render_frames(0x1E)), 'frames/s')
+    for name, cpu_class in [('interpreter', CPU), ('translator', BlockCPU)]:
+        report('machine, {}'.format(name), FRAMES, best_of(run_machine(cpu_class)), 'frames/s')
+    for name, render_every in [('1 in 4', 4), ('none', FRAMES * 10)]:
+        report('machine, translator, {}'.format(name), FRAMES,
+               best_of(run_machine(BlockCPU, render_every)), 'frames/s')
+
+
+if __name__ == '__main__':
+    main()
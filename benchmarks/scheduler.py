@@ -0,0 +1,38 @@
+# Emulated cycles per second on the ALU loop with no scheduler, with one
+# attached but empty, and with a frame event every 29781 cycles, to show
+# that waiting for events costs the run loop nothing.
+#
+#     python -m benchmarks.scheduler
+from __future__ import print_function
+
+from wednesday.cpu6502 import CPU
+from wednesday.scheduler import Scheduler
+from wednesday.translator import BlockCPU
+from benchmarks.common import ALU_LOOP, best_of, load_program, report
+
+
+CYCLES = 1000000
+FRAME_CYCLES = 29781
+
+
+def run_loop(cpu_class, events):
+    cpu = load_program(ALU_LOOP, cpu_class)
+    if events is not None:
+        scheduler = Scheduler().attach(cpu)
+        if events:
+            def frame(cycle):
+                scheduler.schedule(cycle + FRAME_CYCLES, frame)
+            scheduler.schedule(FRAME_CYCLES, frame)
+    return lambda: cpu.run_cycles(CYCLES)
+
+
+def main():
+    for cpu_name, cpu_class in [('interpreter', CPU), ('translator', BlockCPU)]:
+        for name, events in [('no scheduler', None), ('empty scheduler', False),
+                             ('frame events', True)]:
+            report('{}, {}'.format(cpu_name, name), CYCLES,
+                   best_of(run_loop(cpu_class, events)), 'cycles/s')
+
+
+if __name__ == '__main__':
+    main()
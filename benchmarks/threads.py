@@ -0,0 +1,41 @@
+# Aggregate emulated cycles per second for independent Apple II CPU and
+# Memory instances run on a thread pool. Each instance owns its memory and
+# bus, so nothing is shared between them; on a free-threaded CPython the
+# totals should grow with the worker count, with the GIL they stay flat.
+#
+#     python -m benchmarks.threads
+from __future__ import print_function
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from wednesday.cpu6502 import CPU, Memory
+from benchmarks.common import ALU_LOOP, assemble
+
+
+INSTANCES = 32
+CYCLES = 200000
+START = 0x0800
+
+
+def machine():
+    memory = Memory()
+    memory.load(START, assemble(ALU_LOOP, START))
+    memory.rom.load(CPU.RESET_VECTOR, [START & 0xFF, START >> 8])
+    return CPU(None, memory)
+
+
+def main():
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print('GIL {}'.format('enabled' if gil else 'disabled'))
+    for workers in [1, 2, 4, 8]:
+        cpus = [machine() for n in range(INSTANCES)]
+        start = time.time()
+        with ThreadPoolExecutor(workers) as pool:
+            cycles = sum(pool.map(lambda cpu: cpu.run_cycles(CYCLES), cpus))
+        seconds = time.time() - start
+        print('{:>2} threads {:>12,.0f} cycles/s'.format(workers, cycles / seconds))
+
+
+if __name__ == '__main__':
+    main()
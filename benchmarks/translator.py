@@ -0,0 +1,33 @@
+# Emulated cycles per second of the interpreter against the block translator
+# on the same hot loop.
+#
+#     python -m benchmarks.translator
+from __future__ import print_function
+
+from wednesday.cpu6502 import CPU
+from wednesday.translator import BlockCPU
+from benchmarks.common import ALU_LOOP, best_of, load_program, report
+
+
+CYCLES = 1000000
+
+
+def run_loop(cpu_class):
+    cpu = load_program(ALU_LOOP, cpu_class)
+    executor = cpu.run()
+
+    def run():
+        cycles = 0
+        while cycles < CYCLES:
+            cycles += next(executor)[0]
+    return run
+
+
+def main():
+    for name, cpu_class in [('interpreter', CPU),
+                            ('block translator', BlockCPU)]:
+        report(name, CYCLES, best_of(run_loop(cpu_class)), 'cycles/s')
+
+
+if __name__ == '__main__':
+    main()
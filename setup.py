@@ -19,7 +19,10 @@ setup(
     author="Guto Maia",
     author_email="guto@guto.net",
     license="Mit",
-    packages=find_packages(exclude=["*.tests", "*.tests.*", "wednesday"]),
+    packages=find_packages(exclude=["*.tests", "*.tests.*", "wednesday", "benchmarks"]),
+    # memoryview.toreadonly for ROM views, multiprocessing.shared_memory
+    # for the shared memory bus
+    python_requires='>=3.8',
     classifiers=[
         'Development Status :: 3 - Alpha',
     ]
@@ -0,0 +1,196 @@
+from __future__ import print_function
+
+import numpy
+
+
+WIDTH, HEIGHT = 280, 192
+FRAME_CYCLES = 17030
+
+TEXT_PAGES = (0x0400, 0x0800)
+HIRES_PAGES = (0x2000, 0x4000)
+
+
+def text_row_address(row):
+    # the 24 rows are interleaved in three groups of eight
+    return 0x0400 + (row & 7) * 0x80 + (row >> 3) * 0x28
+
+
+def hires_line_address(line):
+    return 0x2000 + (line & 7) * 0x400 + ((line >> 3) & 7) * 0x80 + (line >> 6) * 0x28
+
+
+TEXT_ROWS = numpy.array([text_row_address(row) - 0x0400 for row in range(24)])
+HIRES_LINES = numpy.array([hires_line_address(line) - 0x2000 for line in range(HEIGHT)])
+
+# row or line of every offset into a page, -1 for the screen holes
+TEXT_ROW_OF = [-1] * 0x0400
+for _row, _offset in enumerate(TEXT_ROWS):
+    TEXT_ROW_OF[_offset:_offset + 40] = [_row] * 40
+HIRES_LINE_OF = [-1] * 0x2000
+for _line, _offset in enumerate(HIRES_LINES):
+    HIRES_LINE_OF[_offset:_offset + 40] = [_line] * 40
+TEXT_ROW_OF, HIRES_LINE_OF = tuple(TEXT_ROW_OF), tuple(HIRES_LINE_OF)
+
+COLUMNS = numpy.arange(40)
+
+# the 7 pixels of a hi-res byte, bit 0 leftmost; bit 7 picks the colour
+# group, which this monochrome renderer ignores
+HIRES_PIXELS = numpy.array(
+    [[0xFF if byte & (1 << bit) else 0 for bit in range(7)] for byte in range(0x100)],
+    dtype=numpy.uint8)
+
+# soft switches, read or written
+TEXT_OFF, TEXT_ON, MIXED_OFF, MIXED_ON = 0xC050, 0xC051, 0xC052, 0xC053
+PAGE1, PAGE2, LORES, HIRES = 0xC054, 0xC055, 0xC056, 0xC057
+
+
+def glyphs_from_rom(character_rom):
+    # 8 bytes per screen code, one per scan line, bit 0 the leftmost of 7
+    # pixels and a set bit lit
+    rom = numpy.frombuffer(bytes(bytearray(character_rom)), dtype=numpy.uint8)
+    bits = numpy.unpackbits(rom.reshape(256, 8, 1), axis=2, bitorder='little')
+    return bits[:, :, :7] * numpy.uint8(0xFF)
+
+
+def default_glyphs():
+    # without a character ROM, inverse characters show as solid cells
+    glyphs = numpy.zeros((256, 8, 7), dtype=numpy.uint8)
+    glyphs[:0x40] = 0xFF
+    return glyphs
+
+
+def screen_character(code):
+    if code >= 0xE0:
+        return chr(code & 0x7F)
+    code &= 0x3F
+    return chr(code + 0x40 if code < 0x20 else code)
+
+
+class AppleVideo(object):
+    # An Apple II display in the memory map. Stores to the text and hi-res
+    # pages land in RAM as before and mark their text row or hi-res line
+    # dirty; render() redraws only what is dirty into frame, a HEIGHT x
+    # WIDTH uint8 array (0 dark, 0xFF lit). Mode and page switches redraw
+    # the whole screen.
+    #
+    # attach() takes over the writes to the display pages, so nothing goes
+    # to a bus for them, and watches the soft switches in the $C0 page.
+
+    def __init__(self, memory, character_rom=None):
+        self.memory = memory
+        self.ram_view = memory.ram.view()
+        self.ram = numpy.frombuffer(self.ram_view, dtype=numpy.uint8)
+        if character_rom is None:
+            self.glyphs = default_glyphs()
+        else:
+            self.glyphs = glyphs_from_rom(character_rom)
+        self.frame = numpy.zeros((HEIGHT, WIDTH), dtype=numpy.uint8)
+        # a flag per text row and hi-res line, for each page
+        self.text_dirty = [bytearray(24), bytearray(24)]
+        self.hires_dirty = [bytearray(HEIGHT), bytearray(HEIGHT)]
+        self.text = True
+        self.mixed = False
+        self.page = 0
+        self.hires = False
+        self.cycles = 0
+        self.frames = 0
+        self.invalidate()
+
+    def attach(self):
+        memory = self.memory
+        memory.map_device(0x0400, 0x0800, write=self.text_write)
+        memory.map_device(0x2000, 0x4000, write=self.hires_write)
+        bus_read = memory.read_handlers[0xC0]
+        bus_write = memory.write_handlers[0xC0]
+
+        def io_read(cycle, address):
+            if TEXT_OFF <= address <= HIRES:
+                self.switch(address)
+            return bus_read(cycle, address)
+
+        def io_write(cycle, address, value):
+            if TEXT_OFF <= address <= HIRES:
+                self.switch(address)
+            bus_write(cycle, address, value)
+
+        memory.map_device(0xC000, 0x0100, read=io_read, write=io_write)
+        return self
+
+    def text_write(self, cycle, address, value):
+        self.ram_view[address] = value
+        row = TEXT_ROW_OF[address & 0x03FF]
+        if row >= 0:
+            self.text_dirty[address >> 11][row] = 1
+
+    def hires_write(self, cycle, address, value):
+        self.ram_view[address] = value
+        line = HIRES_LINE_OF[address & 0x1FFF]
+        if line >= 0:
+            self.hires_dirty[(address >> 14) & 1][line] = 1
+
+    def switch(self, address):
+        mode = (self.text, self.mixed, self.page, self.hires)
+        if address <= TEXT_ON:
+            self.text = address == TEXT_ON
+        elif address <= MIXED_ON:
+            self.mixed = address == MIXED_ON
+        elif address <= PAGE2:
+            self.page = address - PAGE1
+        else:
+            self.hires = address == HIRES
+        if mode != (self.text, self.mixed, self.page, self.hires):
+            self.invalidate()
+
+    def invalidate(self):
+        for dirty in self.text_dirty + self.hires_dirty:
+            dirty[:] = b'\x01' * len(dirty)
+
+    def tick(self, cycles):
+        # render once per emulated frame
+        self.cycles += cycles
+        if self.cycles >= FRAME_CYCLES:
+            self.cycles %= FRAME_CYCLES
+            self.frames += 1
+            self.render()
+
+    def render(self):
+        if self.text:
+            self.render_text(0)
+        elif self.hires:
+            self.render_hires()
+            if self.mixed:
+                self.render_text(20)
+        else:
+            # lo-res graphics are not drawn, only the mixed mode text
+            if self.mixed:
+                self.render_text(20)
+        return self.frame
+
+    def render_text(self, first_row):
+        dirty = numpy.frombuffer(self.text_dirty[self.page], dtype=numpy.uint8)
+        rows = numpy.flatnonzero(dirty[first_row:]) + first_row
+        if not len(rows):
+            return
+        addresses = TEXT_PAGES[self.page] + TEXT_ROWS[rows][:, None] + COLUMNS
+        # (rows, 40, 8, 7) glyph pixels to (rows, 8 lines, 280)
+        cells = self.glyphs[self.ram[addresses]]
+        pixels = cells.transpose(0, 2, 1, 3).reshape(len(rows), 8, WIDTH)
+        self.frame.reshape(24, 8, WIDTH)[rows] = pixels
+        dirty[first_row:] = 0
+
+    def render_hires(self):
+        dirty = numpy.frombuffer(self.hires_dirty[self.page], dtype=numpy.uint8)
+        last = 160 if self.mixed else HEIGHT
+        lines = numpy.flatnonzero(dirty[:last])
+        if not len(lines):
+            return
+        addresses = HIRES_PAGES[self.page] + HIRES_LINES[lines][:, None] + COLUMNS
+        self.frame[lines] = HIRES_PIXELS[self.ram[addresses]].reshape(len(lines), WIDTH)
+        dirty[:last] = 0
+
+    def screen_text(self):
+        # the text page as strings, for headless runs and tests
+        base = TEXT_PAGES[self.page]
+        return [''.join(screen_character(code) for code in
+                        self.ram[base + offset:base + offset + 40])
+                for offset in TEXT_ROWS]
@@ -0,0 +1,335 @@
+import socket
+import struct
+import time
+from multiprocessing import shared_memory
+
+
+# Protocol v1, one message per access:
+#
+#   <IBHB  cycle, op (0 read, 1 write), address, value
+#
+# a read is answered with a single byte.
+#
+# Protocol v2 starts with a v1 shaped message with op 2 and then sends
+# frames, each a header and its records:
+#
+#   <BH    kind, count
+#   <IHB   cycle, address, value   (count of them, kind WRITES)
+#   <IH    cycle, address          (one, kind READ, answered with a byte)
+#
+# Writes are held back until a read, a full batch or the cycle budget, and
+# go out with the read in the same send.
+
+V1_MESSAGE = struct.Struct('<IBHB')
+V1_READ, V1_WRITE, V1_UPGRADE = 0, 1, 2
+
+HEADER = struct.Struct('<BH')
+WRITE = struct.Struct('<IHB')
+READ = struct.Struct('<IH')
+WRITES, READS = 1, 0
+
+
+class BusError(IOError):
+    # the device went away or the transport failed; the CPU stops in the
+    # middle of the access and the error goes to whoever is running it
+    pass
+
+
+class BusStats(object):
+
+    def __init__(self):
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.sends = 0
+        self.round_trips = 0
+        self.reads = 0
+        self.writes = 0
+        self.cycles = 0
+
+    def per_emulated_second(self, clock_hz=1023000):
+        # rates against emulated time, as counted by tick()
+        seconds = float(self.cycles) / clock_hz
+        if not seconds:
+            return {}
+        return dict((name, getattr(self, name) / seconds) for name in
+                    ['bytes_sent', 'bytes_received', 'sends', 'round_trips',
+                     'reads', 'writes'])
+
+    def __repr__(self):
+        return ('<BusStats {0.cycles} cycles, {0.reads} reads, {0.writes} writes, '
+                '{0.sends} sends, {0.round_trips} round trips, '
+                '{0.bytes_sent} bytes out, {0.bytes_received} in>'.format(self))
+
+
+class BusV1(object):
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.message = bytearray(V1_MESSAGE.size)
+        self.reply = bytearray(1)
+        self.stats = BusStats()
+
+    def read(self, cycle, address):
+        V1_MESSAGE.pack_into(self.message, 0, cycle & 0xFFFFFFFF, V1_READ, address, 0)
+        self.send(self.message)
+        self.stats.reads += 1
+        return self.receive()
+
+    def write(self, cycle, address, value):
+        V1_MESSAGE.pack_into(self.message, 0, cycle & 0xFFFFFFFF, V1_WRITE, address, value)
+        self.send(self.message)
+        self.stats.writes += 1
+
+    def tick(self, cycles):
+        self.stats.cycles += cycles
+
+    def flush(self):
+        pass
+
+    def send(self, data):
+        try:
+            self.sock.sendall(data)
+        except socket.error as e:
+            raise BusError('bus send failed: {}'.format(e))
+        self.stats.sends += 1
+        self.stats.bytes_sent += len(data)
+
+    def receive(self):
+        try:
+            received = self.sock.recv_into(self.reply, 1)
+        except socket.error as e:
+            raise BusError('bus receive failed: {}'.format(e))
+        if not received:
+            raise BusError('bus closed by the device')
+        self.stats.round_trips += 1
+        self.stats.bytes_received += 1
+        return self.reply[0]
+
+
+class BusV2(BusV1):
+
+    BATCH_SIZE = 512
+    FLUSH_CYCLES = 17030  # one Apple II frame
+
+    def __init__(self, sock, batch_size=None, flush_cycles=None):
+        super(BusV2, self).__init__(sock)
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.flush_cycles = self.FLUSH_CYCLES if flush_cycles is None else flush_cycles
+        # the write frame, with room for a read frame behind it
+        self.buffer = bytearray(HEADER.size + self.batch_size * WRITE.size +
+                                HEADER.size + READ.size)
+        self.view = memoryview(self.buffer)
+        self.pending = 0
+        self.offset = HEADER.size
+        self.waited = 0
+        V1_MESSAGE.pack_into(self.message, 0, 0, V1_UPGRADE, 2, 0)
+        self.send(self.message)
+
+    def read(self, cycle, address):
+        offset = self.frame_writes()
+        HEADER.pack_into(self.buffer, offset, READS, 1)
+        READ.pack_into(self.buffer, offset + HEADER.size, cycle & 0xFFFFFFFF, address)
+        self.send(self.view[self.start():offset + HEADER.size + READ.size])
+        self.reset()
+        self.stats.reads += 1
+        return self.receive()
+
+    def write(self, cycle, address, value):
+        WRITE.pack_into(self.buffer, self.offset, cycle & 0xFFFFFFFF, address, value)
+        self.offset += WRITE.size
+        self.pending += 1
+        self.stats.writes += 1
+        if self.pending == self.batch_size:
+            self.flush()
+
+    def tick(self, cycles):
+        # called by the run loop with the cycles it ran, drives the budget
+        self.stats.cycles += cycles
+        if self.pending:
+            self.waited += cycles
+            if self.waited >= self.flush_cycles:
+                self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.send(self.view[:self.frame_writes()])
+            self.reset()
+
+    def frame_writes(self):
+        # header for the pending writes, returns where they end
+        if self.pending:
+            HEADER.pack_into(self.buffer, 0, WRITES, self.pending)
+        return self.offset
+
+    def start(self):
+        return 0 if self.pending else HEADER.size
+
+    def reset(self):
+        self.pending = 0
+        self.offset = HEADER.size
+        self.waited = 0
+
+
+class FrameParser(object):
+    # the device side of both versions: feed() it what arrives and it
+    # returns ('read', cycle, address) and ('write', cycle, address, value)
+    # events; every read is owed a one byte answer, in order
+
+    def __init__(self):
+        self.data = bytearray()
+        self.version = 1
+
+    def feed(self, data):
+        self.data += data
+        events = []
+        offset = 0
+        while True:
+            consumed = (self.parse_v1 if self.version == 1 else self.parse_v2)(offset, events)
+            if not consumed:
+                break
+            offset += consumed
+        del self.data[:offset]
+        return events
+
+    def parse_v1(self, offset, events):
+        if len(self.data) - offset < V1_MESSAGE.size:
+            return 0
+        cycle, op, address, value = V1_MESSAGE.unpack_from(self.data, offset)
+        if op == V1_READ:
+            events.append(('read', cycle, address))
+        elif op == V1_WRITE:
+            events.append(('write', cycle, address, value))
+        elif op == V1_UPGRADE:
+            self.version = address
+        return V1_MESSAGE.size
+
+    def parse_v2(self, offset, events):
+        available = len(self.data) - offset
+        if available < HEADER.size:
+            return 0
+        kind, count = HEADER.unpack_from(self.data, offset)
+        record = WRITE if kind == WRITES else READ
+        size = HEADER.size + count * record.size
+        if available < size:
+            return 0
+        position = offset + HEADER.size
+        for n in range(count):
+            if kind == WRITES:
+                events.append(('write',) + WRITE.unpack_from(self.data, position))
+            else:
+                events.append(('read',) + READ.unpack_from(self.data, position))
+            position += record.size
+        return size
+
+
+# SharedMemoryBus keeps the CPU to device traffic in a single producer,
+# single consumer ring in shared memory and answers reads from a register
+# window the device keeps up to date, so no access makes a syscall. Head
+# and tail each have one writer and sit on their own cache lines:
+#
+#     0  head, records written by the CPU
+#     8  capacity of the ring, in records
+#    64  tail, records taken by the device
+#   128  register window, a byte for every address
+#   ...  ring of RECORD slots
+COUNTER = struct.Struct('<Q')
+RECORD = struct.Struct('<IHBB')  # cycle, address, value, V1_READ or V1_WRITE
+HEAD, CAPACITY, TAIL, REGISTERS = 0, 8, 64, 128
+RING = REGISTERS + 0x10000
+
+
+class SharedMemoryBus(object):
+
+    CAPACITY = 4096
+    TIMEOUT = 5.0  # seconds a full ring waits for the device
+
+    def __init__(self, capacity=None, name=None, timeout=None):
+        self.capacity = capacity or self.CAPACITY
+        self.timeout = self.TIMEOUT if timeout is None else timeout
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=True, size=RING + self.capacity * RECORD.size)
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+        self.registers = self.buf[REGISTERS:RING]
+        COUNTER.pack_into(self.buf, CAPACITY, self.capacity)
+        self.head = 0
+        self.tail = 0  # as last seen, only reread when the ring looks full
+        self.stats = BusStats()
+
+    def read(self, cycle, address):
+        # the value is what the window holds now, the read itself still
+        # goes into the ring for devices with read side effects
+        self.push(cycle, address, 0, V1_READ)
+        self.stats.reads += 1
+        return self.registers[address]
+
+    def write(self, cycle, address, value):
+        self.push(cycle, address, value, V1_WRITE)
+        self.stats.writes += 1
+
+    def push(self, cycle, address, value, op):
+        head = self.head
+        if head - self.tail == self.capacity:
+            self.wait_for_room()
+        RECORD.pack_into(self.buf, RING + (head % self.capacity) * RECORD.size,
+                         cycle & 0xFFFFFFFF, address, value, op)
+        # publish after the record is in place
+        self.head = head + 1
+        COUNTER.pack_into(self.buf, HEAD, head + 1)
+        self.stats.bytes_sent += RECORD.size
+
+    def wait_for_room(self):
+        deadline = time.time() + self.timeout
+        while True:
+            self.tail = COUNTER.unpack_from(self.buf, TAIL)[0]
+            if self.head - self.tail < self.capacity:
+                return
+            if time.time() > deadline:
+                raise BusError('bus device took nothing for {} seconds'.format(self.timeout))
+            time.sleep(0)
+
+    def tick(self, cycles):
+        self.stats.cycles += cycles
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.registers.release()
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+class SharedMemoryDevice(object):
+    # the device end of a SharedMemoryBus, attached by name
+
+    def __init__(self, name):
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.buf = self.shm.buf
+        self.registers = self.buf[REGISTERS:RING]
+        self.capacity = COUNTER.unpack_from(self.buf, CAPACITY)[0]
+        self.tail = COUNTER.unpack_from(self.buf, TAIL)[0]
+
+    def poll(self):
+        # the events written since the last poll, as FrameParser gives them
+        head = COUNTER.unpack_from(self.buf, HEAD)[0]
+        events = []
+        for n in range(self.tail, head):
+            cycle, address, value, op = RECORD.unpack_from(
+                self.buf, RING + (n % self.capacity) * RECORD.size)
+            if op == V1_READ:
+                events.append(('read', cycle, address))
+            else:
+                events.append(('write', cycle, address, value))
+        self.tail = head
+        COUNTER.pack_into(self.buf, TAIL, head)
+        return events
+
+    def set_register(self, address, value):
+        self.registers[address] = value
+
+    def close(self):
+        self.registers.release()
+        self.buf = None
+        self.shm.close()
@@ -0,0 +1,218 @@
+# A stand-in for the peripheral end of the bus, for measuring the bus path
+# without the display app. The server speaks v1 and v2 (see wednesday.bus)
+# to any number of emulator connections, keeps 64K of device registers that
+# writes update and reads answer from, and records how long each chunk of
+# requests takes to serve. The load generator drives it with the real
+# transports from threads, the way emulator instances would.
+#
+#     python -m wednesday.bus_server serve --port 6502
+#     python -m wednesday.bus_server load --port 6502 --clients 8 --protocol 2
+from __future__ import print_function
+import argparse
+import asyncio
+import socket
+import threading
+import time
+
+from wednesday.bus import BusV1, BusV2, FrameParser
+
+
+class LatencyHistogram(object):
+    # power of two buckets in microseconds, bucket n counts [2**(n-1), 2**n)
+
+    BUCKETS = 32
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.total = 0
+        self.count = 0
+
+    def record(self, seconds):
+        microseconds = int(seconds * 1e6)
+        self.counts[min(microseconds.bit_length(), self.BUCKETS - 1)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.count += other.count
+
+    def percentile(self, p):
+        # upper bound of the bucket holding the p-th percentile, in seconds
+        wanted = self.count * p / 100.0
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= wanted:
+                return (1 << bucket) / 1e6
+        return 0.0
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def report(self, name):
+        lines = ['{}: {} samples, mean {:.1f} us, p50 < {:.0f} us, p99 < {:.0f} us'.format(
+            name, self.count, self.mean() * 1e6,
+            self.percentile(50) * 1e6, self.percentile(99) * 1e6)]
+        for bucket, count in enumerate(self.counts):
+            if count:
+                lines.append('  < {:>9} us {:>10}'.format(1 << bucket, count))
+        return '\n'.join(lines)
+
+
+class BusServer(object):
+
+    def __init__(self):
+        self.registers = bytearray(0x10000)
+        self.latency = LatencyHistogram()
+        self.connections = 0
+        self.reads = 0
+        self.writes = 0
+
+    def start(self, host='127.0.0.1', port=6502):
+        return asyncio.start_server(self.serve, host, port)
+
+    async def serve(self, reader, writer):
+        sock = writer.get_extra_info('socket')
+        if sock is not None and sock.family != socket.AF_UNIX:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connections += 1
+        parser = FrameParser()
+        registers = self.registers
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                start = time.perf_counter()
+                replies = bytearray()
+                for event in parser.feed(data):
+                    if event[0] == 'write':
+                        registers[event[2]] = event[3]
+                        self.writes += 1
+                    else:
+                        replies.append(registers[event[2]])
+                        self.reads += 1
+                if replies:
+                    writer.write(bytes(replies))
+                    await writer.drain()
+                self.latency.record(time.perf_counter() - start)
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+
+def run_server(host, port, ready=None, stop=None):
+    # runs a BusServer until stop is set, for tests and the load generator;
+    # ready is called with the server once it listens
+    async def serve():
+        bus_server = BusServer()
+        server = await bus_server.start(host, port)
+        bus_server.port = server.sockets[0].getsockname()[1]
+        if ready is not None:
+            ready(bus_server)
+        while not (stop is not None and stop.is_set()):
+            await asyncio.sleep(0.05)
+        server.close()
+    # connections still open are cancelled on the way out
+    asyncio.run(serve())
+
+
+def start_server_thread(host='127.0.0.1', port=0):
+    # a BusServer on a background thread; set server.stop to shut it down
+    started = threading.Event()
+    stop = threading.Event()
+    holder = []
+
+    def ready(bus_server):
+        holder.append(bus_server)
+        started.set()
+
+    thread = threading.Thread(target=run_server, args=(host, port, ready, stop))
+    thread.daemon = True
+    thread.start()
+    started.wait()
+    bus_server = holder[0]
+    bus_server.stop = stop
+    bus_server.thread = thread
+    return bus_server
+
+
+def load_client(host, port, protocol, seconds, latency):
+    # an emulated frame: redraw the text page, then poll the keyboard
+    sock = socket.create_connection((host, port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    bus = (BusV1 if protocol == 1 else BusV2)(sock)
+    deadline = time.time() + seconds
+    cycle = 0
+    while time.time() < deadline:
+        for address in range(0x0400, 0x0800):
+            bus.write(cycle, address, 0xA0)
+            cycle += 4
+        start = time.perf_counter()
+        bus.read(cycle, 0xC000)
+        latency.record(time.perf_counter() - start)
+        bus.tick(17030)
+    bus.flush()
+    sock.close()
+    return bus.stats
+
+
+def run_load(host, port, clients, protocol, seconds):
+    histograms = [LatencyHistogram() for n in range(clients)]
+    results = [None] * clients
+
+    def client(n):
+        results[n] = load_client(host, port, protocol, seconds, histograms[n])
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    latency = LatencyHistogram()
+    for histogram in histograms:
+        latency.merge(histogram)
+    writes = sum(stats.writes for stats in results)
+    sent = sum(stats.bytes_sent for stats in results)
+    print('protocol v{}, {} clients: {:,.0f} writes/s, {:,.0f} bytes/s, '
+          '{:,.0f} reads/s'.format(protocol, clients, writes / elapsed,
+                                   sent / elapsed, latency.count / elapsed))
+    print(latency.report('read round trip'))
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description='stand-in bus peripheral')
+    parser.add_argument('mode', choices=['serve', 'load'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6502)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--protocol', type=int, choices=[1, 2], default=2)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+    if args.mode == 'load':
+        run_load(args.host, args.port, args.clients, args.protocol, args.seconds)
+        return
+    bus_server = BusServer()
+
+    async def serve():
+        server = await bus_server.start(args.host, args.port)
+        print('serving on {}:{}'.format(args.host, args.port))
+        await server.serve_forever()
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print('{} reads, {} writes'.format(bus_server.reads, bus_server.writes))
+        print(bus_server.latency.report('service time'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+from __future__ import print_function
+
+from wednesday.ines import Cartridge
+from wednesday.nes import NESMemory
+from wednesday.ppu import PPU
+from wednesday.scheduler import Scheduler
+from wednesday.translator import BlockCPU
+
+
+class NES(object):
+    # A cartridge, the memory map, the PPU and a CPU on one scheduler. The
+    # CPU comes out of reset at the vector in the cartridge; run_frame runs
+    # until the PPU next enters vblank.
+
+    def __init__(self, cartridge, cpu_class=BlockCPU, ppu=None):
+        if not isinstance(cartridge, Cartridge):
+            cartridge = Cartridge(cartridge)
+        self.cartridge = cartridge
+        self.ppu = ppu if ppu is not None else PPU()
+        self.memory = NESMemory(ppu=self.ppu)
+        self.mapper = self.memory.load_cartridge(cartridge)
+        self.cpu = cpu_class(None, self.memory)
+        self.memory.cpu = self.cpu
+        self.scheduler = Scheduler().attach(self.cpu)
+        self.ppu.attach(self.cpu, self.scheduler)
+
+    def run_frame(self):
+        frames = self.ppu.frames
+        while self.ppu.frames == frames:
+            self.cpu.run_cycles(1000)
+        return self.ppu.frame
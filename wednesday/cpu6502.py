@@ -6,12 +6,107 @@ from __future__ import print_function
 import json
 import re
 import select
-import socket
-import struct
-import sys
 
 
-bus = None  # socket for bus I/O
+# processor status bits
+CARRY = 0x01
+ZERO = 0x02
+INTERRUPT = 0x04
+DECIMAL = 0x08
+BREAK = 0x10
+UNUSED = 0x20
+OVERFLOW = 0x40
+NEGATIVE = 0x80
+
+# N and Z for a result byte, and N, Z and C for a 9 bit result
+NZ_FLAGS = tuple((value & NEGATIVE) | (ZERO if value == 0 else 0)
+                 for value in range(0x100))
+NZC_FLAGS = NZ_FLAGS + tuple(flags | CARRY for flags in NZ_FLAGS)
+
+
+# ADC and SBC results, indexed by carry << 16 | A << 8 | M. Each entry is the
+# new accumulator with the N, V, Z and C bits of p in the high byte.
+
+def adc_entry(a, m, carry):
+    result = a + m + carry
+    flags = NZC_FLAGS[result]
+    if ~(a ^ m) & (a ^ result) & 0x80:
+        flags |= OVERFLOW
+    return (result & 0xFF) | (flags << 8)
+
+
+def sbc_entry(a, m, carry):
+    # a subtraction is an addition of the complement
+    return adc_entry(a, m ^ 0xFF, carry)
+
+
+def decimal_adc_entry(a, m, carry):
+    # NMOS behaviour: N, V and Z come from the binary sum, C from the
+    # decimal one
+    lo = (a & 0x0F) + (m & 0x0F) + carry
+    half_carry = 1 if lo > 9 else 0
+    hi = (a >> 4) + (m >> 4) + half_carry
+    decimal_carry = 1 if hi > 9 else 0
+    binary = ((hi & 0x0F) << 4) | (lo & 0x0F)
+    result = ((((hi + 6 * decimal_carry) & 0x0F) << 4) |
+              ((lo + 6 * half_carry) & 0x0F))
+    flags = NZ_FLAGS[binary] | decimal_carry
+    if ~(a ^ m) & (a ^ binary) & 0x80:
+        flags |= OVERFLOW
+    return result | (flags << 8)
+
+
+def decimal_sbc_entry(a, m, carry):
+    # the flags are the binary subtraction's, the result is adjusted
+    binary = a + (m ^ 0xFF) + carry
+    lo = (a & 0x0F) + (~m & 0x0F) + carry
+    hi = (a >> 4) + ((~m >> 4) & 0x0F) + (1 if lo > 0x0F else 0)
+    adjust_lo = 0 if lo > 0x0F else 10
+    adjust_hi = 0 if hi > 0x0F else 10 << 4
+    result = ((((binary & 0xFF) + adjust_hi) & 0xF0) |
+              (((binary & 0xFF) + adjust_lo) & 0x0F))
+    return result | (sbc_entry(a, m, carry) & 0xFF00)
+
+
+def build_alu_table(entry):
+    # entries are interned so that the table only holds a few thousand
+    # distinct int objects
+    interned = {}
+    table = []
+    for carry in (0, 1):
+        for a in range(0x100):
+            for m in range(0x100):
+                value = entry(a, m, carry)
+                table.append(interned.setdefault(value, value))
+    return tuple(table)
+
+
+ADC_TABLE = build_alu_table(adc_entry)
+SBC_TABLE = build_alu_table(sbc_entry)
+_decimal_tables = None
+
+
+def decimal_tables():
+    # built on first use, most programs never set D; the pair goes in with
+    # one assignment, threads racing here at worst build it twice
+    global _decimal_tables
+    tables = _decimal_tables
+    if tables is None:
+        tables = _decimal_tables = (build_alu_table(decimal_adc_entry),
+                                    build_alu_table(decimal_sbc_entry))
+    return tables
+
+
+def flag_property(bit):
+    def getter(self):
+        return 1 if self.p & bit else 0
+
+    def setter(self, value):
+        if value:
+            self.p |= bit
+        else:
+            self.p &= ~bit
+    return property(getter, setter)
 
 
 def signed(x):
@@ -20,31 +115,99 @@ def signed(x):
     return x
 
 
+# name: (operand bytes, cycles, operand address expression)
+#
+# {pc} is the address of the operand, {byte} and {word} its value. Every mode
+# adds its cycles before touching the bus, so the cycle stamps seen by memory
+# are the same as calling the *_mode methods one after the other.
+ADDRESSING_MODES = {
+    'implied': (0, 0, None),
+    'immediate': (1, 0, '{pc}'),
+    'zero_page': (1, 1, '{byte}'),
+    'zero_page_x': (1, 2, '({byte} + self.x_index) % 0x100'),
+    'zero_page_y': (1, 2, '({byte} + self.y_index) % 0x100'),
+    'absolute': (2, 2, '{word}'),
+    'absolute_x': (2, 2, '{word} + self.x_index'),
+    'absolute_x_rmw': (2, 3, '{word} + self.x_index'),
+    'absolute_y': (2, 2, '{word} + self.y_index'),
+    'absolute_y_rmw': (2, 3, '{word} + self.y_index'),
+    'indirect': (2, 4, 'self.read_word_bug({word})'),
+    'indirect_x': (1, 4, 'self.read_word_bug(({byte} + self.x_index) % 0x100)'),
+    'indirect_y': (1, 3, 'self.read_word_bug({byte}) + self.y_index'),
+    'indirect_y_rmw': (1, 4, 'self.read_word_bug({byte}) + self.y_index'),
+    'relative': (1, 0, '{pc} + 1 + signed({byte})'),
+}
+
+
+def handler_source(name, instruction, mode, modes=ADDRESSING_MODES):
+    length, cycles, operand = modes[mode]
+    lines = ['def {}(self):'.format(name)]
+    if length:
+        lines.append('    pc = self.program_counter')
+        lines.append('    self.program_counter = pc + {}'.format(length))
+    if cycles:
+        lines.append('    self.cycles += {}'.format(cycles))
+    if operand is None:
+        lines.append('    self.{}()'.format(instruction))
+    else:
+        operand = operand.format(
+            pc='pc', byte='self.read_byte(pc)', word='self.read_word(pc)')
+        lines.append('    self.{}({})'.format(instruction, operand))
+    return '\n'.join(lines)
+
+
+def compile_dispatch(opcodes, modes=ADDRESSING_MODES):
+    # one handler per opcode with the addressing mode folded in, so running
+    # an instruction costs a single call plus the instruction itself
+    names = {}
+    sources = []
+    for opcode, (instruction, mode) in sorted(opcodes.items()):
+        names[opcode] = '{}_{}'.format(instruction, mode)
+        sources.append(handler_source(names[opcode], instruction, mode, modes))
+    namespace = {'signed': signed}
+    code = compile('\n\n'.join(sources), '<6502 dispatch>', 'exec')
+    exec(code, namespace)
+    return tuple(namespace[names[op]] if op in names else None
+                 for op in range(0x100))
+
+
 class ROM(object):
 
     def __init__(self, start, size):
         self.start = start
         self.end = start + size - 1
-        self._mem = [0x00] * size
+        self._mem = bytearray(size)
 
     def load(self, address, data):
-        for offset, datum in enumerate(data):
-            self._mem[address - self.start + offset] = datum
+        data = bytearray(data)
+        offset = address - self.start
+        self._mem[offset:offset + len(data)] = data
 
     def load_file(self, address, filename):
+        offset = address - self.start
         with open(filename, "rb") as f:
-            for offset, datum in enumerate(f.read()):
-                self._mem[address - self.start + offset] = ord(datum)
+            return f.readinto(memoryview(self._mem)[offset:])
 
     def read_byte(self, address):
         assert self.start <= address <= self.end
         return self._mem[address - self.start]
 
+    def view(self):
+        # zero-copy access to the contents, indexed from self.start
+        return memoryview(self._mem).toreadonly()
+
+    def __buffer__(self, flags):
+        # lets memoryview(rom) export the contents directly on Python 3.12+
+        return self.view()
+
 
 class RAM(ROM):
 
     def write_byte(self, address, value):
-        self._mem[address] = value
+        self._mem[address - self.start] = value
+
+    def view(self):
+        return memoryview(self._mem)
 
 
 class MemoryInterface(object):
@@ -76,6 +239,9 @@ class BasicMemory(RAM):
     def __init__(self):
         super(BasicMemory, self).__init__(0x0000, 0xFFFF + 1)
         # self.ram = RAM(0x0000, 0xC000)
+        view = self.view()
+        self.read_pages = [view[page << 8:(page + 1) << 8] for page in range(0x100)]
+        self.write_pages = self.read_pages
 
     def read_word(self, cycle, address):
         return self.read_byte(cycle, address) + (self.read_byte(cycle + 1, address + 1) << 8)
@@ -93,73 +259,258 @@ class BasicMemory(RAM):
     def write_byte(self, cycle, address, value):
         self._mem[address] = value
 
+    def read_has_side_effects(self, address):
+        return False
 
-class Memory(object):
 
-    def __init__(self, options=None, use_bus=True):
-        self.rom = ROM(0xD000, 0x3000)
-        self.ram = RAM(0x0000, 0xC000)
+def open_bus_read(cycle, address):
+    return 0
 
-        if options and options.ram:
-            self.ram.load_file(0x0000, options.ram)
+
+def ignore_write(cycle, address, value):
+    pass
+
+
+class MemoryMap(object):
+    # 256 pages of 256 bytes. A page is either backed by a buffer, in which
+    # case read_pages / write_pages hold a memoryview of just that page and
+    # an access is one index, or handled by a device function:
+    #
+    #   read(cycle, address) -> byte
+    #   write(cycle, address, value)
+    #
+    # Mapping the same buffer at two addresses mirrors it, and mapping
+    # another slice of a buffer over a range switches banks. page_keys names
+    # the memory behind each page, the same for every mirror of it: the
+    # buffer mapped and the page within it, or the page number for devices.
+
+    PAGE_COUNT = 0x100
+
+    def __init__(self):
+        self.read_pages = [None] * self.PAGE_COUNT
+        self.write_pages = [None] * self.PAGE_COUNT
+        self.read_handlers = [open_bus_read] * self.PAGE_COUNT
+        self.write_handlers = [ignore_write] * self.PAGE_COUNT
+        self.page_keys = list(range(self.PAGE_COUNT))
+        # called with the first and end page of every remapped range, for
+        # whoever caches what it read there (translated code)
+        self.remap_listeners = []
+
+    def pages(self, start, size):
+        assert not start & 0xFF and not size & 0xFF, 'ranges must be page aligned'
+        assert start + size <= 0x10000
+        for listener in self.remap_listeners:
+            listener(start >> 8, (start + size) >> 8)
+        return range(start >> 8, (start + size) >> 8)
+
+    def page_views(self, buffer):
+        # a buffer cut into page views, to switch in with switch_pages
+        buffer = memoryview(buffer)
+        return [buffer[offset:offset + 0x100] for offset in range(0, len(buffer), 0x100)]
+
+    def switch_pages(self, start, views):
+        # bank switching: repoint the read pages from start at views made
+        # once per bank by page_views, no slicing on the way
+        first = start >> 8
+        self.read_pages[first:first + len(views)] = views
+        self.page_keys[first:first + len(views)] = [(id(view), 0) for view in views]
+        for listener in self.remap_listeners:
+            listener(first, first + len(views))
+
+    def map_ram(self, start, buffer, size=None):
+        # buffer is a bytearray or writable memoryview, indexed from start
+        key = id(buffer)
+        buffer = memoryview(buffer)
+        if size is None:
+            size = len(buffer)
+        for n, page in enumerate(self.pages(start, size)):
+            view = buffer[n << 8:(n + 1) << 8]
+            self.read_pages[page] = view
+            self.write_pages[page] = view
+            self.page_keys[page] = (key, n)
+
+    def map_rom(self, start, buffer, size=None):
+        # as map_ram, but writes are dropped
+        key = id(buffer)
+        buffer = memoryview(buffer)
+        if size is None:
+            size = len(buffer)
+        for n, page in enumerate(self.pages(start, size)):
+            self.read_pages[page] = buffer[n << 8:(n + 1) << 8]
+            self.write_pages[page] = None
+            self.write_handlers[page] = ignore_write
+            self.page_keys[page] = (key, n)
+
+    def map_device(self, start, size, read=None, write=None):
+        # only the sides given are taken over, so a device can watch the
+        # writes to a RAM page and leave its reads on the fast path
+        for page in self.pages(start, size):
+            if read is not None:
+                self.read_pages[page] = None
+                self.read_handlers[page] = read
+            if write is not None:
+                self.write_pages[page] = None
+                self.write_handlers[page] = write
+            if read is not None and write is not None:
+                self.page_keys[page] = page
+
+    def unmap(self, start, size):
+        for page in self.pages(start, size):
+            self.read_pages[page] = None
+            self.write_pages[page] = None
+            self.read_handlers[page] = open_bus_read
+            self.write_handlers[page] = ignore_write
+            self.page_keys[page] = page
 
     def load(self, address, data):
-        if address < 0xC000:
-            self.ram.load(address, data)
+        for offset, value in enumerate(bytearray(data)):
+            self.write_byte(0, address + offset, value)
 
     def read_byte(self, cycle, address):
-        if address < 0xC000:
-            return self.ram.read_byte(address)
-        elif address < 0xD000:
-            return self.bus_read(cycle, address)
-        else:
-            return self.rom.read_byte(address)
+        page = self.read_pages[address >> 8]
+        if page is not None:
+            return page[address & 0xFF]
+        return self.read_handlers[address >> 8](cycle, address)
 
     def read_word(self, cycle, address):
-        return self.read_byte(cycle, address) + (self.read_byte(cycle + 1, address + 1) << 8)
+        page = self.read_pages[address >> 8]
+        low = address & 0xFF
+        if page is not None and low != 0xFF:
+            return page[low] | (page[low + 1] << 8)
+        return self.read_byte(cycle, address) + (self.read_byte(cycle + 1, (address + 1) & 0xFFFF) << 8)
 
     def read_word_bug(self, cycle, address):
-        if address % 0x100 == 0xFF:
+        if address & 0xFF == 0xFF:
             return self.read_byte(cycle, address) + (self.read_byte(cycle + 1, address & 0xFF00) << 8)
         else:
             return self.read_word(cycle, address)
 
     def write_byte(self, cycle, address, value):
+        page = self.write_pages[address >> 8]
+        if page is not None:
+            page[address & 0xFF] = value
+        else:
+            self.write_handlers[address >> 8](cycle, address, value)
+
+    def read_has_side_effects(self, address):
+        # whether reading address changes the device behind it, polling
+        # loops that read nothing like that can be fast forwarded; a device
+        # could do anything unless a subclass knows better
+        return self.read_pages[address >> 8] is None
+
+
+class Memory(MemoryMap):
+
+    def __init__(self, options=None, use_bus=True, bus=None):
+        super(Memory, self).__init__()
+        self.rom = ROM(0xD000, 0x3000)
+        self.ram = RAM(0x0000, 0xC000)
+        # a transport from wednesday.bus; errors on it raise BusError
+        self.bus = bus
+        self.use_bus = use_bus and bus is not None
+
+        if options and options.ram:
+            self.ram.load_file(0x0000, options.ram)
+
+        self.map_ram(0x0000, self.ram.view())
+        self.map_device(0xC000, 0x1000, read=self.bus_read)
+        self.map_rom(0xD000, self.rom.view())
+        if self.use_bus:
+            # the text page and hi-res pages are mirrored out to the bus
+            self.map_device(0x0400, 0x0400, write=self.display_write)
+            self.map_device(0x2000, 0x4000, write=self.display_write)
+
+    def load(self, address, data):
         if address < 0xC000:
-            self.ram.write_byte(address, value)
-        if 0x400 <= address < 0x800 or 0x2000 <= address < 0x5FFF:
-            self.bus_write(cycle, address, value)
+            self.ram.load(address, data)
+
+    def display_write(self, cycle, address, value):
+        self.ram.write_byte(address, value)
+        self.bus_write(cycle, address, value)
 
     def bus_read(self, cycle, address):
         if not self.use_bus:
             return 0
-        op = struct.pack("<IBHB", cycle, 0, address, 0)
-        try:
-            bus.send(op)
-            b = bus.recv(1)
-            if len(b) == 0:
-                sys.exit(0)
-            return ord(b)
-        except socket.error:
-            sys.exit(0)
+        return self.bus.read(cycle, address)
 
     def bus_write(self, cycle, address, value):
-        if not self.use_bus:
-            return
-        op = struct.pack("<IBHB", cycle, 1, address, value)
-        try:
-            bus.send(op)
-        except IOError:
-            sys.exit(0)
+        if self.use_bus:
+            self.bus.write(cycle, address, value)
+
+    def tick(self, cycles):
+        # tell the bus how far the CPU has run, a batching bus flushes on it
+        if self.use_bus:
+            self.bus.tick(cycles)
+
+    def read_has_side_effects(self, address):
+        # of the I/O page only the keyboard and the buttons and paddles read
+        # back without changing anything; $C010 clears the strobe, the
+        # speaker toggles, the soft switches flip and slot I/O is anyone's
+        if 0xC000 <= address < 0xD000:
+            return address & 0xFFF0 not in (0xC000, 0xC060)
+        return super(Memory, self).read_has_side_effects(address)
+
+
+NO_BREAKPOINTS = frozenset()
+NO_PAGES = (None,) * 0x100
+NEVER = (1 << 63) - 1
 
 
 class CPU(object):
 
+    # the register file lives in slots, everything shared between instances
+    # (opcode table, dispatch, ALU tables) lives on the class or the module
+    __slots__ = (
+        'bus',
+        'accumulator', 'x_index', 'y_index', 'stack_pointer',
+        'program_counter', 'p',
+        'read_pages', 'write_pages',
+        'adc_table', 'sbc_table',
+        'cycles', 'next_event_cycle', 'batch_end', 'scheduler', 'bus_tick',
+        'nmi_pending', 'irq_sources', 'breakpoints',
+    )
+
     STACK_PAGE = 0x100
+    NMI_VECTOR = 0xFFFA
     RESET_VECTOR = 0xFFFC
+    IRQ_VECTOR = 0xFFFE
+
+    ADDRESSING_MODES = ADDRESSING_MODES
+
+    carry_flag = flag_property(CARRY)
+    zero_flag = flag_property(ZERO)
+    interrupt_disable_flag = flag_property(INTERRUPT)
+
+    @property
+    def decimal_mode_flag(self):
+        return 1 if self.p & DECIMAL else 0
+
+    @decimal_mode_flag.setter
+    def decimal_mode_flag(self, value):
+        if value:
+            self.p |= DECIMAL
+        else:
+            self.p &= ~DECIMAL
+        self.select_alu_tables()
+
+    # cycles is the master clock, it counts up from 0 and is never reset;
+    # bus accesses are stamped with it
+    total_cycles = property(
+        lambda self: self.cycles,
+        lambda self, value: setattr(self, 'cycles', value))
+
+    break_flag = flag_property(BREAK)
+    overflow_flag = flag_property(OVERFLOW)
+    sign_flag = flag_property(NEGATIVE)
 
     def __init__(self, options, bus):
         self.bus = bus
+        # pages the bus maps straight to a buffer (see MemoryMap) are read
+        # and written here, everything else goes to the bus
+        self.read_pages = getattr(bus, 'read_pages', NO_PAGES)
+        self.write_pages = getattr(bus, 'write_pages', NO_PAGES)
+        # buses that batch writes count the cycles run to know when to flush
+        self.bus_tick = getattr(bus, 'tick', None)
 
         # Registers
         self.accumulator = 0x00
@@ -169,207 +520,334 @@ class CPU(object):
         self.program_counter = 0xFF
 
         # Flags
-        self.carry_flag = 0
-        self.zero_flag = 0
-        self.interrupt_disable_flag = 0
-        self.decimal_mode_flag = 0
-        self.break_flag = 1
-        self.overflow_flag = 0
-        self.sign_flag = 0
+        self.p = BREAK | UNUSED
+        self.adc_table = ADC_TABLE
+        self.sbc_table = SBC_TABLE
 
         self.cycles = 0
-        self.setup_ops()
+        # the run loops stop at this cycle for service_events, see
+        # update_next_event
+        self.next_event_cycle = NEVER
+        self.batch_end = NEVER
+        self.scheduler = None  # a wednesday.scheduler.Scheduler attaches itself
+        self.nmi_pending = False
+        self.irq_sources = set()
+        self.breakpoints = NO_BREAKPOINTS  # assign a set to add some
         self.reset()
 
-    def setup_ops(self):
-        self.ops = [None] * 0x100
-        self.ops[0x00] = lambda: self.BRK()
-        self.ops[0x01] = lambda: self.ORA(self.indirect_x_mode())
-        self.ops[0x05] = lambda: self.ORA(self.zero_page_mode())
-        self.ops[0x06] = lambda: self.ASL(self.zero_page_mode())
-        self.ops[0x08] = lambda: self.PHP()
-        self.ops[0x09] = lambda: self.ORA(self.immediate_mode())
-        self.ops[0x0A] = lambda: self.ASL()
-        self.ops[0x0D] = lambda: self.ORA(self.absolute_mode())
-        self.ops[0x0E] = lambda: self.ASL(self.absolute_mode())
-        self.ops[0x10] = lambda: self.BPL(self.relative_mode())
-        self.ops[0x11] = lambda: self.ORA(self.indirect_y_mode())
-        self.ops[0x15] = lambda: self.ORA(self.zero_page_x_mode())
-        self.ops[0x16] = lambda: self.ASL(self.zero_page_x_mode())
-        self.ops[0x18] = lambda: self.CLC()
-        self.ops[0x19] = lambda: self.ORA(self.absolute_y_mode())
-        self.ops[0x1D] = lambda: self.ORA(self.absolute_x_mode())
-        self.ops[0x1E] = lambda: self.ASL(self.absolute_x_mode(rmw=True))
-        self.ops[0x20] = lambda: self.JSR(self.absolute_mode())
-        self.ops[0x21] = lambda: self.AND(self.indirect_x_mode())
-        self.ops[0x24] = lambda: self.BIT(self.zero_page_mode())
-        self.ops[0x25] = lambda: self.AND(self.zero_page_mode())
-        self.ops[0x26] = lambda: self.ROL(self.zero_page_mode())
-        self.ops[0x28] = lambda: self.PLP()
-        self.ops[0x29] = lambda: self.AND(self.immediate_mode())
-        self.ops[0x2A] = lambda: self.ROL()
-        self.ops[0x2C] = lambda: self.BIT(self.absolute_mode())
-        self.ops[0x2D] = lambda: self.AND(self.absolute_mode())
-        self.ops[0x2E] = lambda: self.ROL(self.absolute_mode())
-        self.ops[0x30] = lambda: self.BMI(self.relative_mode())
-        self.ops[0x31] = lambda: self.AND(self.indirect_y_mode())
-        self.ops[0x35] = lambda: self.AND(self.zero_page_x_mode())
-        self.ops[0x36] = lambda: self.ROL(self.zero_page_x_mode())
-        self.ops[0x38] = lambda: self.SEC()
-        self.ops[0x39] = lambda: self.AND(self.absolute_y_mode())
-        self.ops[0x3D] = lambda: self.AND(self.absolute_x_mode())
-        self.ops[0x3E] = lambda: self.ROL(self.absolute_x_mode(rmw=True))
-        self.ops[0x40] = lambda: self.RTI()
-        self.ops[0x41] = lambda: self.EOR(self.indirect_x_mode())
-        self.ops[0x45] = lambda: self.EOR(self.zero_page_mode())
-        self.ops[0x46] = lambda: self.LSR(self.zero_page_mode())
-        self.ops[0x48] = lambda: self.PHA()
-        self.ops[0x49] = lambda: self.EOR(self.immediate_mode())
-        self.ops[0x4A] = lambda: self.LSR()
-        self.ops[0x4C] = lambda: self.JMP(self.absolute_mode())
-        self.ops[0x4D] = lambda: self.EOR(self.absolute_mode())
-        self.ops[0x4E] = lambda: self.LSR(self.absolute_mode())
-        self.ops[0x50] = lambda: self.BVC(self.relative_mode())
-        self.ops[0x51] = lambda: self.EOR(self.indirect_y_mode())
-        self.ops[0x55] = lambda: self.EOR(self.zero_page_x_mode())
-        self.ops[0x56] = lambda: self.LSR(self.zero_page_x_mode())
-        self.ops[0x58] = lambda: self.CLI()
-        self.ops[0x59] = lambda: self.EOR(self.absolute_y_mode())
-        self.ops[0x5D] = lambda: self.EOR(self.absolute_x_mode())
-        self.ops[0x5E] = lambda: self.LSR(self.absolute_x_mode(rmw=True))
-        self.ops[0x60] = lambda: self.RTS()
-        self.ops[0x61] = lambda: self.ADC(self.indirect_x_mode())
-        self.ops[0x65] = lambda: self.ADC(self.zero_page_mode())
-        self.ops[0x66] = lambda: self.ROR(self.zero_page_mode())
-        self.ops[0x68] = lambda: self.PLA()
-        self.ops[0x69] = lambda: self.ADC(self.immediate_mode())
-        self.ops[0x6A] = lambda: self.ROR()
-        self.ops[0x6C] = lambda: self.JMP(self.indirect_mode())
-        self.ops[0x6D] = lambda: self.ADC(self.absolute_mode())
-        self.ops[0x6E] = lambda: self.ROR(self.absolute_mode())
-        self.ops[0x70] = lambda: self.BVS(self.relative_mode())
-        self.ops[0x71] = lambda: self.ADC(self.indirect_y_mode())
-        self.ops[0x75] = lambda: self.ADC(self.zero_page_x_mode())
-        self.ops[0x76] = lambda: self.ROR(self.zero_page_x_mode())
-        self.ops[0x78] = lambda: self.SEI()
-        self.ops[0x79] = lambda: self.ADC(self.absolute_y_mode())
-        self.ops[0x7D] = lambda: self.ADC(self.absolute_x_mode())
-        self.ops[0x7E] = lambda: self.ROR(self.absolute_x_mode(rmw=True))
-        self.ops[0x81] = lambda: self.STA(self.indirect_x_mode())
-        self.ops[0x84] = lambda: self.STY(self.zero_page_mode())
-        self.ops[0x85] = lambda: self.STA(self.zero_page_mode())
-        self.ops[0x86] = lambda: self.STX(self.zero_page_mode())
-        self.ops[0x88] = lambda: self.DEY()
-        self.ops[0x8A] = lambda: self.TXA()
-        self.ops[0x8C] = lambda: self.STY(self.absolute_mode())
-        self.ops[0x8D] = lambda: self.STA(self.absolute_mode())
-        self.ops[0x8E] = lambda: self.STX(self.absolute_mode())
-        self.ops[0x90] = lambda: self.BCC(self.relative_mode())
-        self.ops[0x91] = lambda: self.STA(self.indirect_y_mode(rmw=True))
-        self.ops[0x94] = lambda: self.STY(self.zero_page_x_mode())
-        self.ops[0x95] = lambda: self.STA(self.zero_page_x_mode())
-        self.ops[0x96] = lambda: self.STX(self.zero_page_y_mode())
-        self.ops[0x98] = lambda: self.TYA()
-        self.ops[0x99] = lambda: self.STA(self.absolute_y_mode(rmw=True))
-        self.ops[0x9A] = lambda: self.TXS()
-        self.ops[0x9D] = lambda: self.STA(self.absolute_x_mode(rmw=True))
-        self.ops[0xA0] = lambda: self.LDY(self.immediate_mode())
-        self.ops[0xA1] = lambda: self.LDA(self.indirect_x_mode())
-        self.ops[0xA2] = lambda: self.LDX(self.immediate_mode())
-        self.ops[0xA4] = lambda: self.LDY(self.zero_page_mode())
-        self.ops[0xA5] = lambda: self.LDA(self.zero_page_mode())
-        self.ops[0xA6] = lambda: self.LDX(self.zero_page_mode())
-        self.ops[0xA8] = lambda: self.TAY()
-        self.ops[0xA9] = lambda: self.LDA(self.immediate_mode())
-        self.ops[0xAA] = lambda: self.TAX()
-        self.ops[0xAC] = lambda: self.LDY(self.absolute_mode())
-        self.ops[0xAD] = lambda: self.LDA(self.absolute_mode())
-        self.ops[0xAE] = lambda: self.LDX(self.absolute_mode())
-        self.ops[0xB0] = lambda: self.BCS(self.relative_mode())
-        self.ops[0xB1] = lambda: self.LDA(self.indirect_y_mode())
-        self.ops[0xB4] = lambda: self.LDY(self.zero_page_x_mode())
-        self.ops[0xB5] = lambda: self.LDA(self.zero_page_x_mode())
-        self.ops[0xB6] = lambda: self.LDX(self.zero_page_y_mode())
-        self.ops[0xB8] = lambda: self.CLV()
-        self.ops[0xB9] = lambda: self.LDA(self.absolute_y_mode())
-        self.ops[0xBA] = lambda: self.TSX()
-        self.ops[0xBC] = lambda: self.LDY(self.absolute_x_mode())
-        self.ops[0xBD] = lambda: self.LDA(self.absolute_x_mode())
-        self.ops[0xBE] = lambda: self.LDX(self.absolute_y_mode())
-        self.ops[0xC0] = lambda: self.CPY(self.immediate_mode())
-        self.ops[0xC1] = lambda: self.CMP(self.indirect_x_mode())
-        self.ops[0xC4] = lambda: self.CPY(self.zero_page_mode())
-        self.ops[0xC5] = lambda: self.CMP(self.zero_page_mode())
-        self.ops[0xC6] = lambda: self.DEC(self.zero_page_mode())
-        self.ops[0xC8] = lambda: self.INY()
-        self.ops[0xC9] = lambda: self.CMP(self.immediate_mode())
-        self.ops[0xCA] = lambda: self.DEX()
-        self.ops[0xCC] = lambda: self.CPY(self.absolute_mode())
-        self.ops[0xCD] = lambda: self.CMP(self.absolute_mode())
-        self.ops[0xCE] = lambda: self.DEC(self.absolute_mode())
-        self.ops[0xD0] = lambda: self.BNE(self.relative_mode())
-        self.ops[0xD1] = lambda: self.CMP(self.indirect_y_mode())
-        self.ops[0xD5] = lambda: self.CMP(self.zero_page_x_mode())
-        self.ops[0xD6] = lambda: self.DEC(self.zero_page_x_mode())
-        self.ops[0xD8] = lambda: self.CLD()
-        self.ops[0xD9] = lambda: self.CMP(self.absolute_y_mode())
-        self.ops[0xDD] = lambda: self.CMP(self.absolute_x_mode())
-        self.ops[0xDE] = lambda: self.DEC(self.absolute_x_mode(rmw=True))
-        self.ops[0xE0] = lambda: self.CPX(self.immediate_mode())
-        self.ops[0xE1] = lambda: self.SBC(self.indirect_x_mode())
-        self.ops[0xE4] = lambda: self.CPX(self.zero_page_mode())
-        self.ops[0xE5] = lambda: self.SBC(self.zero_page_mode())
-        self.ops[0xE6] = lambda: self.INC(self.zero_page_mode())
-        self.ops[0xE8] = lambda: self.INX()
-        self.ops[0xE9] = lambda: self.SBC(self.immediate_mode())
-        self.ops[0xEA] = lambda: self.NOP()
-        self.ops[0xEC] = lambda: self.CPX(self.absolute_mode())
-        self.ops[0xED] = lambda: self.SBC(self.absolute_mode())
-        self.ops[0xEE] = lambda: self.INC(self.absolute_mode())
-        self.ops[0xF0] = lambda: self.BEQ(self.relative_mode())
-        self.ops[0xF1] = lambda: self.SBC(self.indirect_y_mode())
-        self.ops[0xF5] = lambda: self.SBC(self.zero_page_x_mode())
-        self.ops[0xF6] = lambda: self.INC(self.zero_page_x_mode())
-        self.ops[0xF8] = lambda: self.SED()
-        self.ops[0xF9] = lambda: self.SBC(self.absolute_y_mode())
-        self.ops[0xFD] = lambda: self.SBC(self.absolute_x_mode())
-        self.ops[0xFE] = lambda: self.INC(self.absolute_x_mode(rmw=True))
+    OPCODES = {
+        0x00: ('BRK', 'implied'),
+        0x01: ('ORA', 'indirect_x'),
+        0x05: ('ORA', 'zero_page'),
+        0x06: ('ASL', 'zero_page'),
+        0x08: ('PHP', 'implied'),
+        0x09: ('ORA', 'immediate'),
+        0x0A: ('ASL', 'implied'),
+        0x0D: ('ORA', 'absolute'),
+        0x0E: ('ASL', 'absolute'),
+        0x10: ('BPL', 'relative'),
+        0x11: ('ORA', 'indirect_y'),
+        0x15: ('ORA', 'zero_page_x'),
+        0x16: ('ASL', 'zero_page_x'),
+        0x18: ('CLC', 'implied'),
+        0x19: ('ORA', 'absolute_y'),
+        0x1D: ('ORA', 'absolute_x'),
+        0x1E: ('ASL', 'absolute_x_rmw'),
+        0x20: ('JSR', 'absolute'),
+        0x21: ('AND', 'indirect_x'),
+        0x24: ('BIT', 'zero_page'),
+        0x25: ('AND', 'zero_page'),
+        0x26: ('ROL', 'zero_page'),
+        0x28: ('PLP', 'implied'),
+        0x29: ('AND', 'immediate'),
+        0x2A: ('ROL', 'implied'),
+        0x2C: ('BIT', 'absolute'),
+        0x2D: ('AND', 'absolute'),
+        0x2E: ('ROL', 'absolute'),
+        0x30: ('BMI', 'relative'),
+        0x31: ('AND', 'indirect_y'),
+        0x35: ('AND', 'zero_page_x'),
+        0x36: ('ROL', 'zero_page_x'),
+        0x38: ('SEC', 'implied'),
+        0x39: ('AND', 'absolute_y'),
+        0x3D: ('AND', 'absolute_x'),
+        0x3E: ('ROL', 'absolute_x_rmw'),
+        0x40: ('RTI', 'implied'),
+        0x41: ('EOR', 'indirect_x'),
+        0x45: ('EOR', 'zero_page'),
+        0x46: ('LSR', 'zero_page'),
+        0x48: ('PHA', 'implied'),
+        0x49: ('EOR', 'immediate'),
+        0x4A: ('LSR', 'implied'),
+        0x4C: ('JMP', 'absolute'),
+        0x4D: ('EOR', 'absolute'),
+        0x4E: ('LSR', 'absolute'),
+        0x50: ('BVC', 'relative'),
+        0x51: ('EOR', 'indirect_y'),
+        0x55: ('EOR', 'zero_page_x'),
+        0x56: ('LSR', 'zero_page_x'),
+        0x58: ('CLI', 'implied'),
+        0x59: ('EOR', 'absolute_y'),
+        0x5D: ('EOR', 'absolute_x'),
+        0x5E: ('LSR', 'absolute_x_rmw'),
+        0x60: ('RTS', 'implied'),
+        0x61: ('ADC', 'indirect_x'),
+        0x65: ('ADC', 'zero_page'),
+        0x66: ('ROR', 'zero_page'),
+        0x68: ('PLA', 'implied'),
+        0x69: ('ADC', 'immediate'),
+        0x6A: ('ROR', 'implied'),
+        0x6C: ('JMP', 'indirect'),
+        0x6D: ('ADC', 'absolute'),
+        0x6E: ('ROR', 'absolute'),
+        0x70: ('BVS', 'relative'),
+        0x71: ('ADC', 'indirect_y'),
+        0x75: ('ADC', 'zero_page_x'),
+        0x76: ('ROR', 'zero_page_x'),
+        0x78: ('SEI', 'implied'),
+        0x79: ('ADC', 'absolute_y'),
+        0x7D: ('ADC', 'absolute_x'),
+        0x7E: ('ROR', 'absolute_x_rmw'),
+        0x81: ('STA', 'indirect_x'),
+        0x84: ('STY', 'zero_page'),
+        0x85: ('STA', 'zero_page'),
+        0x86: ('STX', 'zero_page'),
+        0x88: ('DEY', 'implied'),
+        0x8A: ('TXA', 'implied'),
+        0x8C: ('STY', 'absolute'),
+        0x8D: ('STA', 'absolute'),
+        0x8E: ('STX', 'absolute'),
+        0x90: ('BCC', 'relative'),
+        0x91: ('STA', 'indirect_y_rmw'),
+        0x94: ('STY', 'zero_page_x'),
+        0x95: ('STA', 'zero_page_x'),
+        0x96: ('STX', 'zero_page_y'),
+        0x98: ('TYA', 'implied'),
+        0x99: ('STA', 'absolute_y_rmw'),
+        0x9A: ('TXS', 'implied'),
+        0x9D: ('STA', 'absolute_x_rmw'),
+        0xA0: ('LDY', 'immediate'),
+        0xA1: ('LDA', 'indirect_x'),
+        0xA2: ('LDX', 'immediate'),
+        0xA4: ('LDY', 'zero_page'),
+        0xA5: ('LDA', 'zero_page'),
+        0xA6: ('LDX', 'zero_page'),
+        0xA8: ('TAY', 'implied'),
+        0xA9: ('LDA', 'immediate'),
+        0xAA: ('TAX', 'implied'),
+        0xAC: ('LDY', 'absolute'),
+        0xAD: ('LDA', 'absolute'),
+        0xAE: ('LDX', 'absolute'),
+        0xB0: ('BCS', 'relative'),
+        0xB1: ('LDA', 'indirect_y'),
+        0xB4: ('LDY', 'zero_page_x'),
+        0xB5: ('LDA', 'zero_page_x'),
+        0xB6: ('LDX', 'zero_page_y'),
+        0xB8: ('CLV', 'implied'),
+        0xB9: ('LDA', 'absolute_y'),
+        0xBA: ('TSX', 'implied'),
+        0xBC: ('LDY', 'absolute_x'),
+        0xBD: ('LDA', 'absolute_x'),
+        0xBE: ('LDX', 'absolute_y'),
+        0xC0: ('CPY', 'immediate'),
+        0xC1: ('CMP', 'indirect_x'),
+        0xC4: ('CPY', 'zero_page'),
+        0xC5: ('CMP', 'zero_page'),
+        0xC6: ('DEC', 'zero_page'),
+        0xC8: ('INY', 'implied'),
+        0xC9: ('CMP', 'immediate'),
+        0xCA: ('DEX', 'implied'),
+        0xCC: ('CPY', 'absolute'),
+        0xCD: ('CMP', 'absolute'),
+        0xCE: ('DEC', 'absolute'),
+        0xD0: ('BNE', 'relative'),
+        0xD1: ('CMP', 'indirect_y'),
+        0xD5: ('CMP', 'zero_page_x'),
+        0xD6: ('DEC', 'zero_page_x'),
+        0xD8: ('CLD', 'implied'),
+        0xD9: ('CMP', 'absolute_y'),
+        0xDD: ('CMP', 'absolute_x'),
+        0xDE: ('DEC', 'absolute_x_rmw'),
+        0xE0: ('CPX', 'immediate'),
+        0xE1: ('SBC', 'indirect_x'),
+        0xE4: ('CPX', 'zero_page'),
+        0xE5: ('SBC', 'zero_page'),
+        0xE6: ('INC', 'zero_page'),
+        0xE8: ('INX', 'implied'),
+        0xE9: ('SBC', 'immediate'),
+        0xEA: ('NOP', 'implied'),
+        0xEC: ('CPX', 'absolute'),
+        0xED: ('SBC', 'absolute'),
+        0xEE: ('INC', 'absolute'),
+        0xF0: ('BEQ', 'relative'),
+        0xF1: ('SBC', 'indirect_y'),
+        0xF5: ('SBC', 'zero_page_x'),
+        0xF6: ('INC', 'zero_page_x'),
+        0xF8: ('SED', 'implied'),
+        0xF9: ('SBC', 'absolute_y'),
+        0xFD: ('SBC', 'absolute_x'),
+        0xFE: ('INC', 'absolute_x_rmw'),
+    }
+
+    @classmethod
+    def dispatch_table(cls):
+        # handlers are compiled once per class and shared by every instance
+        table = cls.__dict__.get('_dispatch')
+        if table is None:
+            table = compile_dispatch(cls.OPCODES, cls.ADDRESSING_MODES)
+            cls._dispatch = table
+        return table
 
     def reset(self):
         self.program_counter = self.read_word(self.RESET_VECTOR)
 
     def run(self):
-        count = 1000
+        dispatch = self.dispatch_table()
         while True:
-            self.cycles = 2  # all instructions take this as a minimum
-            op = self.read_pc_byte()
-            func = self.ops[op]
-            if func is None:
-                print("UNKNOWN OP")
-                print(hex(self.program_counter - 1))
-                print(hex(op))
+            start = self.cycles
+            if start >= self.next_event_cycle:
+                self.service_events()
+            pc = self.program_counter
+            self.cycles += 2  # all instructions take this as a minimum
+            self.program_counter = pc + 1
+            op = self.read_byte(pc)
+            handler = dispatch[op]
+            if handler is None:
+                self.unknown_op(pc, op)
                 break
-            else:
-                self.ops[op]()
-            count -= 1
-            yield self.cycles, None
+            handler(self)
+            yield self.cycles_run(start), None
 
     def test_run(self, start, end):
+        dispatch = self.dispatch_table()
         self.program_counter = start
         while True:
             self.cycles += 2  # all instructions take this as a minimum
             if self.program_counter == end:
                 break
             op = self.read_pc_byte()
-            func = self.ops[op]
-            if func is None:
-                print("UNKNOWN OP")
-                print(hex(self.program_counter - 1))
-                print(hex(op))
+            handler = dispatch[op]
+            if handler is None:
+                self.unknown_op(self.program_counter - 1, op)
                 break
-            else:
-                self.ops[op]()
+            handler(self)
+
+    def unknown_op(self, pc, op):
+        print("UNKNOWN OP")
+        print(hex(pc))
+        print(hex(op))
+
+    # BATCH EXECUTION
+    #
+    # Each call returns the number of cycles run. The inner loop only comes
+    # back to the caller at the budget, at one of self.breakpoints or at an
+    # unknown opcode, which is left at the program counter. The budget is
+    # folded into next_event_cycle for the length of the batch, so the loop
+    # has a single cycle to compare against.
+
+    def run_cycles(self, cycles):
+        return self.run_batch(self.total_cycles + cycles, -1, self.breakpoints)
+
+    def run_instructions(self, count):
+        return self.run_batch(float('inf'), count, self.breakpoints)
+
+    def run_until(self, pc, max_cycles):
+        return self.run_batch(self.total_cycles + max_cycles, -1,
+                              self.breakpoints | set([pc]))
+
+    def run_batch(self, end_cycle, count, stops):
+        dispatch = self.dispatch_table()
+        read_byte = self.read_byte
+        start = cycles = self.cycles
+        self.start_batch(end_cycle)
+        try:
+            while count:
+                cycles = self.cycles
+                if cycles >= self.next_event_cycle:
+                    if cycles >= end_cycle:
+                        break
+                    self.service_events()
+                    continue
+                pc = self.program_counter
+                if pc in stops:
+                    break
+                self.cycles = cycles + 2  # all instructions take this as a minimum
+                self.program_counter = pc + 1
+                op = read_byte(pc)
+                handler = dispatch[op]
+                if handler is None:
+                    self.program_counter = pc
+                    self.cycles = cycles
+                    self.unknown_op(pc, op)
+                    break
+                handler(self)
+                count -= 1
+        finally:
+            self.end_batch()
+        return self.cycles_run(start)
+
+    def cycles_run(self, start):
+        # the cycles since start, told to the bus
+        cycles = self.cycles - start
+        if self.bus_tick is not None:
+            self.bus_tick(cycles)
+        return cycles
+
+    def start_batch(self, end_cycle):
+        self.batch_end = end_cycle
+        self.update_next_event()
+
+    def end_batch(self):
+        self.batch_end = NEVER
+        self.update_next_event()
+
+    # INTERRUPTS AND EVENTS
+    #
+    # Devices call nmi() on the edge and set_irq(source) while they hold
+    # IRQ low. Both, and events coming due on the scheduler, lower
+    # next_event_cycle, and the run loop calls service_events before the
+    # next instruction (the next block for BlockCPU). An IRQ waits while I
+    # is set; CLI, PLP and RTI look again.
+
+    def update_next_event(self):
+        cycle = self.batch_end
+        if self.scheduler is not None and self.scheduler.next_cycle < cycle:
+            cycle = self.scheduler.next_cycle
+        if self.nmi_pending or (self.irq_sources and not self.p & INTERRUPT):
+            cycle = min(cycle, self.cycles)
+        self.next_event_cycle = cycle
+
+    def service_events(self):
+        if self.scheduler is not None:
+            self.scheduler.run_due(self.cycles)
+        if self.nmi_pending:
+            self.nmi_pending = False
+            self.interrupt(self.NMI_VECTOR)
+        elif self.irq_sources and not self.p & INTERRUPT:
+            self.interrupt(self.IRQ_VECTOR)
+        self.update_next_event()
+
+    def nmi(self):
+        self.nmi_pending = True
+        self.next_event_cycle = self.cycles
+
+    def set_irq(self, source, asserted=True):
+        if asserted:
+            self.irq_sources.add(source)
+            self.poll_irq()
+        else:
+            self.irq_sources.discard(source)
 
+    def poll_irq(self):
+        if self.irq_sources and not self.p & INTERRUPT:
+            self.next_event_cycle = self.cycles
+
+    def interrupt(self, vector):
+        self.cycles += 7
+        self.push_word(self.program_counter)
+        self.push_byte((self.status_as_byte() & ~BREAK) | UNUSED)
+        self.p |= INTERRUPT
+        self.program_counter = self.read_word(vector)
 
     def get_pc(self, inc=1):
         pc = self.program_counter
@@ -377,12 +855,24 @@ class CPU(object):
         return pc
 
     def read_byte(self, address):
+        page = self.read_pages[address >> 8]
+        if page is not None:
+            return page[address & 0xFF]
         return self.bus.read_byte(self.cycles, address)
 
     def read_word(self, address):
+        page = self.read_pages[address >> 8]
+        low = address & 0xFF
+        if page is not None and low != 0xFF:
+            return page[low] | (page[low + 1] << 8)
         return self.bus.read_word(self.cycles, address)
 
     def read_word_bug(self, address):
+        # the high byte never leaves the page, so one page covers both
+        page = self.read_pages[address >> 8]
+        if page is not None:
+            low = address & 0xFF
+            return page[low] | (page[(low + 1) & 0xFF] << 8)
         return self.bus.read_word_bug(self.cycles, address)
 
     def read_pc_byte(self):
@@ -392,47 +882,52 @@ class CPU(object):
         return self.read_word(self.get_pc(2))
 
     def write_byte(self, address, value):
-        self.bus.write_byte(self.cycles, address, value)
+        page = self.write_pages[address >> 8]
+        if page is not None:
+            page[address & 0xFF] = value
+        else:
+            self.bus.write_byte(self.cycles, address, value)
 
 
     def status_from_byte(self, status):
-        self.carry_flag = [0, 1][0 != status & 1]
-        self.zero_flag = [0, 1][0 != status & 2]
-        self.interrupt_disable_flag = [0, 1][0 != status & 4]
-        self.decimal_mode_flag = [0, 1][0 != status & 8]
-        self.break_flag = [0, 1][0 != status & 16]
-        self.overflow_flag = [0, 1][0 != status & 64]
-        self.sign_flag = [0, 1][0 != status & 128]
+        self.p = status | UNUSED
+        self.select_alu_tables()
+
+    def select_alu_tables(self):
+        # called whenever D may change, so ADC and SBC never test it
+        if self.p & DECIMAL:
+            self.adc_table, self.sbc_table = decimal_tables()
+        else:
+            self.adc_table, self.sbc_table = ADC_TABLE, SBC_TABLE
 
     def status_as_byte(self):
-        return (self.carry_flag |
-                self.zero_flag << 1 |
-                self.interrupt_disable_flag << 2 |
-                self.decimal_mode_flag << 3 |
-                self.break_flag << 4 |
-                1 << 5 |
-                self.overflow_flag << 6 |
-                self.sign_flag << 7)
+        return self.p
 
     ####
 
     def push_byte(self, byte):
-        self.write_byte(self.STACK_PAGE + self.stack_pointer, byte)
+        page = self.write_pages[self.STACK_PAGE >> 8]
+        if page is not None:
+            page[self.stack_pointer] = byte
+        else:
+            self.write_byte(self.STACK_PAGE + self.stack_pointer, byte)
         self.stack_pointer = (self.stack_pointer - 1) % 0x100
 
     def pull_byte(self):
         self.stack_pointer = (self.stack_pointer + 1) % 0x100
+        page = self.read_pages[self.STACK_PAGE >> 8]
+        if page is not None:
+            return page[self.stack_pointer]
         return self.read_byte(self.STACK_PAGE + self.stack_pointer)
 
     def push_word(self, word):
-        hi, lo = divmod(word, 0x100)
-        self.push_byte(hi)
-        self.push_byte(lo)
+        self.push_byte((word >> 8) & 0xFF)
+        self.push_byte(word & 0xFF)
 
     def pull_word(self):
-        s = self.STACK_PAGE + self.stack_pointer + 1
-        self.stack_pointer += 2
-        return self.read_word(s)
+        # byte by byte, the stack wraps within its page
+        low = self.pull_byte()
+        return low | (self.pull_byte() << 8)
 
     ####
 
@@ -487,14 +982,14 @@ class CPU(object):
     ####
 
     def update_nz(self, value):
-        value = value % 0x100
-        self.zero_flag = [0, 1][(value == 0)]
-        self.sign_flag = [0, 1][((value & 0x80) != 0)]
+        value &= 0xFF
+        self.p = (self.p & 0x7D) | NZ_FLAGS[value]
         return value
 
     def update_nzc(self, value):
-        self.carry_flag = [0, 1][(value > 0xFF)]
-        return self.update_nz(value)
+        # value is a 9 bit result, bit 8 being the carry
+        self.p = (self.p & 0x7C) | NZC_FLAGS[value]
+        return value & 0xFF
 
     ####
 
@@ -549,39 +1044,31 @@ class CPU(object):
 
     def ROL(self, operand_address=None):
         if operand_address is None:
-            a = self.accumulator << 1
-            if self.carry_flag:
-                a = a | 0x01
-            self.accumulator = self.update_nzc(a)
+            self.accumulator = self.update_nzc(
+                (self.accumulator << 1) | (self.p & CARRY))
         else:
             self.cycles += 2
-            m = self.read_byte(operand_address) << 1
-            if self.carry_flag:
-                m = m | 0x01
+            m = (self.read_byte(operand_address) << 1) | (self.p & CARRY)
             self.write_byte(operand_address, self.update_nzc(m))
 
     def ROR(self, operand_address=None):
+        # moving bit 0 to bit 8 makes it a 9 bit result like ROL's
         if operand_address is None:
-            if self.carry_flag:
-                self.accumulator = self.accumulator | 0x100
-            self.carry_flag = self.accumulator % 2
-            self.accumulator = self.update_nz(self.accumulator >> 1)
+            a = self.accumulator | ((self.p & CARRY) << 8)
+            self.accumulator = self.update_nzc(((a & 0x01) << 8) | (a >> 1))
         else:
             self.cycles += 2
-            m = self.read_byte(operand_address)
-            if self.carry_flag:
-                m = m | 0x100
-            self.carry_flag = m % 2
-            self.write_byte(operand_address, self.update_nz(m >> 1))
+            m = self.read_byte(operand_address) | ((self.p & CARRY) << 8)
+            self.write_byte(operand_address, self.update_nzc(((m & 0x01) << 8) | (m >> 1)))
 
     def LSR(self, operand_address=None):
         if operand_address is None:
-            self.carry_flag = self.accumulator % 2
-            self.accumulator = self.update_nz(self.accumulator >> 1)
+            a = self.accumulator
+            self.accumulator = self.update_nzc(((a & 0x01) << 8) | (a >> 1))
         else:
             self.cycles += 2
-            self.carry_flag = self.read_byte(operand_address) % 2
-            self.write_byte(operand_address, self.update_nz(self.read_byte(operand_address) >> 1))
+            m = self.read_byte(operand_address)
+            self.write_byte(operand_address, self.update_nzc(((m & 0x01) << 8) | (m >> 1)))
 
     # JUMPS / RETURNS
 
@@ -601,67 +1088,70 @@ class CPU(object):
     # BRANCHES
 
     def BCC(self, operand_address):
-        if not self.carry_flag:
+        if not self.p & CARRY:
             self.cycles += 1
             self.program_counter = operand_address
 
     def BCS(self, operand_address):
-        if self.carry_flag:
+        if self.p & CARRY:
             self.cycles += 1
             self.program_counter = operand_address
 
     def BEQ(self, operand_address):
-        if self.zero_flag:
+        if self.p & ZERO:
             self.cycles += 1
             self.program_counter = operand_address
 
     def BNE(self, operand_address):
-        if not self.zero_flag:
+        if not self.p & ZERO:
             self.cycles += 1
             self.program_counter = operand_address
 
     def BMI(self, operand_address):
-        if self.sign_flag:
+        if self.p & NEGATIVE:
             self.cycles += 1
             self.program_counter = operand_address
 
     def BPL(self, operand_address):
-        if not self.sign_flag:
+        if not self.p & NEGATIVE:
             self.cycles += 1
             self.program_counter = operand_address
 
     def BVC(self, operand_address):
-        if not self.overflow_flag:
+        if not self.p & OVERFLOW:
             self.cycles += 1
             self.program_counter = operand_address
 
     def BVS(self, operand_address):
-        if self.overflow_flag:
+        if self.p & OVERFLOW:
             self.cycles += 1
             self.program_counter = operand_address
 
     # SET / CLEAR FLAGS
 
     def CLC(self):
-        self.carry_flag = 0
+        self.p &= ~CARRY
 
     def CLD(self):
-        self.decimal_mode_flag = 0
+        self.p &= ~DECIMAL
+        self.select_alu_tables()
 
     def CLI(self):
-        self.interrupt_disable_flag = 0
+        self.p &= ~INTERRUPT
+        self.poll_irq()
 
     def CLV(self):
-        self.overflow_flag = 0
+        self.p &= ~OVERFLOW
 
     def SEC(self):
-        self.carry_flag = 1
+        self.p |= CARRY
 
     def SED(self):
-        self.decimal_mode_flag = 1
+        self.p |= DECIMAL
+        self.select_alu_tables()
 
     def SEI(self):
-        self.interrupt_disable_flag = 1
+        self.p |= INTERRUPT
 
     # INCREMENT / DECREMENT
 
@@ -702,6 +1192,7 @@ class CPU(object):
     def PLP(self):
         self.cycles += 2
         self.status_from_byte(self.pull_byte())
+        self.poll_irq()
 
     # LOGIC
 
@@ -717,70 +1208,40 @@ class CPU(object):
     # ARITHMETIC
 
     def ADC(self, operand_address):
-        # @@@ doesn't handle BCD yet
-        assert not self.decimal_mode_flag
-
-        a2 = self.accumulator
-        a1 = signed(a2)
-        m2 = self.read_byte(operand_address)
-        m1 = signed(m2)
-
-        # twos complement addition
-        result1 = a1 + m1 + self.carry_flag
-
-        # unsigned addition
-        result2 = a2 + m2 + self.carry_flag
-
-        self.accumulator = self.update_nzc(result2)
-
-        # perhaps this could be calculated from result2 but result1 is more intuitive
-        self.overflow_flag = [0, 1][(result1 > 127) | (result1 < -128)]
+        entry = self.adc_table[((self.p & CARRY) << 16) |
+                               (self.accumulator << 8) |
+                               self.read_byte(operand_address)]
+        self.accumulator = entry & 0xFF
+        self.p = (self.p & 0x3C) | (entry >> 8)
 
     def SBC(self, operand_address):
-        # @@@ doesn't handle BCD yet
-        assert not self.decimal_mode_flag
-
-        a2 = self.accumulator
-        a1 = signed(a2)
-        m2 = self.read_byte(operand_address)
-        m1 = signed(m2)
-
-        # twos complement subtraction
-        result1 = a1 - m1 - [1, 0][self.carry_flag]
-
-        # unsigned subtraction
-        result2 = a2 - m2 - [1, 0][self.carry_flag]
-
-        self.accumulator = self.update_nz(result2)
-        self.carry_flag = [0, 1][(result2 >= 0)]
-
-        # perhaps this could be calculated from result2 but result1 is more intuitive
-        self.overflow_flag = [0, 1][(result1 > 127) | (result1 < -128)]
+        entry = self.sbc_table[((self.p & CARRY) << 16) |
+                               (self.accumulator << 8) |
+                               self.read_byte(operand_address)]
+        self.accumulator = entry & 0xFF
+        self.p = (self.p & 0x3C) | (entry >> 8)
 
     # BIT
 
     def BIT(self, operand_address):
         value = self.read_byte(operand_address)
-        self.sign_flag = ((value >> 7) % 2)  # bit 7
-        self.overflow_flag = ((value >> 6) % 2)  # bit 6
-        self.zero_flag = [0, 1][((self.accumulator & value) == 0)]
+        # N and V are bits 7 and 6 of the operand
+        self.p = ((self.p & 0x3D) | (value & 0xC0) |
+                  (0 if self.accumulator & value else ZERO))
 
     # COMPARISON
 
+    # the differences are offset by 0x100 so that bit 8 is the carry (no
+    # borrow) and update_nzc can set all three flags at once
+
     def CMP(self, operand_address):
-        result = self.accumulator - self.read_byte(operand_address)
-        self.carry_flag = [0, 1][(result >= 0)]
-        self.update_nz(result)
+        self.update_nzc(self.accumulator - self.read_byte(operand_address) + 0x100)
 
     def CPX(self, operand_address):
-        result = self.x_index - self.read_byte(operand_address)
-        self.carry_flag = [0, 1][(result >= 0)]
-        self.update_nz(result)
+        self.update_nzc(self.x_index - self.read_byte(operand_address) + 0x100)
 
     def CPY(self, operand_address):
-        result = self.y_index - self.read_byte(operand_address)
-        self.carry_flag = [0, 1][(result >= 0)]
-        self.update_nz(result)
+        self.update_nzc(self.y_index - self.read_byte(operand_address) + 0x100)
 
     # SYSTEM
 
@@ -792,12 +1253,10 @@ class CPU(object):
         self.push_word(self.program_counter + 1)
         self.push_byte(self.status_as_byte())
         self.program_counter = self.read_word(0xFFFE)
-        self.break_flag = 1
+        self.p |= BREAK
 
     def RTI(self):
         self.cycles += 4
         self.status_from_byte(self.pull_byte())
         self.program_counter = self.pull_word()
-
-    # @@@ IRQ
-    # @@@ NMI
+        self.poll_irq()
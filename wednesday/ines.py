@@ -0,0 +1,311 @@
+from __future__ import print_function
+import mmap
+import struct
+
+
+# iNES header: "NES\x1a", PRG ROM size in 16K units, CHR ROM size in 8K
+# units (0 for CHR RAM), flags 6 and 7, then padding
+HEADER = struct.Struct('<4sBBBB8x')
+MAGIC = b'NES\x1a'
+
+PRG_BANK = 0x4000
+CHR_BANK = 0x2000
+
+HORIZONTAL, VERTICAL, FOUR_SCREEN, SINGLE_LOW, SINGLE_HIGH = range(5)
+
+
+class INESError(ValueError):
+    pass
+
+
+class Cartridge(object):
+    # PRG and CHR are memoryview slices of the image, so opening a file
+    # maps it and copies nothing
+
+    def __init__(self, data):
+        data = memoryview(data)
+        if len(data) < HEADER.size:
+            raise INESError('not an iNES image: too short')
+        magic, prg_banks, chr_banks, flags6, flags7 = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise INESError('not an iNES image: bad magic {!r}'.format(magic))
+        self.mapper_number = (flags6 >> 4) | (flags7 & 0xF0)
+        if flags6 & 0x08:
+            self.mirroring = FOUR_SCREEN
+        else:
+            self.mirroring = VERTICAL if flags6 & 0x01 else HORIZONTAL
+        self.battery = bool(flags6 & 0x02)
+        offset = HEADER.size + (512 if flags6 & 0x04 else 0)
+        self.prg = data[offset:offset + prg_banks * PRG_BANK]
+        offset += prg_banks * PRG_BANK
+        if chr_banks:
+            self.chr = data[offset:offset + chr_banks * CHR_BANK]
+            self.chr_ram = False
+        else:
+            self.chr = memoryview(bytearray(CHR_BANK))
+            self.chr_ram = True
+        if len(self.prg) != prg_banks * PRG_BANK or len(self.chr) != max(chr_banks, 1) * CHR_BANK:
+            raise INESError('truncated iNES image')
+        self.file = None
+
+    @classmethod
+    def open(cls, filename):
+        # the map outlives the file object and is freed with the last view
+        with open(filename, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        cartridge = cls(mapped)
+        cartridge.file = mapped
+        return cartridge
+
+    def mapper(self):
+        try:
+            mapper_class = MAPPERS[self.mapper_number]
+        except KeyError:
+            raise INESError('mapper {} is not supported'.format(self.mapper_number))
+        return mapper_class(self)
+
+
+class Mapper(object):
+    # Maps PRG ROM into $8000-$FFFF and PRG RAM into $6000-$7FFF of a
+    # MemoryMap, and takes the register writes to $8000-$FFFF. PRG banks are
+    # cut into page views once, on first use, so a bank switch is a slice
+    # assignment into the page table.
+    #
+    # CHR is exposed to the PPU as chr_pages, eight 1K views of $0000-$1FFF
+    # in PPU space; chr_listeners are called with the first and end 1K slot
+    # whenever they change. Mappers that rewrite every bank on each register
+    # write only notify for the slots that got a different bank.
+    #
+    # Mappers with a scanline counter take clock_scanline() from the PPU on
+    # each line it renders, hold IRQ on the memory's cpu while it is pending,
+    # and say how many clocks are left before it fires in scanlines_to_irq();
+    # irq_listeners are called when the counter is written.
+
+    PRG_SLOT = 0x2000  # PRG is switched in 8K slots
+
+    def __init__(self, cartridge):
+        self.cartridge = cartridge
+        self.prg_ram = bytearray(0x2000)
+        self.prg_slots = len(cartridge.prg) // self.PRG_SLOT
+        self.chr_slots = len(cartridge.chr) // 0x400
+        self.prg_views = {}
+        self.chr_pages = [cartridge.chr[slot * 0x400:(slot + 1) * 0x400]
+                          for slot in range(8)]
+        self.chr_banks = list(range(8))  # the 1K bank in each slot
+        self.chr_listeners = []
+        self.irq_listeners = []
+        self.mirroring = cartridge.mirroring
+        self.memory = None
+
+    def attach(self, memory):
+        self.memory = memory
+        memory.map_ram(0x6000, self.prg_ram)
+        memory.map_device(0x8000, 0x8000, write=self.write)
+        self.reset()
+        return self
+
+    def reset(self):
+        pass
+
+    def write(self, cycle, address, value):
+        pass
+
+    def clock_scanline(self):
+        pass
+
+    def scanlines_to_irq(self):
+        return None
+
+    def set_irq(self, pending):
+        self.irq_pending = pending
+        cpu = getattr(self.memory, 'cpu', None)
+        if cpu is not None:
+            cpu.set_irq('mapper', pending)
+
+    def switch_prg(self, address, bank):
+        # an 8K bank of PRG ROM at address, counting from the end when negative
+        bank %= self.prg_slots
+        views = self.prg_views.get(bank)
+        if views is None:
+            views = self.memory.page_views(
+                self.cartridge.prg[bank * self.PRG_SLOT:(bank + 1) * self.PRG_SLOT])
+            self.prg_views[bank] = views
+        self.memory.switch_pages(address, views)
+
+    def switch_chr(self, slot, bank, size=1):
+        # size 1K banks of CHR into the slots from slot on
+        bank = (bank * size) % self.chr_slots
+        chr_banks = self.chr_banks
+        changed = [n for n in range(size) if chr_banks[slot + n] != bank + n]
+        if not changed:
+            return
+        chr = self.cartridge.chr
+        for n in changed:
+            self.chr_pages[slot + n] = chr[(bank + n) * 0x400:(bank + n + 1) * 0x400]
+            chr_banks[slot + n] = bank + n
+        for listener in self.chr_listeners:
+            listener(slot + changed[0], slot + changed[-1] + 1)
+
+
+class NROM(Mapper):
+
+    def reset(self):
+        # 16K images are mirrored into $C000
+        for n in range(4):
+            self.switch_prg(0x8000 + n * self.PRG_SLOT, n)
+
+
+class UxROM(Mapper):
+
+    def reset(self):
+        self.select(0)
+        self.switch_prg(0xC000, -2)
+        self.switch_prg(0xE000, -1)
+
+    def write(self, cycle, address, value):
+        self.select(value)
+
+    def select(self, bank):
+        self.switch_prg(0x8000, bank * 2)
+        self.switch_prg(0xA000, bank * 2 + 1)
+
+
+class CNROM(NROM):
+
+    def write(self, cycle, address, value):
+        self.switch_chr(0, value & 0x03, 8)
+
+
+class MMC1(Mapper):
+    # registers are written a bit at a time through a 5 bit shift register
+
+    MIRRORING = (SINGLE_LOW, SINGLE_HIGH, VERTICAL, HORIZONTAL)
+
+    def reset(self):
+        self.shift = 0x10
+        self.control = 0x0C
+        self.chr_bank = [0, 1]
+        self.prg_bank = 0
+        self.update()
+
+    def write(self, cycle, address, value):
+        if value & 0x80:
+            self.shift = 0x10
+            self.control |= 0x0C
+            self.update()
+            return
+        # the marker bit reaching bit 0 makes this the fifth write
+        full = self.shift & 1
+        self.shift = (self.shift >> 1) | ((value & 1) << 4)
+        if not full:
+            return
+        value, self.shift = self.shift, 0x10
+        register = (address >> 13) & 3
+        if register == 0:
+            self.control = value
+        elif register == 3:
+            self.prg_bank = value & 0x0F
+        else:
+            self.chr_bank[register - 1] = value
+        self.update()
+
+    def update(self):
+        self.mirroring = self.MIRRORING[self.control & 3]
+        prg_mode = (self.control >> 2) & 3
+        banks = self.prg_slots // 2
+        if prg_mode < 2:
+            low, high = self.prg_bank & 0x0E, (self.prg_bank & 0x0E) + 1
+        elif prg_mode == 2:
+            low, high = 0, self.prg_bank
+        else:
+            low, high = self.prg_bank, banks - 1
+        for address, bank in [(0x8000, low), (0xC000, high)]:
+            self.switch_prg(address, bank * 2)
+            self.switch_prg(address + 0x2000, bank * 2 + 1)
+        if self.control & 0x10:
+            self.switch_chr(0, self.chr_bank[0], 4)
+            self.switch_chr(4, self.chr_bank[1], 4)
+        else:
+            self.switch_chr(0, self.chr_bank[0] >> 1, 8)
+
+
+class MMC3(Mapper):
+
+    def reset(self):
+        self.select = 0
+        self.banks = [0, 2, 4, 5, 6, 7, 0, 1]
+        self.irq_latch = 0
+        self.irq_counter = 0
+        self.irq_reload = False
+        self.irq_enabled = False
+        self.irq_pending = False
+        self.update()
+
+    def write(self, cycle, address, value):
+        odd = address & 1
+        register = address & 0xE000
+        if register == 0x8000:
+            if odd:
+                self.banks[self.select & 7] = value
+            else:
+                self.select = value
+            self.update()
+        elif register == 0xA000:
+            if not odd and self.mirroring != FOUR_SCREEN:
+                self.mirroring = HORIZONTAL if value & 1 else VERTICAL
+        elif register == 0xC000:
+            if odd:
+                self.irq_reload = True
+            else:
+                self.irq_latch = value
+        elif odd:
+            self.irq_enabled = True
+        else:
+            self.irq_enabled = False
+            self.set_irq(False)
+        if register >= 0xC000:
+            for listener in self.irq_listeners:
+                listener()
+
+    def update(self):
+        banks = self.banks
+        if self.select & 0x40:
+            self.switch_prg(0x8000, -2)
+            self.switch_prg(0xC000, banks[6])
+        else:
+            self.switch_prg(0x8000, banks[6])
+            self.switch_prg(0xC000, -2)
+        self.switch_prg(0xA000, banks[7])
+        self.switch_prg(0xE000, -1)
+        # two 2K banks and four 1K banks, halves swapped by bit 7
+        flip = 4 if self.select & 0x80 else 0
+        self.switch_chr(0 ^ flip, banks[0] >> 1, 2)
+        self.switch_chr(2 ^ flip, banks[1] >> 1, 2)
+        for n in range(4):
+            self.switch_chr((4 + n) ^ flip, banks[2 + n])
+
+    def clock_scanline(self):
+        # the PPU clocks this once per rendered scanline
+        if self.irq_counter == 0 or self.irq_reload:
+            self.irq_counter = self.irq_latch
+            self.irq_reload = False
+        else:
+            self.irq_counter -= 1
+        if self.irq_counter == 0 and self.irq_enabled:
+            self.set_irq(True)
+
+    def scanlines_to_irq(self):
+        if not self.irq_enabled or self.irq_pending:
+            return None
+        if self.irq_counter == 0 or self.irq_reload:
+            return self.irq_latch + 1 if self.irq_latch else 1
+        return self.irq_counter
+
+
+MAPPERS = {
+    0: NROM,
+    1: MMC1,
+    2: UxROM,
+    3: CNROM,
+    4: MMC3,
+}
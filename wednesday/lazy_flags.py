@@ -0,0 +1,164 @@
+from wednesday.cpu6502 import (
+    CPU, CARRY, ZERO, OVERFLOW, NEGATIVE, UNUSED)
+
+
+class LazyFlagsCPU(CPU):
+    # Instead of packing N, Z, C and V into p after every operation, keep
+    # the results they come from and only derive the flags when a branch,
+    # PHP, BRK or a status query looks at them:
+    #
+    #   nz_result  Z when its low byte is zero, N when bit 7 or bit 15 is set
+    #              (bit 15 lets PLP load N and Z together)
+    #   c_result   C is bit 8, as in the 9 bit results of update_nzc
+    #   v_result   V is bit 7, as in (a ^ r) & (m ^ r) for an addition
+    #
+    # p only holds I, D and B here; use status_as_byte() for the full byte.
+
+    __slots__ = ('nz_result', 'c_result', 'v_result')
+
+    def __init__(self, options, bus):
+        super(LazyFlagsCPU, self).__init__(options, bus)
+        self.status_from_byte(self.p)
+
+    carry_flag = property(
+        lambda self: (self.c_result >> 8) & 1,
+        lambda self, value: setattr(self, 'c_result', 0x100 if value else 0))
+    zero_flag = property(
+        lambda self: 0 if self.nz_result & 0xFF else 1,
+        lambda self, value: self.status_from_byte(
+            (self.status_as_byte() & ~ZERO) | (ZERO if value else 0)))
+    sign_flag = property(
+        lambda self: 1 if self.nz_result & 0x8080 else 0,
+        lambda self, value: self.status_from_byte(
+            (self.status_as_byte() & ~NEGATIVE) | (NEGATIVE if value else 0)))
+    overflow_flag = property(
+        lambda self: (self.v_result >> 7) & 1,
+        lambda self, value: setattr(self, 'v_result', 0x80 if value else 0))
+
+    def status_from_byte(self, status):
+        self.p = status | UNUSED
+        self.select_alu_tables()
+        self.nz_result = ((status & NEGATIVE) << 8) | (0 if status & ZERO else 1)
+        self.c_result = (status & CARRY) << 8
+        self.v_result = (status & OVERFLOW) << 1
+
+    def status_as_byte(self):
+        return ((self.p & 0x3C) |
+                (NEGATIVE if self.nz_result & 0x8080 else 0) |
+                (0 if self.nz_result & 0xFF else ZERO) |
+                ((self.c_result >> 8) & CARRY) |
+                ((self.v_result & 0x80) >> 1))
+
+    def update_nz(self, value):
+        value &= 0xFF
+        self.nz_result = value
+        return value
+
+    def update_nzc(self, value):
+        self.nz_result = self.c_result = value
+        return value & 0xFF
+
+    # SHIFTS / ROTATES
+
+    def ROL(self, operand_address=None):
+        carry = (self.c_result >> 8) & 1
+        if operand_address is None:
+            self.accumulator = self.update_nzc((self.accumulator << 1) | carry)
+        else:
+            self.cycles += 2
+            m = (self.read_byte(operand_address) << 1) | carry
+            self.write_byte(operand_address, self.update_nzc(m))
+
+    def ROR(self, operand_address=None):
+        carry = self.c_result & 0x100
+        if operand_address is None:
+            a = self.accumulator | carry
+            self.accumulator = self.update_nzc(((a & 0x01) << 8) | (a >> 1))
+        else:
+            self.cycles += 2
+            m = self.read_byte(operand_address) | carry
+            self.write_byte(operand_address, self.update_nzc(((m & 0x01) << 8) | (m >> 1)))
+
+    # BRANCHES
+
+    def BCC(self, operand_address):
+        if not self.c_result & 0x100:
+            self.cycles += 1
+            self.program_counter = operand_address
+
+    def BCS(self, operand_address):
+        if self.c_result & 0x100:
+            self.cycles += 1
+            self.program_counter = operand_address
+
+    def BEQ(self, operand_address):
+        if not self.nz_result & 0xFF:
+            self.cycles += 1
+            self.program_counter = operand_address
+
+    def BNE(self, operand_address):
+        if self.nz_result & 0xFF:
+            self.cycles += 1
+            self.program_counter = operand_address
+
+    def BMI(self, operand_address):
+        if self.nz_result & 0x8080:
+            self.cycles += 1
+            self.program_counter = operand_address
+
+    def BPL(self, operand_address):
+        if not self.nz_result & 0x8080:
+            self.cycles += 1
+            self.program_counter = operand_address
+
+    def BVC(self, operand_address):
+        if not self.v_result & 0x80:
+            self.cycles += 1
+            self.program_counter = operand_address
+
+    def BVS(self, operand_address):
+        if self.v_result & 0x80:
+            self.cycles += 1
+            self.program_counter = operand_address
+
+    # SET / CLEAR FLAGS
+
+    def CLC(self):
+        self.c_result = 0
+
+    def CLV(self):
+        self.v_result = 0
+
+    def SEC(self):
+        self.c_result = 0x100
+
+    # ARITHMETIC
+
+    def ADC(self, operand_address):
+        entry = self.adc_table[((self.c_result & 0x100) << 8) |
+                               (self.accumulator << 8) |
+                               self.read_byte(operand_address)]
+        self.accumulator = entry & 0xFF
+        self.set_alu_flags(entry >> 8)
+
+    def SBC(self, operand_address):
+        entry = self.sbc_table[((self.c_result & 0x100) << 8) |
+                               (self.accumulator << 8) |
+                               self.read_byte(operand_address)]
+        self.accumulator = entry & 0xFF
+        self.set_alu_flags(entry >> 8)
+
+    def set_alu_flags(self, flags):
+        # N, V, Z and C bits as packed in the ALU tables; the sources only
+        # look at their own bit so the others can be left in
+        self.nz_result = ((flags & NEGATIVE) << 8) | (~flags & ZERO)
+        self.c_result = flags << 8
+        self.v_result = flags << 1
+
+    # BIT
+
+    def BIT(self, operand_address):
+        value = self.read_byte(operand_address)
+        # N and V are bits 7 and 6 of the operand, Z comes from A & M
+        self.nz_result = ((value & 0x80) << 8) | (self.accumulator & value)
+        self.v_result = value << 1
@@ -0,0 +1,121 @@
+from __future__ import print_function
+
+from wednesday.cpu6502 import MemoryMap
+
+
+RAM_SIZE = 0x0800
+OAM_DMA = 0x4014
+
+# register of every address in the $40 page, the APU and I/O registers up
+# to $401F and open bus (-1) after them
+IO_REGISTER = tuple(address if address < 0x20 else -1 for address in range(0x100))
+
+
+class RegisterFile(object):
+    # stand-in for the PPU or APU until a real device is attached: reads
+    # give back what was last written
+
+    def __init__(self, size):
+        self.registers = bytearray(size)
+        self.oam = bytearray(0x100)
+
+    def read_register(self, cycle, register):
+        return self.registers[register]
+
+    def write_register(self, cycle, register, value):
+        self.registers[register] = value
+
+    def write_oam(self, cycle, data):
+        self.oam[:] = data
+
+
+class NESMemory(MemoryMap):
+    # The NES CPU address space on the page table:
+    #
+    #   $0000-$1FFF  2K of RAM, the same buffer mapped four times, so the
+    #                mirrors are plain RAM pages on the CPU fast path
+    #   $2000-$3FFF  the 8 PPU registers, repeated every 8 bytes
+    #   $4000-$401F  APU and I/O registers, $4014 starts OAM DMA
+    #   $6000-$FFFF  the cartridge, see wednesday.ines
+    #
+    # ppu and apu take read_register(cycle, register) and
+    # write_register(cycle, register, value); the PPU also gets
+    # write_oam(cycle, data) with the 256 bytes of an OAM DMA, and
+    # connect(mapper) when a cartridge is loaded, if it has one. cycle is
+    # the master cycle, for devices that run lazily and catch up to it when
+    # touched; a PPU with catch_up(cycle) is also caught up before every
+    # mapper write, so bank and mirroring switches show from the right line.
+
+    DMA_CYCLES = 513
+
+    def __init__(self, ppu=None, apu=None):
+        super(NESMemory, self).__init__()
+        self.ram = bytearray(RAM_SIZE)
+        for start in range(0x0000, 0x2000, RAM_SIZE):
+            self.map_ram(start, self.ram)
+        self.ppu = ppu if ppu is not None else RegisterFile(8)
+        self.apu = apu if apu is not None else RegisterFile(0x20)
+        self.map_device(0x2000, 0x2000, read=self.ppu_read, write=self.ppu_write)
+        self.map_device(0x4000, 0x0100, read=self.io_read, write=self.io_write)
+        self.mapper = None
+        # CPU cycles owed for OAM DMA; with a cpu set, DMA stalls it directly
+        self.dma_cycles = 0
+        self.cpu = None
+
+    def load_cartridge(self, cartridge):
+        self.mapper = cartridge.mapper().attach(self)
+        connect = getattr(self.ppu, 'connect', None)
+        if connect is not None:
+            connect(self.mapper)
+        if getattr(self.ppu, 'catch_up', None) is not None:
+            self.map_device(0x8000, 0x8000, write=self.mapper_write)
+        return self.mapper
+
+    def mapper_write(self, cycle, address, value):
+        self.ppu.catch_up(cycle)
+        self.mapper.write(cycle, address, value)
+
+    def ppu_read(self, cycle, address):
+        return self.ppu.read_register(cycle, address & 7)
+
+    def ppu_write(self, cycle, address, value):
+        self.ppu.write_register(cycle, address & 7, value)
+
+    def io_read(self, cycle, address):
+        register = IO_REGISTER[address & 0xFF]
+        if register < 0:
+            return 0
+        return self.apu.read_register(cycle, register)
+
+    def io_write(self, cycle, address, value):
+        if address == OAM_DMA:
+            self.oam_dma(cycle, value)
+            return
+        register = IO_REGISTER[address & 0xFF]
+        if register >= 0:
+            self.apu.write_register(cycle, register, value)
+
+    def read_has_side_effects(self, address):
+        # $2007 moves the VRAM address; reading $2002 clears vblank, but
+        # only once while a loop polls it. Of the I/O registers only the
+        # write-only ones up to $4014 read back without changing anything:
+        # $4015 acknowledges the frame IRQ, $4016/$4017 shift the
+        # controllers, and the test registers after them are unknown; the
+        # rest of the page is open bus
+        if 0x2000 <= address < 0x4000:
+            return address & 7 == 7
+        if 0x4000 <= address < 0x4100:
+            return 0x4015 <= address < 0x4020
+        return super(NESMemory, self).read_has_side_effects(address)
+
+    def oam_dma(self, cycle, page):
+        view = self.read_pages[page]
+        if view is not None:
+            data = bytes(view)
+        else:
+            data = bytes(bytearray(self.read_byte(cycle, (page << 8) | n) for n in range(0x100)))
+        self.ppu.write_oam(cycle, data)
+        if self.cpu is not None:
+            self.cpu.cycles += self.DMA_CYCLES
+        else:
+            self.dma_cycles += self.DMA_CYCLES
@@ -0,0 +1,626 @@
+from __future__ import print_function
+
+import numpy
+
+from wednesday.cpu6502 import NEVER
+from wednesday.ines import HORIZONTAL, VERTICAL, FOUR_SCREEN, SINGLE_LOW, SINGLE_HIGH
+
+
+WIDTH, HEIGHT = 256, 240
+DOTS, LINES = 341, 262
+VBLANK_LINE, PRERENDER_LINE = 241, 261
+
+# PPUCTRL
+CTRL_INCREMENT_32 = 0x04
+CTRL_SPRITE_TABLE = 0x08
+CTRL_BACKGROUND_TABLE = 0x10
+CTRL_TALL_SPRITES = 0x20
+CTRL_NMI = 0x80
+# PPUMASK
+MASK_GRAYSCALE = 0x01
+MASK_BACKGROUND_LEFT = 0x02
+MASK_SPRITES_LEFT = 0x04
+MASK_BACKGROUND = 0x08
+MASK_SPRITES = 0x10
+# PPUSTATUS
+STATUS_OVERFLOW = 0x20
+STATUS_SPRITE_ZERO = 0x40
+STATUS_VBLANK = 0x80
+
+# the physical 1K nametable behind each of the four in PPU space
+NAMETABLES = {
+    HORIZONTAL: (0, 0, 1, 1),
+    VERTICAL: (0, 1, 0, 1),
+    FOUR_SCREEN: (0, 1, 2, 3),
+    SINGLE_LOW: (0, 0, 0, 0),
+    SINGLE_HIGH: (1, 1, 1, 1),
+}
+NAMETABLE_BANKS = dict((mirroring, numpy.array(banks) * 0x400)
+                       for mirroring, banks in NAMETABLES.items())
+
+# the 8 two bit pixels of a pattern row, indexed by its low and high plane
+# bytes, leftmost pixel first
+_bits = (numpy.arange(0x100)[:, None] >> numpy.arange(7, -1, -1)) & 1
+PATTERN_PIXELS = (_bits[:, None, :] | (_bits[None, :, :] << 1)).astype(numpy.uint8)
+del _bits
+
+TILE_COLUMNS = numpy.arange(33)
+SPRITE_COLUMNS = numpy.arange(8)
+
+TILES = 0x200  # in the two pattern tables
+
+# the 2C02 palette as RGB
+NES_PALETTE = numpy.array([
+    (84, 84, 84), (0, 30, 116), (8, 16, 144), (48, 0, 136),
+    (68, 0, 100), (92, 0, 48), (84, 4, 0), (60, 24, 0),
+    (32, 42, 0), (8, 58, 0), (0, 64, 0), (0, 60, 0),
+    (0, 50, 60), (0, 0, 0), (0, 0, 0), (0, 0, 0),
+    (152, 150, 152), (8, 76, 196), (48, 50, 236), (92, 30, 228),
+    (136, 20, 176), (160, 20, 100), (152, 34, 32), (120, 60, 0),
+    (84, 90, 0), (40, 114, 0), (8, 124, 0), (0, 118, 40),
+    (0, 102, 120), (0, 0, 0), (0, 0, 0), (0, 0, 0),
+    (236, 238, 236), (76, 154, 236), (120, 124, 236), (176, 98, 236),
+    (228, 84, 236), (236, 88, 180), (236, 106, 100), (212, 136, 32),
+    (160, 170, 0), (116, 196, 0), (76, 208, 32), (56, 204, 108),
+    (56, 180, 204), (60, 60, 60), (0, 0, 0), (0, 0, 0),
+    (236, 238, 236), (168, 204, 236), (188, 188, 236), (212, 178, 236),
+    (236, 174, 236), (236, 174, 212), (236, 180, 176), (228, 196, 144),
+    (204, 210, 120), (180, 222, 120), (168, 226, 144), (152, 226, 180),
+    (160, 214, 228), (160, 162, 160), (0, 0, 0), (0, 0, 0),
+], dtype=numpy.uint8)
+
+
+class TileCache(object):
+    # The 512 tiles of PPU $0000-$1FFF decoded to 8x8 arrays of two bit
+    # colors, so a line of background is a fancy index into tiles rather
+    # than a decode of 33 pattern rows. With flipped, tiles also holds the
+    # three flips for sprites, indexed by the top bits of their attribute
+    # byte: tiles[flip, tile, row].
+    #
+    # chr is a copy of the pattern tables as the mapper has them banked.
+    # Writes and bank switches mark the tiles they touch dirty, and refresh
+    # decodes those again, all at once, before the next line is drawn.
+
+    def __init__(self, flipped=True):
+        self.flipped = flipped
+        self.chr = numpy.zeros(0x2000, dtype=numpy.uint8)
+        self.tiles = numpy.zeros((4 if flipped else 1, TILES, 8, 8), dtype=numpy.uint8)
+        self.dirty = numpy.ones(TILES, dtype=bool)
+        self.stale = True
+
+    def load(self, pages, first, end):
+        # 1K slots first to end from pages, after a bank switch
+        for slot in range(first, end):
+            self.chr[slot * 0x400:(slot + 1) * 0x400] = numpy.frombuffer(
+                pages[slot], dtype=numpy.uint8)
+        self.invalidate(first * 0x40, end * 0x40)
+
+    def write(self, address, value):
+        self.chr[address] = value
+        self.dirty[address >> 4] = True
+        self.stale = True
+
+    def invalidate(self, first=0, end=TILES):
+        self.dirty[first:end] = True
+        self.stale = True
+
+    def refresh(self):
+        dirty = numpy.flatnonzero(self.dirty)
+        patterns = self.chr.reshape(TILES, 16)[dirty]
+        decoded = PATTERN_PIXELS[patterns[:, :8], patterns[:, 8:]]
+        tiles = self.tiles
+        tiles[0, dirty] = decoded
+        if self.flipped:
+            tiles[1, dirty] = decoded[:, :, ::-1]
+            tiles[2, dirty] = decoded[:, ::-1]
+            tiles[3, dirty] = decoded[:, ::-1, ::-1]
+        self.dirty[:] = False
+        self.stale = False
+        return dirty
+
+    def sprite_row(self, flip, tile, row):
+        if self.flipped:
+            return self.tiles[flip, tile, row]
+        pixels = self.tiles[0, tile, 7 - row if flip & 2 else row]
+        return pixels[::-1] if flip & 1 else pixels
+
+
+class BackgroundLayer(object):
+    # Each physical nametable drawn whole, 240x256 palette indexes with 0
+    # where the background is transparent, for the PPU to slice lines out
+    # of at the current scroll. Only the tiles marked dirty are drawn
+    # again: by a write to their nametable or attribute byte, by a change
+    # to their pattern in the TileCache or by switching pattern tables.
+    # Palette indexes rather than colors are kept, so palette writes need
+    # nothing drawn again.
+
+    def __init__(self, vram, tile_cache):
+        self.vram = vram
+        self.tile_cache = tile_cache
+        self.layer = numpy.zeros((4, HEIGHT, WIDTH), dtype=numpy.uint8)
+        # the same memory as 8x8 blocks: [nametable, row, y, column, x]
+        self.blocks = self.layer.reshape(4, 30, 8, 32, 8)
+        self.names = vram.reshape(4, 0x400)[:, :960].reshape(4, 30, 32)
+        self.dirty = numpy.ones((4, 30, 32), dtype=bool)
+        self.stale = True
+        self.table = 0
+
+    def write(self, index, value):
+        # after a write to vram[index]
+        bank, offset = index >> 10, index & 0x3FF
+        if offset < 960:
+            self.dirty[bank, offset >> 5, offset & 0x1F] = True
+        else:
+            # an attribute byte covers 4x4 tiles
+            row, column = ((offset - 960) >> 3) << 2, ((offset - 960) & 7) << 2
+            self.dirty[bank, row:row + 4, column:column + 4] = True
+        self.stale = True
+
+    def invalidate(self):
+        self.dirty[:] = True
+        self.stale = True
+
+    def tiles_changed(self, tiles):
+        # TileCache.refresh decoded these again
+        tiles = tiles[(tiles >> 8) == (self.table >> 8)] & 0xFF
+        if len(tiles):
+            self.dirty |= numpy.isin(self.names, tiles)
+            self.stale = True
+
+    def refresh(self, table):
+        if table != self.table:
+            self.table = table
+            self.dirty[:] = True
+        banks, rows, columns = numpy.nonzero(self.dirty)
+        bases = banks * 0x400
+        vram = self.vram
+        tiles = vram[bases + (rows << 5) + columns].astype(numpy.intp) + table
+        attributes = vram[bases + 0x3C0 + ((rows >> 2) << 3) + (columns >> 2)]
+        high = (attributes >> (((rows & 2) << 1) | (columns & 2))) & 3
+        colors = self.tile_cache.tiles[0, tiles]
+        self.blocks[banks, rows, :, columns, :] = numpy.where(
+            colors, colors | (high << 2)[:, None, None], 0)
+        self.dirty[:] = False
+        self.stale = False
+
+    def line(self, left, right, y, start):
+        # 256 pixels from start on line y of nametable left, running on
+        # into right
+        return numpy.concatenate((self.layer[left, y, start:], self.layer[right, y, :start]))
+
+
+class PPU(object):
+    # The 2C02 behind $2000-$2007, for NESMemory. It keeps 4K of nametable
+    # RAM (2K used unless the cartridge has four screens), palette RAM and
+    # OAM, and reads pattern data through the mapper's chr_pages into a
+    # TileCache.
+    #
+    # Scanlines are drawn whole, with numpy, when the line starts: the
+    # background is sliced out of a BackgroundLayer at the scroll in v, and
+    # up to 8 sprites are laid over it. Scroll writes made during a line
+    # show from the next one. frame holds the palette index (0-63) of every
+    # pixel, rgb() converts.
+    #
+    # Only every render_every-th frame is drawn. The lines of the others
+    # keep their side effects, the scroll, sprite overflow and sprite 0
+    # hit, which looks at sprite 0 and the background under it alone.
+    #
+    # attach() puts the PPU on a CPU and its scheduler. Timing is counted
+    # in dots, three to a master cycle, and lines are run lazily: catch_up
+    # runs every line that has started by the cycle it is given. Register
+    # accesses catch up to their cycle stamp first, and one scheduler event
+    # waits for the next line the CPU could notice without touching the
+    # PPU: vblank, which raises NMI when PPUCTRL asks for it, the pre-render
+    # line, lines where sprite 0 may hit or sprites may overflow, and the
+    # line where the mapper's scanline counter fires. The mapper is clocked
+    # once on each rendered line and on the pre-render line, as the
+    # MMC3 sees A12 rise once a line while rendering is on.
+
+    def __init__(self):
+        self.vram = numpy.zeros(0x1000, dtype=numpy.uint8)
+        self.palette = numpy.zeros(0x20, dtype=numpy.uint8)
+        self.oam = numpy.zeros(0x100, dtype=numpy.uint8)
+        self.frame = numpy.zeros((HEIGHT, WIDTH), dtype=numpy.uint8)
+        # CHR RAM until a cartridge is connected
+        self.chr_pages = [memoryview(bytearray(0x400)) for slot in range(8)]
+        self.chr_ram = True
+        self.tile_cache = TileCache()
+        self.chr = self.tile_cache.chr
+        self.background = BackgroundLayer(self.vram, self.tile_cache)
+        self.mapper = None
+        self.mirroring = HORIZONTAL
+        self.ctrl = 0
+        self.mask = 0
+        self.status = 0
+        self.oam_address = 0
+        # the internal scroll registers: current and temporary VRAM
+        # address, fine X scroll and the write toggle
+        self.v = 0
+        self.t = 0
+        self.x = 0
+        self.w = 0
+        self.read_buffer = 0
+        self.latch = 0
+        self.line = 0
+        self.line_cycle = NEVER  # when line starts
+        self.event = None
+        self.frames = 0
+        self.frame_dot = 0
+        self.render_every = 1
+        self.drawing = True
+        self.cpu = None
+        self.scheduler = None
+
+    def connect(self, mapper):
+        self.mapper = mapper
+        self.chr_pages = mapper.chr_pages
+        self.chr_ram = mapper.cartridge.chr_ram
+        mapper.chr_listeners.append(self.chr_switched)
+        mapper.irq_listeners.append(self.schedule_sync)
+        self.chr_switched(0, 8)
+
+    def attach(self, cpu, scheduler):
+        self.cpu = cpu
+        self.scheduler = scheduler
+        self.frame_dot = cpu.cycles * 3
+        self.line = 0
+        self.line_cycle = self.start_cycle(0)
+        self.schedule_sync()
+        return self
+
+    def chr_switched(self, first, end):
+        self.tile_cache.load(self.chr_pages, first, end)
+
+    def rendering(self):
+        return self.mask & (MASK_BACKGROUND | MASK_SPRITES)
+
+    # TIMING
+
+    def start_cycle(self, line):
+        return -(-(self.frame_dot + line * DOTS) // 3)
+
+    def catch_up(self, cycle):
+        while self.line_cycle <= cycle:
+            self.run_line()
+
+    def sync(self, cycle):
+        self.event = None
+        self.catch_up(cycle)
+        self.schedule_sync()
+
+    def schedule_sync(self):
+        if self.scheduler is None:
+            return
+        if self.event is not None:
+            self.scheduler.cancel(self.event)
+        self.event = self.scheduler.schedule(self.start_cycle(self.next_sync_line()), self.sync)
+
+    def next_sync_line(self):
+        line = self.line
+        if line >= HEIGHT:
+            return line
+        sync = VBLANK_LINE
+        if self.mask & MASK_SPRITES:
+            height = 16 if self.ctrl & CTRL_TALL_SPRITES else 8
+            tops = self.oam[0::4].astype(numpy.intp) + 1
+            status = self.status
+            if self.mask & MASK_BACKGROUND and not status & STATUS_SPRITE_ZERO:
+                first = max(int(tops[0]), line)
+                if first < tops[0] + height:
+                    sync = min(sync, first)
+            if not status & STATUS_OVERFLOW:
+                # sprites on each line, from where each starts and ends
+                counts = numpy.cumsum(numpy.bincount(tops, minlength=0x120) -
+                                      numpy.bincount(tops + height, minlength=0x120))
+                over = numpy.flatnonzero(counts[line:HEIGHT] > 8)
+                if len(over):
+                    sync = min(sync, line + int(over[0]))
+        if self.mapper is not None and self.rendering():
+            clocks = self.mapper.scanlines_to_irq()
+            if clocks is not None and line + clocks - 1 < sync:
+                sync = line + clocks - 1
+        return sync
+
+    def run_line(self):
+        line = self.line
+        if line < HEIGHT:
+            if self.drawing:
+                self.render_line(line)
+            else:
+                self.skip_line(line)
+            if self.mapper is not None and self.rendering():
+                self.mapper.clock_scanline()
+            self.line = line + 1 if line + 1 < HEIGHT else VBLANK_LINE
+        elif line == VBLANK_LINE:
+            self.start_vblank()
+            self.line = PRERENDER_LINE
+        else:
+            self.prerender()
+            if self.mapper is not None and self.rendering():
+                self.mapper.clock_scanline()
+            self.frame_dot += LINES * DOTS
+            self.line = 0
+        self.line_cycle = self.start_cycle(self.line)
+
+    def start_vblank(self):
+        self.status |= STATUS_VBLANK
+        self.frames += 1
+        if self.ctrl & CTRL_NMI and self.cpu is not None:
+            self.cpu.nmi()
+
+    def prerender(self):
+        self.status &= ~(STATUS_VBLANK | STATUS_SPRITE_ZERO | STATUS_OVERFLOW)
+        self.drawing = self.frames % self.render_every == 0
+        if self.rendering():
+            # the horizontal copy at dot 257 and the vertical ones after it
+            # leave all of t in v for line 0
+            self.v = self.t
+
+    def end_line(self):
+        # what the PPU does to v at dots 256 and 257 of a rendered line
+        v = self.v
+        if v & 0x7000 != 0x7000:
+            v += 0x1000
+        else:
+            v &= ~0x7000
+            coarse_y = (v >> 5) & 0x1F
+            if coarse_y == 29:
+                coarse_y = 0
+                v ^= 0x0800
+            elif coarse_y == 31:
+                coarse_y = 0
+            else:
+                coarse_y += 1
+            v = (v & ~0x03E0) | (coarse_y << 5)
+        self.v = (v & ~0x041F) | (self.t & 0x041F)
+
+    # REGISTERS
+
+    def read_register(self, cycle, register):
+        self.catch_up(cycle)
+        if register == 2:
+            value = self.status | (self.latch & 0x1F)
+            self.status &= ~STATUS_VBLANK
+            self.w = 0
+        elif register == 4:
+            value = int(self.oam[self.oam_address])
+        elif register == 7:
+            address = self.v & 0x3FFF
+            if address >= 0x3F00:
+                value = self.read_palette(address)
+                self.read_buffer = self.read_vram(address - 0x1000)
+            else:
+                value = self.read_buffer
+                self.read_buffer = self.read_vram(address)
+            self.increment()
+        else:
+            value = self.latch
+        self.latch = value
+        return value
+
+    def write_register(self, cycle, register, value):
+        self.catch_up(cycle)
+        self.latch = value
+        if register == 0:
+            if value & CTRL_NMI and not self.ctrl & CTRL_NMI and self.status & STATUS_VBLANK:
+                if self.cpu is not None:
+                    self.cpu.nmi()
+            self.ctrl = value
+            self.t = (self.t & 0x73FF) | ((value & 0x03) << 10)
+            # sprite height changes where sprites are
+            self.schedule_sync()
+        elif register == 1:
+            self.mask = value
+            self.schedule_sync()
+        elif register == 3:
+            self.oam_address = value
+        elif register == 4:
+            self.oam[self.oam_address] = value
+            self.oam_address = (self.oam_address + 1) & 0xFF
+            self.schedule_sync()
+        elif register == 5:
+            if self.w:
+                self.t = (self.t & 0x0C1F) | ((value & 0x07) << 12) | ((value >> 3) << 5)
+            else:
+                self.t = (self.t & 0x7FE0) | (value >> 3)
+                self.x = value & 0x07
+            self.w ^= 1
+        elif register == 6:
+            if self.w:
+                self.t = (self.t & 0x7F00) | value
+                self.v = self.t
+            else:
+                self.t = (self.t & 0x00FF) | ((value & 0x3F) << 8)
+            self.w ^= 1
+        elif register == 7:
+            self.write_vram(self.v & 0x3FFF, value)
+            self.increment()
+
+    def write_oam(self, cycle, data):
+        # OAM DMA fills from oam_address on, wrapping
+        self.catch_up(cycle)
+        data = numpy.frombuffer(data, dtype=numpy.uint8)
+        start = self.oam_address
+        self.oam[start:] = data[:0x100 - start]
+        self.oam[:start] = data[0x100 - start:]
+        self.schedule_sync()
+
+    def increment(self):
+        self.v = (self.v + (32 if self.ctrl & CTRL_INCREMENT_32 else 1)) & 0x7FFF
+
+    # PPU ADDRESS SPACE
+
+    def nametable_index(self, address):
+        banks = NAMETABLES[self.mapper.mirroring if self.mapper is not None else self.mirroring]
+        return banks[(address >> 10) & 3] * 0x400 + (address & 0x03FF)
+
+    def read_vram(self, address):
+        if address < 0x2000:
+            return int(self.chr[address])
+        if address < 0x3F00:
+            return int(self.vram[self.nametable_index(address)])
+        return self.read_palette(address)
+
+    def write_vram(self, address, value):
+        if address < 0x2000:
+            if self.chr_ram:
+                self.chr_pages[address >> 10][address & 0x03FF] = value
+                self.tile_cache.write(address, value)
+        elif address < 0x3F00:
+            index = self.nametable_index(address)
+            if self.vram[index] != value:
+                self.vram[index] = value
+                self.background.write(index, value)
+        else:
+            self.write_palette(address, value)
+
+    def read_palette(self, address):
+        return int(self.palette[address & 0x1F])
+
+    def write_palette(self, address, value):
+        entry = address & 0x1F
+        # the backdrop entries of the sprite palettes are the background's
+        if entry & 0x03 == 0:
+            self.palette[entry & 0x0F] = self.palette[entry | 0x10] = value & 0x3F
+        else:
+            self.palette[entry] = value & 0x3F
+
+    # RENDERING
+
+    def render_line(self, line):
+        mask = self.mask
+        if not mask & (MASK_BACKGROUND | MASK_SPRITES):
+            self.frame[line] = self.palette[0]
+            return
+        if self.tile_cache.stale:
+            self.background.tiles_changed(self.tile_cache.refresh())
+        if mask & MASK_BACKGROUND:
+            indexes = self.background_line()
+            if not mask & MASK_BACKGROUND_LEFT:
+                indexes[:8] = 0
+        else:
+            indexes = numpy.zeros(WIDTH, dtype=numpy.uint8)
+        if mask & MASK_SPRITES:
+            self.sprite_line(line, indexes)
+        pixels = self.palette[indexes]
+        if mask & MASK_GRAYSCALE:
+            pixels &= 0x30
+        self.frame[line] = pixels
+        self.end_line()
+
+    def skip_line(self, line):
+        mask = self.mask
+        if not mask & (MASK_BACKGROUND | MASK_SPRITES):
+            return
+        flags = STATUS_OVERFLOW | STATUS_SPRITE_ZERO
+        if mask & MASK_SPRITES and self.status & flags != flags:
+            found, rows, height = self.sprites_on_line(line)
+            if len(found) and found[0] == 0 and mask & MASK_BACKGROUND:
+                self.sprite_zero_hit(rows[0], height)
+        self.end_line()
+
+    def sprite_zero_hit(self, row, height):
+        # sprite 0 on this line, against the background alone
+        if self.status & STATUS_SPRITE_ZERO:
+            return
+        if self.tile_cache.stale:
+            self.background.tiles_changed(self.tile_cache.refresh())
+        pixels, attributes = self.sprite_row(0, int(row), height)
+        columns = int(self.oam[3]) + SPRITE_COLUMNS
+        left = 0 if self.mask & MASK_SPRITES_LEFT and self.mask & MASK_BACKGROUND_LEFT else 8
+        columns = columns[(pixels != 0) & (columns < WIDTH - 1) & (columns >= left)]
+        if len(columns) and self.background_line()[columns].any():
+            self.status |= STATUS_SPRITE_ZERO
+
+    def background_line(self):
+        # palette indexes of the 256 pixels of the line v points at, 0
+        # where the background is transparent
+        v = self.v
+        coarse_y = (v >> 5) & 0x1F
+        if coarse_y >= 30:
+            return self.attribute_row_line()
+        table = (self.ctrl & CTRL_BACKGROUND_TABLE) << 4
+        background = self.background
+        if background.stale or table != background.table:
+            background.refresh(table)
+        nametable = (v >> 10) & 3
+        banks = NAMETABLES[self.mapper.mirroring if self.mapper is not None else self.mirroring]
+        return background.line(banks[nametable], banks[nametable ^ 1],
+                               (coarse_y << 3) | (v >> 12), ((v & 0x1F) << 3) | self.x)
+
+    def attribute_row_line(self):
+        # scrolled into rows 30 and 31, which the layer does not have: the
+        # PPU draws the attribute bytes there as tiles
+        v = self.v
+        coarse_y = (v >> 5) & 0x1F
+        nametable = (v >> 10) & 3
+        columns = (v & 0x1F) + TILE_COLUMNS
+        # crossing column 32 moves to the next nametable across
+        tables = (nametable & 2) | ((nametable & 1) ^ ((columns >> 5) & 1))
+        columns &= 0x1F
+        bases = NAMETABLE_BANKS[self.mapper.mirroring if self.mapper is not None
+                                else self.mirroring][tables]
+        vram = self.vram
+        tiles = vram[bases + (coarse_y << 5) + columns].astype(numpy.intp)
+        attributes = vram[bases + 0x3C0 + ((coarse_y >> 2) << 3) + (columns >> 2)]
+        high = (attributes >> (((coarse_y & 2) << 1) | (columns & 2))) & 3
+        if self.ctrl & CTRL_BACKGROUND_TABLE:
+            tiles += 0x100
+        colors = self.tile_cache.tiles[0, tiles, v >> 12]
+        indexes = numpy.where(colors, colors | (high << 2)[:, None], 0).astype(numpy.uint8)
+        return indexes.reshape(-1)[self.x:self.x + WIDTH].copy()
+
+    def sprites_on_line(self, line):
+        # OAM indexes of the sprites on line, in priority order; sprites
+        # show one line below their Y
+        height = 16 if self.ctrl & CTRL_TALL_SPRITES else 8
+        rows = line - 1 - self.oam[0::4].astype(numpy.intp)
+        found = numpy.flatnonzero((rows >= 0) & (rows < height))
+        if len(found) > 8:
+            self.status |= STATUS_OVERFLOW
+            found = found[:8]
+        return found, rows, height
+
+    def sprite_row(self, sprite, row, height):
+        # the 8 two bit pixels of one sprite on one line, flips applied
+        oam = self.oam
+        tile = int(oam[sprite * 4 + 1])
+        attributes = int(oam[sprite * 4 + 2])
+        flip = attributes >> 6
+        if height == 16:
+            # flipped vertically, the bottom tile comes first
+            tile = ((tile & 1) << 8) | (tile & 0xFE) | ((row >> 3) ^ (flip >> 1))
+        elif self.ctrl & CTRL_SPRITE_TABLE:
+            tile |= 0x100
+        return self.tile_cache.sprite_row(flip, tile, row & 7), attributes
+
+    def sprite_line(self, line, indexes):
+        found, rows, height = self.sprites_on_line(line)
+        if not len(found):
+            return
+        oam = self.oam
+        left = 0 if self.mask & MASK_SPRITES_LEFT else 8
+        background = indexes.copy()
+        # lowest OAM index wins, so draw from the back; one behind the
+        # background still hides the sprites after it
+        for sprite in found[::-1]:
+            pixels, attributes = self.sprite_row(sprite, int(rows[sprite]), height)
+            x = int(oam[sprite * 4 + 3])
+            columns = x + SPRITE_COLUMNS
+            keep = (pixels != 0) & (columns < WIDTH) & (columns >= left)
+            if not keep.any():
+                continue
+            columns = columns[keep]
+            pixels = pixels[keep]
+            under = background[columns]
+            if sprite == 0 and self.mask & MASK_BACKGROUND and not self.status & STATUS_SPRITE_ZERO:
+                if ((under != 0) & (columns != 255)).any():
+                    self.status |= STATUS_SPRITE_ZERO
+            shown = pixels.astype(numpy.uint8) | 0x10 | ((attributes & 3) << 2)
+            if attributes & 0x20:
+                # behind the background: only where it is transparent
+                shown = numpy.where(under == 0, shown, under)
+            indexes[columns] = shown
+
+    def rgb(self):
+        return NES_PALETTE[self.frame]
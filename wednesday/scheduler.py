@@ -0,0 +1,61 @@
+from __future__ import print_function
+import heapq
+import itertools
+
+from wednesday.cpu6502 import NEVER
+
+
+class Scheduler(object):
+    # Device events on the master clock, CPU.cycles, which only ever counts
+    # up. Events sit in a min-heap of [cycle, sequence, callback]; the
+    # callback gets the cycle it was due at and schedules its next event
+    # itself, e.g. a PPU scheduling vblank a frame after the last one.
+    #
+    # The attached CPU's next_event_cycle is kept at or below the earliest
+    # event, so its run loop compares one integer per instruction and only
+    # calls run_due when something is due.
+
+    def __init__(self):
+        self.heap = []
+        self.sequence = itertools.count()
+        self.next_cycle = NEVER
+        self.cpu = None
+
+    def attach(self, cpu):
+        self.cpu = cpu
+        cpu.scheduler = self
+        cpu.update_next_event()
+        return self
+
+    def schedule(self, cycle, callback):
+        # returns a handle for cancel()
+        event = [cycle, next(self.sequence), callback]
+        heapq.heappush(self.heap, event)
+        if cycle < self.next_cycle:
+            self.next_cycle = cycle
+            cpu = self.cpu
+            if cpu is not None and cycle < cpu.next_event_cycle:
+                cpu.next_event_cycle = cycle
+        return event
+
+    def schedule_in(self, cycles, callback):
+        return self.schedule(self.now() + cycles, callback)
+
+    def cancel(self, event):
+        # left in the heap and skipped when it comes up
+        event[2] = None
+
+    def now(self):
+        return self.cpu.cycles if self.cpu is not None else 0
+
+    def run_due(self, cycle):
+        # callbacks may schedule more events, including ones already due
+        heap = self.heap
+        while heap and heap[0][0] <= cycle:
+            due, sequence, callback = heapq.heappop(heap)
+            if callback is not None:
+                callback(due)
+        self.next_cycle = heap[0][0] if heap else NEVER
+
+    def __len__(self):
+        return sum(1 for event in self.heap if event[2] is not None)
@@ -0,0 +1,77 @@
+from unittest import TestCase
+
+from wednesday.apple_video import (
+    AppleVideo, HIRES, TEXT_OFF, hires_line_address, text_row_address)
+from wednesday.cpu6502 import CPU, Memory
+
+
+class AppleVideoTest(TestCase):
+
+    def setUp(self):
+        self.memory = Memory()
+        # a character ROM where every glyph is its screen code in all 8 lines
+        rom = bytearray(code for code in range(0x100) for line in range(8))
+        self.video = AppleVideo(self.memory, rom).attach()
+        self.video.render()
+
+    def dirty_rows(self):
+        return [row for row, flag in enumerate(self.video.text_dirty[0]) if flag]
+
+    def test_text_row_addresses(self):
+        self.assertEqual(0x0400, text_row_address(0))
+        self.assertEqual(0x0480, text_row_address(1))
+        self.assertEqual(0x0428, text_row_address(8))
+        self.assertEqual(0x07D0, text_row_address(23))
+
+    def test_hires_line_addresses(self):
+        self.assertEqual(0x2000, hires_line_address(0))
+        self.assertEqual(0x2400, hires_line_address(1))
+        self.assertEqual(0x2080, hires_line_address(8))
+        self.assertEqual(0x3FD0, hires_line_address(191))
+
+    def test_write_marks_row(self):
+        self.memory.write_byte(0, 0x0480, 0xC1)
+        self.assertEqual([1], self.dirty_rows())
+        self.assertEqual(0xC1, self.memory.read_byte(0, 0x0480))
+
+    def test_screen_holes_are_not_dirty(self):
+        self.memory.write_byte(0, 0x0478, 0xC1)
+        self.assertEqual([], self.dirty_rows())
+
+    def test_render_only_dirty_rows(self):
+        self.memory.write_byte(0, 0x0480, 0x01)
+        self.video.frame[:] = 0x55
+        frame = self.video.render()
+        # row 1, first cell: the glyph for 0x01 has only its leftmost pixel lit
+        self.assertEqual([0xFF, 0, 0, 0, 0, 0, 0], list(frame[8, :7]))
+        self.assertTrue((frame[:8] == 0x55).all())
+        self.assertTrue((frame[16:] == 0x55).all())
+        self.assertEqual([], self.dirty_rows())
+
+    def test_hires(self):
+        self.memory.read_byte(0, TEXT_OFF)
+        self.memory.read_byte(0, HIRES)
+        self.memory.write_byte(0, 0x2400, 0x81)
+        frame = self.video.render()
+        self.assertEqual([0xFF, 0, 0, 0, 0, 0, 0], list(frame[1, :7]))
+        self.assertFalse(frame[0].any())
+
+    def test_mode_switch_redraws(self):
+        self.memory.read_byte(0, TEXT_OFF)
+        self.assertEqual(list(range(24)), self.dirty_rows())
+
+    def test_screen_text(self):
+        # HI, written by a program
+        self.memory.load(0x0800, [0xA9, 0xC8, 0x8D, 0x00, 0x04,
+                                  0xA9, 0xC9, 0x8D, 0x01, 0x04])
+        self.memory.rom.load(0xFFFC, [0x00, 0x08])
+        CPU(None, self.memory).run_instructions(4)
+        self.assertEqual('HI', self.video.screen_text()[0][:2])
+
+    def test_tick_renders_once_per_frame(self):
+        self.memory.write_byte(0, 0x0400, 0x01)
+        self.video.tick(17029)
+        self.assertEqual([0], self.dirty_rows())
+        self.video.tick(1)
+        self.assertEqual(1, self.video.frames)
+        self.assertEqual([], self.dirty_rows())
@@ -0,0 +1,65 @@
+import socket
+from unittest import TestCase
+
+from wednesday.bus import BusV1, BusV2
+from wednesday.bus_server import LatencyHistogram, load_client, start_server_thread
+
+
+class LatencyHistogramTest(TestCase):
+
+    def test_buckets(self):
+        histogram = LatencyHistogram()
+        for microseconds in [0, 1, 3, 100, 100, 100]:
+            histogram.record(microseconds / 1e6)
+        self.assertEqual([1, 1, 1], histogram.counts[:3])
+        self.assertEqual(3, histogram.counts[7])
+        self.assertEqual(4e-6, histogram.percentile(50))
+        self.assertEqual(128e-6, histogram.percentile(60))
+
+    def test_merge(self):
+        a, b = LatencyHistogram(), LatencyHistogram()
+        a.record(1e-6)
+        b.record(1e-6)
+        a.merge(b)
+        self.assertEqual(2, a.count)
+        self.assertEqual(2, a.counts[1])
+
+
+class BusServerTest(TestCase):
+
+    def setUp(self):
+        self.server = start_server_thread()
+        self.addCleanup(self.server.thread.join)
+        self.addCleanup(self.server.stop.set)
+
+    def connect(self, bus_class):
+        sock = socket.create_connection(('127.0.0.1', self.server.port))
+        self.addCleanup(sock.close)
+        return bus_class(sock)
+
+    def test_v1(self):
+        bus = self.connect(BusV1)
+        bus.write(0, 0xC030, 0x42)
+        self.assertEqual(0x42, bus.read(1, 0xC030))
+
+    def test_v2(self):
+        bus = self.connect(BusV2)
+        for address in range(0x0400, 0x0800):
+            bus.write(0, address, address & 0xFF)
+        self.assertEqual(0xFF, bus.read(1, 0x07FF))
+        self.assertEqual(1, bus.stats.round_trips)
+        self.assertEqual(0x400, self.server.writes)
+
+    def test_connections_at_once(self):
+        buses = [self.connect(BusV2) for n in range(8)]
+        for n, bus in enumerate(buses):
+            bus.write(0, 0x2000 + n, n)
+        self.assertEqual(list(range(8)),
+                         [bus.read(0, 0x2000 + n) for n, bus in enumerate(buses)])
+
+    def test_load_client(self):
+        latency = LatencyHistogram()
+        stats = load_client('127.0.0.1', self.server.port, 2, 0.05, latency)
+        self.assertTrue(latency.count > 0)
+        self.assertEqual(latency.count, stats.round_trips)
+        self.assertTrue(self.server.latency.count > 0)
@@ -0,0 +1,172 @@
+import socket
+import threading
+from unittest import TestCase
+
+from wednesday.bus import (
+    BusError, BusV1, BusV2, FrameParser, SharedMemoryBus, SharedMemoryDevice)
+from wednesday.cpu6502 import CPU, Memory
+from wednesday.translator import BlockCPU
+
+
+class BusTestMixin(object):
+
+    def setUp(self):
+        self.cpu_end, self.device_end = socket.socketpair()
+        self.parser = FrameParser()
+
+    def tearDown(self):
+        self.cpu_end.close()
+        self.device_end.close()
+
+    def device_events(self):
+        # everything sent so far, as the device sees it
+        self.device_end.setblocking(False)
+        events = []
+        try:
+            while True:
+                data = self.device_end.recv(65536)
+                if not data:
+                    break
+                events.extend(self.parser.feed(data))
+        except socket.error:
+            pass
+        return events
+
+    def test_writes_and_read(self):
+        self.bus.write(1, 0x0400, 0xC1)
+        self.bus.write(2, 0x0401, 0xC2)
+        self.device_end.sendall(b'\x42')
+        self.assertEqual(0x42, self.bus.read(3, 0xC000))
+        self.assertEqual([('write', 1, 0x0400, 0xC1),
+                          ('write', 2, 0x0401, 0xC2),
+                          ('read', 3, 0xC000)], self.device_events())
+        self.assertEqual(1, self.bus.stats.round_trips)
+
+    def test_closed(self):
+        self.device_end.close()
+        self.assertRaises(BusError, self.bus.read, 0, 0xC000)
+
+
+class BusV1Test(BusTestMixin, TestCase):
+
+    def setUp(self):
+        super(BusV1Test, self).setUp()
+        self.bus = BusV1(self.cpu_end)
+
+    def test_one_send_per_access(self):
+        for address in range(0x0400, 0x0410):
+            self.bus.write(0, address, 0xA0)
+        self.assertEqual(16, self.bus.stats.sends)
+        self.assertEqual(16 * 8, self.bus.stats.bytes_sent)
+
+
+class BusV2Test(BusTestMixin, TestCase):
+
+    def setUp(self):
+        super(BusV2Test, self).setUp()
+        self.bus = BusV2(self.cpu_end, batch_size=8, flush_cycles=100)
+
+    def test_writes_wait_for_a_read(self):
+        self.bus.write(0, 0x0400, 0xA0)
+        self.assertEqual([], self.device_events())
+        self.device_end.setblocking(True)
+        self.device_end.sendall(b'\x00')
+        self.bus.read(0, 0xC000)
+        # the upgrade, then the writes and the read in one send
+        self.assertEqual(2, self.bus.stats.sends)
+
+    def test_full_batch_is_sent(self):
+        for address in range(0x0400, 0x0410):
+            self.bus.write(address, address, 0xA0)
+        events = self.device_events()
+        self.assertEqual([('write', address, address, 0xA0)
+                          for address in range(0x0400, 0x0410)], events)
+        self.assertEqual(3, self.bus.stats.sends)
+
+    def test_cycle_budget(self):
+        self.bus.write(0, 0x0400, 0xA0)
+        self.bus.tick(99)
+        self.assertEqual([], self.device_events())
+        self.bus.tick(1)
+        self.assertEqual([('write', 0, 0x0400, 0xA0)], self.device_events())
+
+    def test_idle_ticks_do_not_count(self):
+        self.bus.tick(1000)
+        self.bus.write(0, 0x0400, 0xA0)
+        self.bus.tick(50)
+        self.assertEqual([], self.device_events())
+
+    def test_run_loops_drive_the_budget(self):
+        for cpu_class in [CPU, BlockCPU]:
+            memory = Memory(bus=self.bus)
+            # STA $0400 / JMP $0303
+            memory.load(0x0300, bytearray([0x8D, 0x00, 0x04, 0x4C, 0x03, 0x03]))
+            cpu = cpu_class(None, memory)
+            cpu.program_counter = 0x0300
+            cpu.run_cycles(50)
+            self.assertEqual([], self.device_events())
+            cpu.run_cycles(50)
+            self.assertEqual([('write', 4, 0x0400, 0x00)], self.device_events())
+
+    def test_stats_per_emulated_second(self):
+        self.bus.write(0, 0x0400, 0xA0)
+        self.bus.flush()
+        self.bus.tick(1023000)
+        rates = self.bus.stats.per_emulated_second()
+        self.assertEqual(1, rates['writes'])
+        self.assertEqual(2, rates['sends'])
+
+
+class FrameParserTest(TestCase):
+
+    def test_split_messages(self):
+        parser = FrameParser()
+        data = b'\x01\x00\x00\x00\x01\x00\x04\xa0' * 2
+        self.assertEqual([], parser.feed(data[:5]))
+        self.assertEqual([('write', 1, 0x0400, 0xA0)] * 2, parser.feed(data[5:]))
+
+
+class SharedMemoryBusTest(TestCase):
+
+    def setUp(self):
+        self.bus = SharedMemoryBus(capacity=4)
+        self.device = SharedMemoryDevice(self.bus.name)
+
+    def tearDown(self):
+        self.device.close()
+        self.bus.close()
+
+    def test_writes(self):
+        self.bus.write(1, 0x0400, 0xC1)
+        self.bus.write(2, 0x0401, 0xC2)
+        self.assertEqual([('write', 1, 0x0400, 0xC1),
+                          ('write', 2, 0x0401, 0xC2)], self.device.poll())
+        self.assertEqual([], self.device.poll())
+
+    def test_reads_come_from_the_register_window(self):
+        self.device.set_register(0xC000, 0xC1)
+        self.assertEqual(0xC1, self.bus.read(3, 0xC000))
+        self.assertEqual([('read', 3, 0xC000)], self.device.poll())
+        self.assertEqual(0, self.bus.stats.round_trips)
+
+    def test_ring_wraps(self):
+        for n in range(3):
+            for address in range(4):
+                self.bus.write(n, address, n)
+            self.assertEqual([('write', n, address, n) for address in range(4)],
+                             self.device.poll())
+
+    def test_full_ring_waits_for_the_device(self):
+        for address in range(4):
+            self.bus.write(0, address, 0)
+        thread = threading.Timer(0.01, self.device.poll)
+        thread.start()
+        self.bus.write(0, 0x0004, 0)
+        thread.join()
+        self.assertEqual([('write', 0, 0x0004, 0)], self.device.poll())
+
+    def test_stalled_device(self):
+        self.bus.timeout = 0.01
+        for address in range(4):
+            self.bus.write(0, address, 0)
+        self.assertRaises(BusError, self.bus.write, 0, 0x0004, 0)
@@ -1,6 +1,9 @@
+import threading
 from unittest import TestCase
 from unittest import skip
 
+from py65.devices.mpu6502 import MPU
+from wednesday import cpu6502
 from wednesday.cpu6502 import *
 from wednesday.tests.cpu_6502_spec import CPU6502Spec
 
@@ -36,13 +39,16 @@ class CPUTest(CPU6502Spec, TestCase):
 
         self.memory = BasicMemory()
         self.options = Options()
-        self.cpu = CPU(self.options, self.memory)
+        self.cpu = self.create_cpu()
 
         self.executor = self.cpu.run()
 
     def tearDown(self):
         pass
 
+    def create_cpu(self):
+        return CPU(self.options, self.memory)
+
     def cpu_pc(self, counter):
         self.cpu.program_counter = counter
 
@@ -95,3 +101,265 @@ class CPUTest(CPU6502Spec, TestCase):
     @skip('TODO')
     def test_lda_absolute_x_2(self):
         pass
+
+
+class DispatchTableTest(TestCase):
+
+    def test_table_is_shared_between_instances(self):
+        cpu1 = CPU(None, BasicMemory())
+        cpu2 = CPU(None, BasicMemory())
+        self.assertIs(cpu1.dispatch_table(), cpu2.dispatch_table())
+
+    def test_table_is_built_per_class(self):
+        class OtherCPU(CPU):
+            OPCODES = {0xEA: ('NOP', 'implied')}
+
+        table = OtherCPU.dispatch_table()
+        self.assertIsNot(CPU.dispatch_table(), table)
+        self.assertEqual(1, len([h for h in table if h is not None]))
+
+    def test_handlers_cover_opcodes(self):
+        table = CPU.dispatch_table()
+        for opcode in range(0x100):
+            self.assertEqual(opcode in CPU.OPCODES, table[opcode] is not None)
+
+    def test_handlers_take_the_cpu(self):
+        cpu = CPU(None, BasicMemory())
+        cpu.program_counter = 0x0200
+        cpu.bus.write_byte(0, 0x0200, 0x42)
+        cpu.dispatch_table()[0xA9](cpu)
+        self.assertEqual(0x42, cpu.accumulator)
+        self.assertEqual(0x0201, cpu.program_counter)
+
+
+class StatusRegisterTest(TestCase):
+
+    def setUp(self):
+        self.cpu = CPU(None, BasicMemory())
+
+    def test_flags_are_views_of_p(self):
+        self.cpu.status_from_byte(0x00)
+        self.cpu.carry_flag = True
+        self.cpu.sign_flag = 1
+        self.assertEqual(0x01 | 0x20 | 0x80, self.cpu.status_as_byte())
+        self.cpu.carry_flag = False
+        self.assertEqual(0, self.cpu.carry_flag)
+        self.assertEqual(1, self.cpu.sign_flag)
+
+    def test_status_round_trip(self):
+        for status in range(0x100):
+            self.cpu.status_from_byte(status)
+            self.assertEqual(status | 0x20, self.cpu.status_as_byte())
+
+    def test_nz_flags_table(self):
+        self.assertEqual(ZERO, NZ_FLAGS[0x00])
+        self.assertEqual(0, NZ_FLAGS[0x01])
+        self.assertEqual(NEGATIVE, NZ_FLAGS[0x80])
+        self.assertEqual(ZERO | CARRY, NZC_FLAGS[0x100])
+        self.assertEqual(NEGATIVE | CARRY, NZC_FLAGS[0x1FF])
+
+    def test_update_nz_keeps_other_flags(self):
+        self.cpu.status_from_byte(0xFF)
+        self.assertEqual(0x01, self.cpu.update_nz(0x101))
+        self.assertEqual(0xFF & ~(ZERO | NEGATIVE), self.cpu.status_as_byte())
+
+
+class ArithmeticTablesTest(TestCase):
+
+    def setUp(self):
+        self.cpu = CPU(None, BasicMemory())
+        self.mpu = MPU()
+
+    def assertSameAsPy65(self, op, py65_op, status, operands):
+        for a in operands:
+            for m in operands:
+                self.cpu.status_from_byte(status)
+                self.cpu.accumulator = a
+                self.cpu.bus.write_byte(0, 0x0010, m)
+                getattr(self.cpu, op)(0x0010)
+
+                self.mpu.p = status | 0x20
+                self.mpu.a = a
+                self.mpu.memory[0x0010] = m
+                getattr(self.mpu, py65_op)(lambda: 0x0010)
+
+                self.assertEqual((self.mpu.a, self.mpu.p),
+                                 (self.cpu.accumulator, self.cpu.status_as_byte()),
+                                 (op, status, a, m))
+
+    def test_binary_adc(self):
+        for status in [0x30, 0x31]:
+            self.assertSameAsPy65('ADC', 'opADC', status, range(0x100))
+
+    def test_binary_sbc(self):
+        for status in [0x30, 0x31]:
+            self.assertSameAsPy65('SBC', 'opSBC', status, range(0x100))
+
+    def test_decimal_adc(self):
+        bcd = [(hi << 4) | lo for hi in range(10) for lo in range(10)]
+        for status in [0x38, 0x39]:
+            self.assertSameAsPy65('ADC', 'opADC', status, bcd)
+
+    def test_decimal_sbc(self):
+        bcd = [(hi << 4) | lo for hi in range(10) for lo in range(10)]
+        for status in [0x38, 0x39]:
+            self.assertSameAsPy65('SBC', 'opSBC', status, bcd)
+
+    def test_tables_follow_decimal_flag(self):
+        self.assertIs(ADC_TABLE, self.cpu.adc_table)
+        self.cpu.SED()
+        self.assertIsNot(ADC_TABLE, self.cpu.adc_table)
+        self.cpu.status_from_byte(0x30)
+        self.assertIs(SBC_TABLE, self.cpu.sbc_table)
+        self.cpu.decimal_mode_flag = True
+        self.assertIsNot(SBC_TABLE, self.cpu.sbc_table)
+
+    def test_decimal_program(self):
+        # SED / CLC / LDA #$19 / ADC #$01 / BRK
+        self.cpu.bus.load(0x0200, [0xF8, 0x18, 0xA9, 0x19, 0x69, 0x01])
+        self.cpu.program_counter = 0x0200
+        executor = self.cpu.run()
+        for i in range(4):
+            next(executor)
+        self.assertEqual(0x20, self.cpu.accumulator)
+        self.assertEqual(0, self.cpu.carry_flag)
+
+    def test_decimal_tables_built_from_threads(self):
+        cpu6502._decimal_tables = None
+        cpus = [CPU(None, BasicMemory()) for n in range(4)]
+        threads = [threading.Thread(target=cpu.SED) for cpu in cpus]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(2, len(decimal_tables()))
+        for cpu in cpus:
+            # $19 + $01 in BCD
+            cpu.accumulator = 0x19
+            cpu.bus.write_byte(0, 0x0010, 0x01)
+            cpu.ADC(0x0010)
+            self.assertEqual(0x20, cpu.accumulator)
+
+
+class BatchExecutionTest(TestCase):
+
+    def setUp(self):
+        self.memory = BasicMemory()
+        self.cpu = CPU(None, self.memory)
+        # LOOP: INX / BNE LOOP / BRK
+        self.memory.load(0x0200, [0xE8, 0xD0, 0xFD, 0x00])
+        self.cpu.program_counter = 0x0200
+
+    def test_run_instructions(self):
+        self.assertEqual(2 + 3 + 2, self.cpu.run_instructions(3))
+        self.assertEqual(0x0201, self.cpu.program_counter)
+        self.assertEqual(2, self.cpu.x_index)
+        self.assertEqual(7, self.cpu.total_cycles)
+
+    def test_run_cycles_stops_at_budget(self):
+        # the instruction that crosses the budget is completed
+        self.assertEqual(10, self.cpu.run_cycles(9))
+        self.assertEqual(2, self.cpu.x_index)
+
+    def test_run_until(self):
+        cycles = self.cpu.run_until(0x0203, 100000)
+        self.assertEqual(0x0203, self.cpu.program_counter)
+        self.assertEqual(0, self.cpu.x_index)
+        self.assertEqual(255 * 5 + 4, cycles)
+
+    def test_run_until_gives_up_after_max_cycles(self):
+        self.assertEqual(100, self.cpu.run_until(0x0300, 100))
+        self.assertNotEqual(0x0300, self.cpu.program_counter)
+
+    def test_breakpoints(self):
+        self.cpu.breakpoints = set([0x0201])
+        self.assertEqual(2, self.cpu.run_cycles(1000))
+        self.assertEqual(0x0201, self.cpu.program_counter)
+        # a breakpoint at the current PC stops before anything runs
+        self.assertEqual(0, self.cpu.run_cycles(1000))
+
+    def test_unknown_op_is_left_at_pc(self):
+        self.memory.load(0x0200, [0x02])
+        self.assertEqual(0, self.cpu.run_cycles(1000))
+        self.assertEqual(0x0200, self.cpu.program_counter)
+
+
+class RegisterFileTest(TestCase):
+
+    def test_no_instance_dict(self):
+        cpu = CPU(None, BasicMemory())
+        self.assertFalse(hasattr(cpu, '__dict__'))
+        with self.assertRaises(AttributeError):
+            cpu.accumulater = 0x01
+
+    def test_tables_are_shared(self):
+        cpu1 = CPU(None, BasicMemory())
+        cpu2 = CPU(None, BasicMemory())
+        self.assertIs(cpu1.adc_table, cpu2.adc_table)
+        self.assertIs(cpu1.breakpoints, cpu2.breakpoints)
+
+
+class MemoryFastPathTest(TestCase):
+
+    def setUp(self):
+        self.log = []
+        self.memory = MemoryMap()
+        self.ram = bytearray(0x0800)
+        self.memory.map_ram(0x0000, self.ram)
+        self.memory.map_device(
+            0x2000, 0x0100,
+            read=lambda cycle, address: self.log.append((cycle, address)) or 0x42,
+            write=lambda cycle, address, value: self.log.append((cycle, address, value)))
+        rom = bytearray(0x1000)
+        rom[0x0FFC:0x0FFE] = b'\x00\x02'
+        self.memory.map_rom(0xF000, rom)
+        self.cpu = CPU(None, self.memory)
+
+    def test_shares_the_page_table(self):
+        self.assertIs(self.memory.read_pages, self.cpu.read_pages)
+        self.assertEqual(0x0200, self.cpu.program_counter)
+
+    def test_ram_and_stack(self):
+        # LDA #$07 / STA $10 / PHA / LDX $10 / PLA
+        self.ram[0x0200:0x0208] = bytearray([0xA9, 0x07, 0x85, 0x10, 0x48, 0xA6, 0x10, 0x68])
+        self.cpu.run_instructions(5)
+        self.assertEqual(0x07, self.ram[0x10])
+        self.assertEqual(0x07, self.ram[0x01FF])
+        self.assertEqual(0x07, self.cpu.x_index)
+        self.assertEqual([], self.log)
+
+    def test_returns_wrap_the_stack_pointer(self):
+        # RTS, and RTI, to PHA at $0300 with the return address across the
+        # top of the stack page
+        self.ram[0x0200] = 0x60
+        self.ram[0x0210] = 0x40
+        self.ram[0x0300] = 0x48
+        for pc, sp, stack in [(0x0200, 0xFE, [0xFF, 0x02]),
+                              (0x0200, 0xFF, [0xFF, 0x02]),
+                              (0x0210, 0xFE, [0x00, 0x00, 0x03]),
+                              (0x0210, 0xFF, [0x00, 0x00, 0x03])]:
+            for n, value in enumerate(stack):
+                self.ram[0x0100 + (sp + 1 + n) % 0x100] = value
+            self.cpu.program_counter = pc
+            self.cpu.stack_pointer = sp
+            self.cpu.accumulator = 0x42
+            self.cpu.run_instructions(2)
+            top = (sp + len(stack)) & 0xFF
+            self.assertEqual(0x42, self.ram[0x0100 + top])
+            self.assertEqual((top - 1) & 0xFF, self.cpu.stack_pointer)
+
+    def test_io_pages_go_to_the_bus(self):
+        # LDA $2001 / STA $2002
+        self.ram[0x0200:0x0206] = bytearray([0xAD, 0x01, 0x20, 0x8D, 0x02, 0x20])
+        self.cpu.run_instructions(2)
+        # stamped with the master clock
+        self.assertEqual([(4, 0x2001), (8, 0x2002, 0x42)], self.log)
+
+    def test_indirect_wraps_in_zero_page(self):
+        # LDA ($FF), y
+        self.ram[0xFF] = 0x00
+        self.ram[0x00] = 0x03
+        self.ram[0x0300] = 0x42
+        self.ram[0x0200:0x0202] = bytearray([0xB1, 0xFF])
+        self.cpu.run_instructions(1)
+        self.assertEqual(0x42, self.cpu.accumulator)
@@ -0,0 +1,213 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from wednesday.cpu6502 import CPU, MemoryMap
+from wednesday.ines import (
+    Cartridge, INESError, HORIZONTAL, VERTICAL, SINGLE_LOW, CNROM, MMC1, MMC3, NROM, UxROM)
+from wednesday.translator import BlockCPU
+
+
+def ines_image(prg_banks, chr_banks, mapper=0, flags6=0):
+    # every 8K of PRG starts with its number, every 1K of CHR too
+    header = bytearray(b'NES\x1a') + bytearray([
+        prg_banks, chr_banks, ((mapper & 0x0F) << 4) | flags6, mapper & 0xF0]) + bytearray(8)
+    prg = bytearray(prg_banks * 0x4000)
+    for bank in range(prg_banks * 2):
+        prg[bank * 0x2000] = bank
+    # reset vector into the last bank
+    prg[-4:-2] = bytearray([0x00, 0xE0])
+    chr = bytearray(chr_banks * 0x2000)
+    for bank in range(chr_banks * 8):
+        chr[bank * 0x400] = bank
+    return bytes(header + prg + chr)
+
+
+class CartridgeTest(TestCase):
+
+    def test_header(self):
+        cartridge = Cartridge(ines_image(2, 1, mapper=0x42, flags6=0x01))
+        self.assertEqual(0x42, cartridge.mapper_number)
+        self.assertEqual(VERTICAL, cartridge.mirroring)
+        self.assertEqual(0x8000, len(cartridge.prg))
+        self.assertEqual(0x2000, len(cartridge.chr))
+        self.assertFalse(cartridge.chr_ram)
+
+    def test_chr_ram(self):
+        cartridge = Cartridge(ines_image(1, 0))
+        self.assertTrue(cartridge.chr_ram)
+        self.assertFalse(cartridge.chr.readonly)
+
+    def test_bad_images(self):
+        self.assertRaises(INESError, Cartridge, b'NES')
+        self.assertRaises(INESError, Cartridge, b'SEN\x1a' + bytes(bytearray(12)))
+        self.assertRaises(INESError, Cartridge, ines_image(2, 1)[:-1])
+
+    def test_unsupported_mapper(self):
+        self.assertRaises(INESError, Cartridge(ines_image(1, 1, mapper=99)).mapper)
+
+    def test_open_maps_the_file(self):
+        fd, filename = tempfile.mkstemp(suffix='.nes')
+        os.write(fd, ines_image(2, 1, mapper=2))
+        os.close(fd)
+        self.addCleanup(os.remove, filename)
+        cartridge = Cartridge.open(filename)
+        self.assertIsInstance(cartridge.mapper(), UxROM)
+        self.assertTrue(cartridge.prg.readonly)
+        self.assertEqual(3, cartridge.prg[3 * 0x2000])
+
+
+class MapperTestMixin(object):
+
+    def attach(self, prg_banks, chr_banks, mapper):
+        self.memory = MemoryMap()
+        self.mapper = Cartridge(ines_image(prg_banks, chr_banks, mapper)).mapper().attach(self.memory)
+        self.chr_changes = []
+        self.mapper.chr_listeners.append(lambda first, end: self.chr_changes.append((first, end)))
+
+    def prg(self):
+        # bank number at $8000, $A000, $C000 and $E000
+        return [self.memory.read_byte(0, address) for address in range(0x8000, 0x10000, 0x2000)]
+
+    def chr(self):
+        return [page[0] for page in self.mapper.chr_pages]
+
+
+class NROMTest(MapperTestMixin, TestCase):
+
+    def test_16k_is_mirrored(self):
+        self.attach(1, 1, 0)
+        self.assertEqual([0, 1, 0, 1], self.prg())
+
+    def test_32k(self):
+        self.attach(2, 1, 0)
+        self.assertEqual([0, 1, 2, 3], self.prg())
+        self.assertEqual(0xE000, self.memory.read_word(0, 0xFFFC))
+
+    def test_prg_ram_and_rom_writes(self):
+        self.attach(1, 1, 0)
+        self.memory.write_byte(0, 0x6000, 0x42)
+        self.memory.write_byte(0, 0x8000, 0x42)
+        self.assertEqual(0x42, self.memory.read_byte(0, 0x6000))
+        self.assertEqual(0, self.memory.read_byte(0, 0x8000))
+
+
+class UxROMTest(MapperTestMixin, TestCase):
+
+    def test_switch(self):
+        self.attach(8, 0, 2)
+        self.assertEqual([0, 1, 14, 15], self.prg())
+        self.memory.write_byte(0, 0x8000, 3)
+        self.assertEqual([6, 7, 14, 15], self.prg())
+
+
+class CNROMTest(MapperTestMixin, TestCase):
+
+    def test_switch(self):
+        self.attach(2, 4, 3)
+        self.memory.write_byte(0, 0x8000, 2)
+        self.assertEqual(list(range(16, 24)), self.chr())
+        self.assertEqual([(0, 8)], self.chr_changes)
+
+
+class MMC1Test(MapperTestMixin, TestCase):
+
+    def write(self, address, value):
+        for bit in range(5):
+            self.memory.write_byte(0, address, (value >> bit) & 1)
+
+    def test_power_on(self):
+        self.attach(8, 2, 1)
+        self.assertEqual([0, 1, 14, 15], self.prg())
+
+    def test_prg_switch(self):
+        self.attach(8, 2, 1)
+        self.write(0xE000, 5)
+        self.assertEqual([10, 11, 14, 15], self.prg())
+
+    def test_32k_mode(self):
+        self.attach(8, 2, 1)
+        self.write(0x8000, 0x00)
+        self.write(0xE000, 3)
+        self.assertEqual([4, 5, 6, 7], self.prg())
+        self.assertEqual(SINGLE_LOW, self.mapper.mirroring)
+
+    def test_chr_4k_mode(self):
+        self.attach(8, 2, 1)
+        self.write(0x8000, 0x1F)
+        self.write(0xA000, 3)
+        self.write(0xC000, 0)
+        self.assertEqual([12, 13, 14, 15, 0, 1, 2, 3], self.chr())
+        self.assertEqual(HORIZONTAL, self.mapper.mirroring)
+
+    def test_reset_bit(self):
+        self.attach(8, 2, 1)
+        self.memory.write_byte(0, 0x8000, 1)
+        self.memory.write_byte(0, 0x8000, 0x80)
+        self.write(0xE000, 2)
+        self.assertEqual([4, 5, 14, 15], self.prg())
+
+
+class MMC3Test(MapperTestMixin, TestCase):
+
+    def select(self, register, bank):
+        self.memory.write_byte(0, 0x8000, register)
+        self.memory.write_byte(0, 0x8001, bank)
+
+    def test_power_on(self):
+        self.attach(4, 2, 4)
+        self.assertEqual([0, 1, 6, 7], self.prg())
+
+    def test_prg_banks(self):
+        self.attach(4, 2, 4)
+        self.select(6, 3)
+        self.select(7, 4)
+        self.assertEqual([3, 4, 6, 7], self.prg())
+        self.select(0x46, 3)
+        self.assertEqual([6, 4, 3, 7], self.prg())
+
+    def test_chr_banks(self):
+        self.attach(4, 2, 4)
+        self.select(0, 4)
+        self.select(2, 9)
+        self.assertEqual([4, 5, 2, 3, 9, 5, 6, 7], self.chr())
+        self.select(0x80, 4)
+        self.assertEqual([9, 5, 6, 7, 4, 5, 2, 3], self.chr())
+
+    def test_chr_listeners_see_only_changed_slots(self):
+        self.attach(4, 2, 4)
+        self.select(6, 3)
+        self.assertEqual([], self.chr_changes)
+        self.select(3, 9)
+        self.assertEqual([(5, 6)], self.chr_changes)
+
+    def test_irq_counter(self):
+        self.attach(4, 2, 4)
+        self.memory.write_byte(0, 0xC000, 2)
+        self.memory.write_byte(0, 0xC001, 0)
+        self.memory.write_byte(0, 0xE001, 0)
+        for n in range(3):
+            self.assertFalse(self.mapper.irq_pending)
+            self.mapper.clock_scanline()
+        self.assertTrue(self.mapper.irq_pending)
+        self.memory.write_byte(0, 0xE000, 0)
+        self.assertFalse(self.mapper.irq_pending)
+
+
+class BankSwitchedCodeTest(TestCase):
+
+    def test_translated_blocks_follow_the_bank(self):
+        # each UxROM bank at $8000 holds LDA #bank / STA $8000 / JMP $8000
+        image = bytearray(ines_image(4, 0, mapper=2))
+        for bank in range(3):
+            offset = 16 + bank * 0x4000
+            image[offset:offset + 8] = bytearray(
+                [0xA9, bank + 1, 0x8D, 0x00, 0x80, 0x4C, 0x00, 0x80])
+        memory = MemoryMap()
+        Cartridge(bytes(image)).mapper().attach(memory)
+        for cpu_class in [CPU, BlockCPU]:
+            memory.write_byte(0, 0x8000, 0)
+            cpu = cpu_class(None, memory)
+            cpu.program_counter = 0x8000
+            cpu.run_instructions(9) if cpu_class is CPU else cpu.run_cycles(3 * 9)
+            self.assertEqual(3, cpu.accumulator)
@@ -0,0 +1,53 @@
+from unittest import TestCase
+
+from wednesday.cpu6502 import BasicMemory, CPU
+from wednesday.lazy_flags import LazyFlagsCPU
+from wednesday.tests import cpu_test
+
+
+class LazyFlagsCPUSpecTest(cpu_test.CPUTest):
+
+    def create_cpu(self):
+        return LazyFlagsCPU(self.options, self.memory)
+
+
+class LazyFlagsTest(TestCase):
+
+    def setUp(self):
+        self.cpu = LazyFlagsCPU(None, BasicMemory())
+
+    def test_status_round_trip(self):
+        for status in range(0x100):
+            self.cpu.status_from_byte(status)
+            self.assertEqual(status | 0x20, self.cpu.status_as_byte())
+
+    def test_flags_follow_last_result(self):
+        self.cpu.update_nzc(0x180)
+        self.assertEqual(1, self.cpu.carry_flag)
+        self.assertEqual(1, self.cpu.sign_flag)
+        self.assertEqual(0, self.cpu.zero_flag)
+        self.cpu.update_nz(0x100)
+        self.assertEqual(1, self.cpu.carry_flag)
+        self.assertEqual(0, self.cpu.sign_flag)
+        self.assertEqual(1, self.cpu.zero_flag)
+
+    def test_matches_eager_flags(self):
+        # every ALU result against the eager implementation
+        eager = CPU(None, BasicMemory())
+        for cpu in [eager, self.cpu]:
+            cpu.bus.load(0x0000, list(range(0x100)))
+        for a in range(0, 0x100, 7):
+            for m in range(0x100):
+                for flags in [0x00, 0x01, 0x08, 0x09]:
+                    for op in ['ADC', 'SBC', 'CMP', 'BIT', 'AND', 'ROL', 'ROR']:
+                        for cpu in [eager, self.cpu]:
+                            cpu.status_from_byte(0x30 | flags)
+                            cpu.accumulator = a
+                            if op in ['ROL', 'ROR']:
+                                getattr(cpu, op)()
+                            else:
+                                getattr(cpu, op)(m)
+                        self.assertEqual(eager.accumulator, self.cpu.accumulator)
+                        self.assertEqual(eager.status_as_byte(),
+                                         self.cpu.status_as_byte(),
+                                         (op, a, m, flags))
@@ -0,0 +1,224 @@
+import os
+import sys
+import tempfile
+from unittest import TestCase
+
+from wednesday.bus import BusError
+from wednesday.cpu6502 import BasicMemory, CPU, Memory, MemoryMap, RAM, ROM
+from wednesday.translator import BlockCPU
+
+
+class ROMTest(TestCase):
+
+    def setUp(self):
+        self.rom = ROM(0xD000, 0x3000)
+
+    def test_load(self):
+        self.rom.load(0xD010, [0x01, 0x02, 0x03])
+        self.assertEqual(0x01, self.rom.read_byte(0xD010))
+        self.assertEqual(0x03, self.rom.read_byte(0xD012))
+        self.assertEqual(0x00, self.rom.read_byte(0xD013))
+
+    def test_load_bytes(self):
+        self.rom.load(0xFFFC, b'\x00\xd0')
+        self.assertEqual(0xD0, self.rom.read_byte(0xFFFD))
+
+    def test_load_file(self):
+        fd, filename = tempfile.mkstemp()
+        try:
+            os.write(fd, bytes(bytearray(range(0x10))))
+            os.close(fd)
+            self.assertEqual(0x10, self.rom.load_file(0xE000, filename))
+        finally:
+            os.remove(filename)
+        self.assertEqual(0x0F, self.rom.read_byte(0xE00F))
+
+    def test_view_is_zero_copy_and_read_only(self):
+        view = self.rom.view()
+        self.rom.load(0xD000, [0x42])
+        self.assertEqual(0x42, view[0])
+        self.assertTrue(view.readonly)
+
+    def test_buffer_protocol(self):
+        if sys.version_info < (3, 12):
+            self.skipTest('Python classes export buffers from 3.12')
+        self.rom.load(0xD001, [0x42])
+        self.assertEqual(0x42, memoryview(self.rom)[1])
+
+    def test_size(self):
+        self.assertEqual(0x3000, len(self.rom.view()))
+
+
+class RAMTest(TestCase):
+
+    def test_write_byte_is_relative_to_start(self):
+        ram = RAM(0x0200, 0x100)
+        ram.write_byte(0x0201, 0x42)
+        self.assertEqual(0x42, ram.read_byte(0x0201))
+
+    def test_view_is_writable(self):
+        memory = BasicMemory()
+        memory.view()[0x1234] = 0x42
+        self.assertEqual(0x42, memory.read_byte(0, 0x1234))
+
+
+class MemoryMapTest(TestCase):
+
+    def setUp(self):
+        self.memory = MemoryMap()
+        self.ram = bytearray(0x0800)
+        self.memory.map_ram(0x0000, self.ram)
+
+    def test_ram(self):
+        self.memory.write_byte(0, 0x0123, 0x42)
+        self.assertEqual(0x42, self.ram[0x0123])
+        self.assertEqual(0x42, self.memory.read_byte(0, 0x0123))
+
+    def test_mirror(self):
+        for start in range(0x0800, 0x2000, 0x0800):
+            self.memory.map_ram(start, self.ram)
+        self.memory.write_byte(0, 0x1801, 0x42)
+        self.assertEqual(0x42, self.memory.read_byte(0, 0x0001))
+        self.assertEqual(0x42, self.memory.read_byte(0, 0x0801))
+
+    def test_rom_ignores_writes(self):
+        rom = bytearray(0x4000)
+        rom[0x3FFC:0x3FFE] = b'\x00\xc0'
+        self.memory.map_rom(0xC000, memoryview(rom).toreadonly())
+        self.memory.write_byte(0, 0xFFFC, 0x42)
+        self.assertEqual(0xC000, self.memory.read_word(0, 0xFFFC))
+
+    def test_bank_switch(self):
+        banks = bytearray(0x8000)
+        banks[0x4000] = 0x01
+        self.memory.map_rom(0x8000, banks, 0x4000)
+        self.assertEqual(0x00, self.memory.read_byte(0, 0x8000))
+        self.memory.map_rom(0x8000, memoryview(banks)[0x4000:])
+        self.assertEqual(0x01, self.memory.read_byte(0, 0x8000))
+
+    def test_device(self):
+        log = []
+        self.memory.map_device(
+            0x2000, 0x0100,
+            read=lambda cycle, address: address & 0xFF,
+            write=lambda cycle, address, value: log.append((cycle, address, value)))
+        self.memory.write_byte(7, 0x2001, 0x42)
+        self.assertEqual([(7, 0x2001, 0x42)], log)
+        self.assertEqual(0x05, self.memory.read_byte(0, 0x2005))
+
+    def test_device_watching_writes(self):
+        log = []
+        self.memory.map_device(0x0400, 0x0400,
+                               write=lambda cycle, address, value: log.append(address))
+        self.memory.write_byte(0, 0x0400, 0x42)
+        self.assertEqual([0x0400], log)
+        self.ram[0x0401] = 0x43
+        self.assertEqual(0x43, self.memory.read_byte(0, 0x0401))
+
+    def test_unmapped(self):
+        self.memory.write_byte(0, 0x9000, 0x42)
+        self.assertEqual(0x00, self.memory.read_byte(0, 0x9000))
+        self.memory.unmap(0x0000, 0x0100)
+        self.assertEqual(0x00, self.memory.read_byte(0, 0x0000))
+
+    def test_read_word_across_pages(self):
+        self.ram[0x00FF] = 0x34
+        self.ram[0x0100] = 0x12
+        self.ram[0x0000] = 0x56
+        self.assertEqual(0x1234, self.memory.read_word(0, 0x00FF))
+        self.assertEqual(0x5634, self.memory.read_word_bug(0, 0x00FF))
+
+    def test_unaligned_ranges(self):
+        self.assertRaises(AssertionError, self.memory.map_ram, 0x0010, self.ram)
+
+    def test_load(self):
+        self.memory.load(0x0200, [0x01, 0x02])
+        self.assertEqual(0x0201, self.memory.read_word(0, 0x0200))
+
+    def test_device_reads_have_side_effects(self):
+        self.memory.map_device(0x2000, 0x0100, read=lambda cycle, address: 0)
+        self.assertTrue(self.memory.read_has_side_effects(0x2000))
+        self.assertTrue(self.memory.read_has_side_effects(0x9000))
+        self.assertFalse(self.memory.read_has_side_effects(0x0100))
+
+
+class RecordingBus(object):
+
+    def __init__(self, value=0x00):
+        self.value = value
+        self.log = []
+
+    def read(self, cycle, address):
+        self.log.append(('read', address))
+        return self.value
+
+    def write(self, cycle, address, value):
+        self.log.append(('write', address, value))
+
+    def tick(self, cycles):
+        pass
+
+
+class FailingBus(RecordingBus):
+
+    def read(self, cycle, address):
+        raise BusError('bus closed by the device')
+
+
+class AppleMemoryTest(TestCase):
+
+    def apple(self, bus, program, cpu_class=CPU):
+        memory = Memory(bus=bus)
+        memory.load(0x0800, program)
+        memory.rom.load(0xFFFC, [0x00, 0x08])
+        return cpu_class(None, memory)
+
+    def test_instances_have_their_own_bus(self):
+        bus1, bus2 = RecordingBus(0x01), RecordingBus(0x02)
+        # LDA $C000 / STA $0400
+        program = [0xAD, 0x00, 0xC0, 0x8D, 0x00, 0x04]
+        cpu1, cpu2 = self.apple(bus1, program), self.apple(bus2, program)
+        cpu1.run_instructions(2)
+        cpu2.run_instructions(2)
+        self.assertEqual([('read', 0xC000), ('write', 0x0400, 0x01)], bus1.log)
+        self.assertEqual([('read', 0xC000), ('write', 0x0400, 0x02)], bus2.log)
+
+    def test_without_a_bus(self):
+        # LDA $C000 / STA $0400
+        cpu = self.apple(None, [0xA9, 0x01, 0xAD, 0x00, 0xC0, 0x8D, 0x00, 0x04])
+        cpu.run_instructions(3)
+        self.assertEqual(0x00, cpu.accumulator)
+        self.assertFalse(cpu.bus.use_bus)
+
+    def test_bus_errors_reach_the_caller(self):
+        for cpu_class in [CPU, BlockCPU]:
+            # NOP / LDA $C000
+            cpu = self.apple(FailingBus(), [0xEA, 0xAD, 0x00, 0xC0], cpu_class)
+            self.assertRaises(BusError, cpu.run_cycles, 100)
+            # the clock keeps the cycles spent up to the failed read
+            self.assertEqual(6, cpu.total_cycles)
+
+
+    def test_read_side_effects(self):
+        memory = Memory()
+        self.assertFalse(memory.read_has_side_effects(0xC000))
+        self.assertFalse(memory.read_has_side_effects(0xC061))
+        for address in [0xC010, 0xC030, 0xC054, 0xC083, 0xC0EC, 0xC600]:
+            self.assertTrue(memory.read_has_side_effects(address), hex(address))
+        self.assertFalse(memory.read_has_side_effects(0x0400))
+        self.assertFalse(memory.read_has_side_effects(0xD000))
+
+    def test_disk_poll_is_not_idle(self):
+        # LDX #$60 / WAIT: LDA $C08C,X / BPL WAIT
+        cpu = self.apple(None, [0xA2, 0x60, 0xBD, 0x8C, 0xC0, 0x10, 0xFB], BlockCPU)
+        cpu.run_cycles(1000)
+        self.assertIn(0x0802, cpu.blocks)
+        self.assertNotIn(0x0802, cpu.idle_loops)
+
+    def test_layout(self):
+        memory = Memory()
+        memory.load(0x0300, [0x42])
+        memory.rom.load(0xFFFC, [0x00, 0xD0])
+        memory.write_byte(0, 0xFFFC, 0x42)
+        self.assertEqual(0x42, memory.read_byte(0, 0x0300))
+        self.assertEqual(0xD000, memory.read_word(0, 0xFFFC))
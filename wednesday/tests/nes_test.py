@@ -0,0 +1,133 @@
+from unittest import TestCase
+
+from nesasm.compiler import lexical, semantic, syntax, Cartridge as Assembly
+from wednesday.cpu6502 import CPU
+from wednesday.ines import Cartridge
+from wednesday.nes import NESMemory, RegisterFile
+from wednesday.tests.ines_test import ines_image
+
+
+class RecordingPPU(RegisterFile):
+
+    def __init__(self):
+        super(RecordingPPU, self).__init__(8)
+        self.writes = []
+
+    def write_register(self, cycle, register, value):
+        super(RecordingPPU, self).write_register(cycle, register, value)
+        self.writes.append((register, value))
+
+
+class NESMemoryTest(TestCase):
+
+    def setUp(self):
+        self.ppu = RecordingPPU()
+        self.memory = NESMemory(ppu=self.ppu)
+
+    def run_program(self, source):
+        cart = Assembly()
+        cart.set_org(0xC000)
+        code = semantic(syntax(lexical(source + '\n HALT: JMP HALT\n')), False, cart)
+        prg = bytearray(0x4000)
+        prg[:len(code)] = bytearray(code)
+        prg[0x3FFC:0x3FFE] = bytearray([0x00, 0xC0])
+        self.memory.map_rom(0xC000, prg)
+        cpu = CPU(None, self.memory)
+        cpu.run_until(0xC000 + len(code), 100000)
+        return cpu
+
+    def test_ram_mirrors_share_the_buffer(self):
+        self.memory.write_byte(0, 0x1801, 0x42)
+        for address in [0x0001, 0x0801, 0x1001, 0x1801]:
+            self.assertEqual(0x42, self.memory.read_byte(0, address))
+        self.assertIs(self.memory.read_pages[0x00].obj, self.memory.read_pages[0x18].obj)
+
+    def test_ppu_register_mirrors(self):
+        self.memory.write_byte(0, 0x3FF8, 0x80)
+        self.memory.write_byte(0, 0x2009, 0x1E)
+        self.assertEqual([(0, 0x80), (1, 0x1E)], self.ppu.writes)
+        self.assertEqual(0x80, self.memory.read_byte(0, 0x2000))
+
+    def test_io_registers(self):
+        self.memory.write_byte(0, 0x4017, 0x40)
+        self.assertEqual(0x40, self.memory.read_byte(0, 0x4017))
+        self.assertEqual(0x00, self.memory.read_byte(0, 0x4020))
+
+    def test_read_side_effects(self):
+        for address in [0x2007, 0x4015, 0x4016, 0x4017, 0x401F]:
+            self.assertTrue(self.memory.read_has_side_effects(address), hex(address))
+        for address in [0x0010, 0x2002, 0x4000, 0x4014, 0x4020]:
+            self.assertFalse(self.memory.read_has_side_effects(address), hex(address))
+
+    def test_oam_dma(self):
+        self.memory.ram[0x0200:0x0300] = bytearray(range(0x100))
+        self.memory.write_byte(0, 0x4014, 0x02)
+        self.assertEqual(bytearray(range(0x100)), self.ppu.oam)
+        self.assertEqual(513, self.memory.dma_cycles)
+
+    def test_cartridge(self):
+        mapper = self.memory.load_cartridge(Cartridge(ines_image(2, 1)))
+        self.assertEqual(0xE000, self.memory.read_word(0, 0xFFFC))
+        self.assertEqual(mapper.prg_ram, self.memory.read_pages[0x60].obj)
+
+    def test_reset(self):
+        cpu = self.run_program('''
+              SEI
+              CLD
+              LDX #$40
+              STX $4017
+              LDX #$FF
+              TXS
+              INX
+              STX $2000
+              STX $2001
+              STX $4010
+        ''')
+        self.assertEqual(0x40, self.memory.read_byte(0, 0x4017))
+        self.assertEqual([(0, 0x00), (1, 0x00)], self.ppu.writes)
+        self.assertEqual(0xFF, cpu.stack_pointer)
+
+    def test_clearmem(self):
+        self.memory.ram[:] = bytearray([0x55]) * 0x0800
+        self.run_program('''
+              LDX #$00
+            CLEARMEM:
+              LDA #$00
+              STA $0000, x
+              STA $0100, x
+              STA $0200, x
+              STA $0400, x
+              STA $0500, x
+              STA $0600, x
+              STA $0700, x
+              LDA #$FE
+              STA $0300, x
+              INX
+              BNE CLEARMEM
+        ''')
+        self.assertEqual(bytearray(0x300), self.memory.ram[:0x300])
+        self.assertEqual(bytearray([0xFE]) * 0x100, self.memory.ram[0x300:0x400])
+
+    def test_load_palettes(self):
+        cpu = self.run_program('''
+              LDA $2002
+              LDA #$3F
+              STA $2006
+              LDA #$00
+              STA $2006
+              LDX #$00
+            LOADPALETTES:
+              LDA palette, x
+              STA $2007
+              INX
+              CPX #32
+              BNE LOADPALETTES
+              JMP done
+            palette:
+              .db $0F,$01,$02,$03,$04,$05,$06,$07,$08,$09,$0A,$0B,$0C,$0D,$0E,$0F
+              .db $0F,$30,$31,$32,$33,$35,$36,$37,$38,$39,$3A,$3B,$3C,$3D,$3E,$0F
+            done:
+        ''')
+        self.assertEqual([(6, 0x3F), (6, 0x00)], self.ppu.writes[:2])
+        self.assertEqual(32, len([w for w in self.ppu.writes if w[0] == 7]))
+        self.assertEqual(32, cpu.x_index)
@@ -0,0 +1,643 @@
+from unittest import TestCase, skipIf
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from nesasm.compiler import lexical, semantic, syntax, Cartridge as Assembly
+from wednesday.cpu6502 import CPU
+from wednesday.ines import Cartridge, VERTICAL
+from wednesday.nes import NESMemory
+from wednesday.scheduler import Scheduler
+from wednesday.tests.ines_test import ines_image
+from wednesday.translator import BlockCPU
+
+if numpy is not None:
+    from wednesday.console import NES
+    from wednesday.ppu import PPU, TileCache, DOTS, HEIGHT, VBLANK_LINE
+
+
+def assemble(source, start):
+    cart = Assembly()
+    cart.set_org(start)
+    return bytearray(semantic(syntax(lexical(source)), False, cart))
+
+
+def nrom_image(main, nmi='RTI', chr_banks=0, irq='RTI', mapper=0):
+    # 16K of PRG at $C000 with main at the reset vector, nmi at $D000 and
+    # irq at $D800; MMC3 maps it there too at power on
+    prg = bytearray(0x4000)
+    code = assemble(main, 0xC000)
+    prg[:len(code)] = code
+    code = assemble(nmi, 0xD000)
+    prg[0x1000:0x1000 + len(code)] = code
+    code = assemble(irq, 0xD800)
+    prg[0x1800:0x1800 + len(code)] = code
+    prg[0x3FFA:0x4000] = bytearray([0x00, 0xD0, 0x00, 0xC0, 0x00, 0xD8])
+    header = bytearray(b'NES\x1a') + bytearray([1, chr_banks, (mapper & 0x0F) << 4, 0]) + bytearray(8)
+    return bytes(header + prg + bytearray(chr_banks * 0x2000))
+
+
+@skipIf(numpy is None, 'needs numpy')
+class PPURegisterTest(TestCase):
+
+    def setUp(self):
+        self.ppu = PPU()
+
+    def write(self, register, *values):
+        for value in values:
+            self.ppu.write_register(0, register, value)
+
+    def read(self, register):
+        return self.ppu.read_register(0, register)
+
+    def test_status_read_clears_vblank_and_the_toggle(self):
+        self.ppu.status = 0xC0
+        self.write(6, 0x21)
+        self.assertEqual(1, self.ppu.w)
+        self.assertEqual(0xC0, self.read(2) & 0xE0)
+        self.assertEqual(0x40, self.read(2) & 0xE0)
+        self.assertEqual(0, self.ppu.w)
+
+    def test_scroll_and_address_latches(self):
+        self.write(0, 0x02)
+        self.write(5, 0x7D, 0x5E)
+        self.assertEqual(5, self.ppu.x)
+        # coarse X 15, coarse Y 11, fine Y 6, second nametable across
+        self.assertEqual(0x6000 | 0x0800 | (11 << 5) | 15, self.ppu.t)
+        self.write(6, 0x3D, 0xF0)
+        self.assertEqual(0x3DF0, self.ppu.v)
+        self.assertEqual(0x3DF0, self.ppu.t)
+
+    def test_buffered_reads(self):
+        self.write(6, 0x20, 0x00)
+        self.write(7, 0x11, 0x22)
+        self.write(6, 0x20, 0x00)
+        # the first read gives the stale buffer
+        self.read(7)
+        self.assertEqual(0x11, self.read(7))
+        self.assertEqual(0x22, self.read(7))
+
+    def test_palette_reads_are_immediate_and_mirrored(self):
+        self.write(6, 0x3F, 0x10)
+        self.write(7, 0x2A)
+        self.assertEqual(0x2A, self.ppu.palette[0x00])
+        self.write(6, 0x3F, 0x00)
+        self.assertEqual(0x2A, self.read(7))
+        self.write(6, 0x3F, 0x25)
+        self.write(7, 0xFF)
+        self.assertEqual(0x3F, self.ppu.palette[0x05])
+
+    def test_increment_32(self):
+        self.write(0, 0x04)
+        self.write(6, 0x20, 0x01)
+        self.write(7, 0x01, 0x02)
+        self.assertEqual(0x2041, self.ppu.v)
+        self.assertEqual(0x02, self.ppu.vram[0x21])
+
+    def test_mirroring(self):
+        self.write(6, 0x24, 0x05)
+        self.write(7, 0x99)
+        # horizontal: $2400 is $2000
+        self.assertEqual(0x99, self.ppu.vram[0x005])
+        self.ppu.mirroring = VERTICAL
+        self.write(6, 0x2C, 0x06)
+        self.write(7, 0x77)
+        self.assertEqual(0x77, self.ppu.vram[0x406])
+
+    def test_oam(self):
+        self.write(3, 0x10)
+        self.write(4, 0xAB)
+        self.assertEqual(0xAB, self.ppu.oam[0x10])
+        self.assertEqual(0x11, self.ppu.oam_address)
+        self.ppu.write_oam(0, bytes(bytearray(range(0x100))))
+        # DMA starts at the OAM address and wraps
+        self.assertEqual(0, self.ppu.oam[0x11])
+        self.assertEqual(0xEF, self.ppu.oam[0x00])
+
+    def test_chr_rom_is_read_only(self):
+        # even when the image is in a writable buffer
+        memory = NESMemory(ppu=self.ppu)
+        cartridge = Cartridge(bytearray(ines_image(1, 1)))
+        memory.load_cartridge(cartridge)
+        self.write(6, 0x04, 0x00)
+        self.write(7, 0x55)
+        self.write(6, 0x04, 0x00)
+        self.read(7)
+        self.assertEqual(0x01, self.read(7))
+        self.assertEqual(0x01, cartridge.chr[0x400])
+
+
+@skipIf(numpy is None, 'needs numpy')
+class TileCacheTest(TestCase):
+
+    def setUp(self):
+        self.ppu = PPU()
+        self.cache = self.ppu.tile_cache
+        self.cache.refresh()
+
+    def test_decode(self):
+        # row 0 of tile 3: low plane 0xF0, high plane 0x3C
+        self.ppu.write_vram(0x0030, 0xF0)
+        self.ppu.write_vram(0x0038, 0x3C)
+        self.cache.refresh()
+        self.assertEqual([1, 1, 3, 3, 2, 2, 0, 0], list(self.cache.tiles[0, 3, 0]))
+        self.assertEqual([0, 0, 2, 2, 3, 3, 1, 1], list(self.cache.tiles[1, 3, 0]))
+        self.assertEqual([1, 1, 3, 3, 2, 2, 0, 0], list(self.cache.tiles[2, 3, 7]))
+        self.assertEqual([0, 0, 2, 2, 3, 3, 1, 1], list(self.cache.tiles[3, 3, 7]))
+
+    def test_chr_ram_writes_dirty_one_tile(self):
+        self.ppu.write_register(0, 6, 0x10)
+        self.ppu.write_register(0, 6, 0x25)
+        self.ppu.write_register(0, 7, 0xFF)
+        self.assertTrue(self.cache.stale)
+        self.assertEqual([0x102], list(numpy.flatnonzero(self.cache.dirty)))
+        self.cache.refresh()
+        self.assertFalse(self.cache.dirty.any())
+        self.assertEqual(1, self.cache.tiles[0, 0x102, 5, 0])
+
+    def test_bank_switch_dirties_its_slot(self):
+        # MMC3 with 8K of CHR ROM: R2 is the 1K bank at $1000
+        memory = NESMemory(ppu=self.ppu)
+        mapper = memory.load_cartridge(Cartridge(ines_image(2, 1, mapper=4)))
+        self.cache.refresh()
+        mapper.write(0, 0x8000, 2)
+        self.cache.dirty[:] = False
+        mapper.write(0, 0x8001, 7)
+        self.assertEqual(list(range(0x100, 0x140)), list(numpy.flatnonzero(self.cache.dirty)))
+        self.cache.refresh()
+        # every 1K of the image starts with its number
+        self.assertEqual(7, self.ppu.read_vram(0x1000))
+
+    def test_unflipped_cache(self):
+        cache = TileCache(flipped=False)
+        cache.write(0x0000, 0x80)
+        cache.refresh()
+        self.assertEqual((1, 0x200, 8, 8), cache.tiles.shape)
+        self.assertEqual(1, cache.sprite_row(0, 0, 0)[0])
+        self.assertEqual(1, cache.sprite_row(1, 0, 0)[7])
+        self.assertEqual(1, cache.sprite_row(3, 0, 7)[7])
+        self.assertEqual(0, cache.sprite_row(2, 0, 0).max())
+
+
+@skipIf(numpy is None, 'needs numpy')
+class BackgroundLayerTest(TestCase):
+
+    def setUp(self):
+        self.ppu = PPU()
+        self.ppu.mask = 0x0A
+        self.ppu.palette[:] = numpy.arange(0x20)
+        self.background = self.ppu.background
+        self.ppu.render_line(0)
+
+    def write(self, address, value):
+        self.ppu.write_vram(address, value)
+
+    def dirty(self):
+        return [tuple(int(n) for n in tile) for tile in numpy.argwhere(self.background.dirty)]
+
+    def test_nametable_and_attribute_writes(self):
+        self.write(0x2C45, 1)
+        self.assertEqual([(1, 2, 5)], self.dirty())
+        self.background.refresh(0)
+        self.write(0x2FC9, 0xFF)
+        self.assertEqual(16, len(self.dirty()))
+        self.assertEqual((1, 4, 4), self.dirty()[0])
+        self.assertEqual((1, 7, 7), self.dirty()[-1])
+
+    def test_unchanged_writes_dirty_nothing(self):
+        self.write(0x2000, 0)
+        self.assertFalse(self.background.stale)
+
+    def test_palette_writes_dirty_nothing(self):
+        self.ppu.write_vram(0x0000, 0x80)
+        self.ppu.render_line(0)
+        self.write(0x3F01, 0x16)
+        self.assertFalse(self.background.stale)
+        self.ppu.v = 0
+        self.ppu.render_line(0)
+        self.assertEqual(0x16, self.ppu.frame[0][0])
+
+    def test_pattern_changes_dirty_the_tiles_using_them(self):
+        self.write(0x2000, 5)
+        self.write(0x2400 + 0x100, 5)
+        self.background.refresh(0)
+        self.ppu.write_vram(0x1050, 0xFF)
+        self.ppu.write_vram(0x0050, 0xFF)
+        self.ppu.v = 0
+        self.ppu.render_line(0)
+        self.assertEqual(1, self.ppu.frame[0][0])
+        # the dirty tiles were drawn and nothing else
+        self.assertFalse(self.background.dirty.any())
+        self.assertEqual(1, self.background.layer[0, 64, 0])
+        self.assertEqual(0, self.background.layer[1, 0, 0])
+
+    def test_switching_pattern_tables(self):
+        self.write(0x2000, 1)
+        self.ppu.write_vram(0x1010, 0xFF)
+        self.ppu.render_line(0)
+        self.assertEqual(0, self.ppu.frame[0][0])
+        self.ppu.ctrl = 0x10
+        self.ppu.v = 0
+        self.ppu.render_line(0)
+        self.assertEqual(1, self.ppu.frame[0][0])
+
+    def test_lines_match_the_tiles(self):
+        random = numpy.random.RandomState(2)
+        ppu = PPU()
+        ppu.mask = 0x0A
+        ppu.mirroring = VERTICAL
+        ppu.chr[:] = random.randint(0, 0x100, 0x2000)
+        ppu.tile_cache.invalidate()
+        for address in range(0x2000, 0x2800):
+            ppu.write_vram(address, random.randint(0, 0x100))
+        ppu.render_line(0)
+        for n in range(200):
+            ppu.v = random.randint(0, 0x8000) & ~0x0200
+            ppu.x = random.randint(0, 8)
+            if (ppu.v >> 5) & 0x1F >= 30:
+                continue
+            self.assertEqual(list(ppu.attribute_row_line()), list(ppu.background_line()))
+
+
+@skipIf(numpy is None, 'needs numpy')
+class PPURenderTest(TestCase):
+
+    def setUp(self):
+        self.ppu = PPU()
+        # tile 1 is solid color 1, tile 2 has color 3 in its left column
+        self.ppu.chr[0x10:0x18] = 0xFF
+        self.ppu.chr[0x20:0x30] = 0x80
+        self.ppu.palette[:] = numpy.arange(0x20) + 0x20
+        self.ppu.mask = 0x1E
+
+    def test_backdrop_while_rendering_is_off(self):
+        self.ppu.mask = 0
+        self.ppu.render_line(0)
+        self.assertTrue((self.ppu.frame[0] == 0x20).all())
+
+    def test_background(self):
+        # tile 1 at column 3, row 0, palette 2 from the top right quadrant
+        self.ppu.vram[3] = 1
+        self.ppu.vram[0x3C0] = 0x08
+        self.ppu.render_line(0)
+        line = self.ppu.frame[0]
+        self.assertTrue((line[24:32] == 0x29).all())
+        self.assertEqual(0x20, line[23])
+        self.assertEqual(0x20, line[32])
+        self.assertEqual(0x1000, self.ppu.v)
+
+    def test_fine_x_scroll(self):
+        self.ppu.vram[3] = 1
+        self.ppu.x = 3
+        self.ppu.render_line(0)
+        self.assertTrue((self.ppu.frame[0][21:29] == 0x21).all())
+        self.assertEqual(0x20, self.ppu.frame[0][20])
+
+    def test_scroll_across_nametables(self):
+        self.ppu.mirroring = VERTICAL
+        self.ppu.vram[0x400] = 1
+        self.ppu.v = self.ppu.t = 31
+        self.ppu.render_line(0)
+        self.assertTrue((self.ppu.frame[0][8:16] == 0x21).all())
+
+    def test_left_clip(self):
+        self.ppu.vram[0] = 1
+        self.ppu.mask = 0x18
+        self.ppu.render_line(0)
+        self.assertTrue((self.ppu.frame[0][:8] == 0x20).all())
+
+    def test_sprites(self):
+        # sprite 1 at (10, 21) in palette 1, flipped horizontally
+        self.ppu.oam[:] = 0xFF
+        self.ppu.oam[4:8] = [20, 2, 0x41, 10]
+        self.ppu.render_line(21)
+        line = self.ppu.frame[21]
+        self.assertEqual(0x37, line[17])
+        self.assertEqual(0x20, line[10])
+        self.ppu.render_line(20)
+        self.assertEqual(0x20, self.ppu.frame[20][17])
+
+    def test_sprite_priority(self):
+        self.ppu.oam[:] = 0xFF
+        self.ppu.oam[0:4] = [0, 1, 0x20, 0]
+        self.ppu.oam[4:8] = [0, 1, 0x01, 4]
+        self.ppu.vram[0] = 2
+        self.ppu.render_line(1)
+        line = self.ppu.frame[1]
+        # sprite 0 is behind the background, and hides sprite 1 anyway
+        self.assertEqual(0x23, line[0])
+        self.assertEqual(0x31, line[1])
+        self.assertEqual(0x35, line[8])
+
+    def test_sprite_zero_hit_and_overflow(self):
+        self.ppu.oam[:] = 0xFF
+        self.ppu.vram[1] = 1
+        self.ppu.oam[0:4] = [0, 2, 0, 4]
+        self.ppu.render_line(1)
+        self.assertEqual(0, self.ppu.status & 0x60)
+        self.ppu.oam[0:4] = [0, 2, 0, 8]
+        self.ppu.render_line(1)
+        self.assertEqual(0x40, self.ppu.status & 0x60)
+        for n in range(1, 9):
+            self.ppu.oam[n * 4] = 0
+        self.ppu.render_line(1)
+        self.assertEqual(0x60, self.ppu.status & 0x60)
+
+    def test_tall_sprites(self):
+        self.ppu.ctrl = 0x20
+        self.ppu.oam[:] = 0xFF
+        # tile byte 1 is tiles 0 and 1 of the $1000 table, top and bottom
+        self.ppu.chr[0x1010:0x1018] = 0xFF
+        self.ppu.oam[0:4] = [0, 0x01, 0, 0x10]
+        self.ppu.render_line(1)
+        self.assertEqual(0x20, self.ppu.frame[1][0x10])
+        self.ppu.render_line(9)
+        self.assertEqual(0x31, self.ppu.frame[9][0x10])
+
+    def test_rgb(self):
+        self.ppu.render_line(0)
+        self.assertEqual((240, 256, 3), self.ppu.rgb().shape)
+
+
+@skipIf(numpy is None, 'needs numpy')
+class FrameSkipTest(TestCase):
+
+    def random_ppu(self, seed):
+        random = numpy.random.RandomState(seed)
+        ppu = PPU()
+        ppu.chr[:] = random.randint(0, 0x100, 0x2000) & random.randint(0, 0x100, 0x2000)
+        ppu.tile_cache.invalidate()
+        ppu.vram[:] = random.randint(0, 0x100, 0x1000)
+        ppu.oam[:] = random.randint(0, 0x100, 0x100)
+        ppu.ctrl = random.choice([0x00, 0x08, 0x10, 0x20, 0x38])
+        ppu.mask = random.choice([0x08, 0x10, 0x18, 0x1E])
+        ppu.v = ppu.t = random.randint(0, 0x8000)
+        ppu.x = random.randint(0, 8)
+        return ppu
+
+    def test_skipped_lines_keep_their_side_effects(self):
+        for seed in range(40):
+            drawn, skipped = self.random_ppu(seed), self.random_ppu(seed)
+            for line in range(HEIGHT):
+                drawn.render_line(line)
+                skipped.skip_line(line)
+                self.assertEqual((drawn.status, drawn.v), (skipped.status, skipped.v))
+            self.assertFalse(skipped.frame.any())
+
+    def test_render_every(self):
+        nes = NES(nrom_image(PPUTimingTest.MAIN, PPUTimingTest.NMI))
+        nes.ppu.render_every = 3
+        drawn = []
+        render_line = nes.ppu.render_line
+        nes.ppu.render_line = lambda line: drawn.append((nes.ppu.frames, line)) or render_line(line)
+        for frame in range(7):
+            nes.run_frame()
+        self.assertEqual(7, nes.memory.ram[0x10])
+        self.assertEqual([0, 3, 6], sorted(set(frame for frame, line in drawn)))
+        self.assertEqual(3 * HEIGHT, len(drawn))
+
+
+@skipIf(numpy is None, 'needs numpy')
+class PPUTimingTest(TestCase):
+
+    MAIN = '''
+          LDA #$80
+          STA $2000
+        LOOP:
+          JMP LOOP
+    '''
+
+    NMI = '''
+          INC $10
+          RTI
+    '''
+
+    def test_vblank_and_nmi_each_frame(self):
+        nes = NES(nrom_image(self.MAIN, self.NMI))
+        for frame in range(3):
+            nes.run_frame()
+        self.assertEqual(3, nes.ppu.frames)
+        self.assertEqual(3, nes.memory.ram[0x10])
+        # vblank started on line 241 of the third frame
+        vblank = (2 * 262 + VBLANK_LINE) * DOTS // 3
+        self.assertTrue(vblank <= nes.cpu.cycles < vblank + 1000 + 20)
+        self.assertEqual(0x80, nes.ppu.status & 0x80)
+
+    def test_waiting_for_vblank(self):
+        nes = NES(nrom_image('''
+            WAIT:
+              BIT $2002
+              BPL WAIT
+              INC $11
+              JMP WAIT
+        '''))
+        while nes.ppu.frames < 2:
+            nes.cpu.run_cycles(100)
+        nes.cpu.run_cycles(100)
+        self.assertEqual(2, nes.memory.ram[0x11])
+
+    def test_prerender_line_clears_status(self):
+        nes = NES(nrom_image(self.MAIN, self.NMI))
+        nes.run_frame()
+        nes.ppu.status |= 0x60
+        nes.cpu.run_cycles(262 * DOTS // 3 - VBLANK_LINE * DOTS // 3)
+        self.assertEqual(0, nes.ppu.status & 0xE0)
+
+    def test_prerender_line_copies_t_to_v(self):
+        ppu = PPU()
+        ppu.mask = 0x08
+        ppu.v, ppu.t = 0x2048, 0x0000
+        ppu.prerender()
+        self.assertEqual(0x0000, ppu.v)
+        ppu.v, ppu.t = 0x0000, 0x7C1F
+        ppu.prerender()
+        self.assertEqual(0x7C1F, ppu.v)
+        # with rendering off v is left alone
+        ppu.mask = 0
+        ppu.v = 0x2048
+        ppu.prerender()
+        self.assertEqual(0x2048, ppu.v)
+
+    def test_oam_dma_stalls_the_cpu(self):
+        nes = NES(nrom_image('''
+              LDA #$02
+              STA $4014
+            HALT:
+              JMP HALT
+        '''))
+        nes.cpu.run_instructions(2)
+        self.assertEqual(2 + 4 + 513, nes.cpu.cycles)
+        self.assertEqual(0, nes.memory.dma_cycles)
+
+
+if numpy is not None:
+    class LockstepPPU(PPU):
+        # an event at the start of every line, as a PPU run in step with
+        # the CPU would have
+
+        def next_sync_line(self):
+            return self.line
+
+
+@skipIf(numpy is None, 'needs numpy')
+class CatchUpTest(TestCase):
+
+    # a bar of tile 1 across the left half of row 12 with sprite 0 on it at
+    # line 100; every frame waits for the hit and scrolls the rest of it by
+    # the frame count
+    SPLIT = '''
+          LDA #$3F
+          STA $2006
+          LDA #$00
+          STA $2006
+          LDA #$0F
+          STA $2007
+          LDA #$30
+          STA $2007
+          LDA #$00
+          STA $2006
+          LDA #$10
+          STA $2006
+          LDX #$08
+          LDA #$FF
+        FILL:
+          STA $2007
+          DEX
+          BNE FILL
+          LDA #$21
+          STA $2006
+          LDA #$80
+          STA $2006
+          LDX #$10
+          LDA #$01
+        ROW:
+          STA $2007
+          DEX
+          BNE ROW
+          LDX #$00
+          LDA #$FF
+        HIDE:
+          STA $0200, x
+          INX
+          BNE HIDE
+          LDA #$63
+          STA $0200
+          LDA #$01
+          STA $0201
+          LDA #$00
+          STA $0202
+          LDA #$28
+          STA $0203
+          LDA #$00
+          STA $2005
+          STA $2005
+          LDA #$1E
+          STA $2001
+          LDA #$80
+          STA $2000
+        FRAME:
+          BIT $2002
+          BVS FRAME
+        NOHIT:
+          BIT $2002
+          BVC NOHIT
+          INC $11
+          LDA $11
+          STA $2005
+          LDA #$00
+          STA $2005
+          JMP FRAME
+    '''
+
+    NMI = '''
+          PHA
+          LDA #$02
+          STA $4014
+          LDA #$00
+          STA $2005
+          STA $2005
+          INC $10
+          PLA
+          RTI
+    '''
+
+    def test_matches_lockstep(self):
+        for cpu_class in [CPU, BlockCPU]:
+            lazy = NES(nrom_image(self.SPLIT, self.NMI), cpu_class)
+            lockstep = NES(nrom_image(self.SPLIT, self.NMI), cpu_class, LockstepPPU())
+            for frame in range(4):
+                lazy.run_frame()
+                lockstep.run_frame()
+                self.assertEqual(lockstep.memory.ram, lazy.memory.ram)
+                self.assertTrue((lockstep.ppu.frame == lazy.ppu.frame).all())
+            self.assertEqual(4, lazy.memory.ram[0x10])
+            self.assertEqual(3, lazy.memory.ram[0x11])
+            # the bar ends at 127 above the split, 3 pixels left below it
+            self.assertEqual([0x30, 0x0F], list(lazy.ppu.frame[100][127:129]))
+            self.assertEqual([0x30, 0x0F], list(lazy.ppu.frame[101][124:126]))
+
+    def test_lines_run_when_touched(self):
+        nes = NES(nrom_image(PPUTimingTest.MAIN, PPUTimingTest.NMI))
+        nes.cpu.run_cycles(2000)
+        # nothing to notice before vblank: only line 0, which had started
+        # when PPUCTRL was written, has run
+        self.assertEqual(1, nes.ppu.line)
+        self.assertEqual(1, len(nes.scheduler))
+        nes.memory.read_byte(nes.cpu.cycles, 0x2002)
+        self.assertEqual(nes.cpu.cycles * 3 // DOTS + 1, nes.ppu.line)
+
+    def test_sprite_zero_line_is_an_event(self):
+        nes = NES(nrom_image(self.SPLIT, self.NMI))
+        nes.run_frame()
+        nes.cpu.run_cycles(3000)
+        self.assertEqual(100, nes.ppu.next_sync_line())
+        nes.ppu.status |= 0x40
+        self.assertEqual(VBLANK_LINE, nes.ppu.next_sync_line())
+
+    # MMC3 counts 16 lines, the handler acknowledges and keeps the line
+    # each IRQ came on
+    MMC3_MAIN = '''
+          LDA #$10
+          STA $C000
+          STA $C001
+          STA $E001
+          LDA #$08
+          STA $2001
+          CLI
+        LOOP:
+          JMP LOOP
+    '''
+
+    MMC3_IRQ = '''
+          STA $E000
+          STA $E001
+          INC $10
+          RTI
+    '''
+
+    def test_mmc3_irq(self):
+        for cpu_class in [CPU, BlockCPU]:
+            image = nrom_image(self.MMC3_MAIN, irq=self.MMC3_IRQ, mapper=4)
+            lazy = NES(image, cpu_class)
+            lockstep = NES(image, cpu_class, LockstepPPU())
+            for frame in range(3):
+                lazy.run_frame()
+                lockstep.run_frame()
+                self.assertEqual(lockstep.memory.ram, lazy.memory.ram)
+                self.assertEqual(lockstep.cpu.cycles, lazy.cpu.cycles)
+            # an IRQ every 17 clocks, 241 clocks a frame
+            self.assertEqual(3 * 241 // 17, lazy.memory.ram[0x10])
+            self.assertEqual(set(), lazy.cpu.irq_sources)
+
+    def test_mapper_writes_catch_up(self):
+        ppu = PPU()
+        memory = NESMemory(ppu=ppu)
+        memory.load_cartridge(Cartridge(ines_image(2, 4, mapper=3)))
+        cpu = CPU(None, memory)
+        Scheduler().attach(cpu)
+        ppu.attach(cpu, cpu.scheduler)
+        memory.write_byte(400, 0x8000, 1)
+        self.assertEqual(4, ppu.line)
+        self.assertEqual(8, ppu.read_vram(0x0000))
@@ -0,0 +1,150 @@
+from unittest import TestCase
+
+from nesasm.compiler import lexical, semantic, syntax, Cartridge
+from wednesday.cpu6502 import CPU, MemoryMap, NEVER
+from wednesday.scheduler import Scheduler
+from wednesday.translator import BlockCPU
+
+
+class SchedulerTest(TestCase):
+
+    def setUp(self):
+        self.scheduler = Scheduler()
+        self.log = []
+
+    def event(self, name):
+        return lambda cycle: self.log.append((name, cycle))
+
+    def test_events_run_in_cycle_order(self):
+        self.scheduler.schedule(300, self.event('c'))
+        self.scheduler.schedule(100, self.event('a'))
+        self.scheduler.schedule(100, self.event('b'))
+        self.assertEqual(100, self.scheduler.next_cycle)
+        self.scheduler.run_due(200)
+        self.assertEqual([('a', 100), ('b', 100)], self.log)
+        self.assertEqual(300, self.scheduler.next_cycle)
+
+    def test_cancel(self):
+        event = self.scheduler.schedule(100, self.event('a'))
+        self.scheduler.cancel(event)
+        self.assertEqual(0, len(self.scheduler))
+        self.scheduler.run_due(100)
+        self.assertEqual([], self.log)
+        self.assertEqual(NEVER, self.scheduler.next_cycle)
+
+    def test_callbacks_reschedule(self):
+        def tick(cycle):
+            self.log.append(cycle)
+            self.scheduler.schedule(cycle + 100, tick)
+        self.scheduler.schedule(100, tick)
+        self.scheduler.run_due(350)
+        self.assertEqual([100, 200, 300], self.log)
+        self.assertEqual(400, self.scheduler.next_cycle)
+
+
+class InterruptTest(TestCase):
+    # 64K of RAM, with a device page at $4000 whose writes release the IRQ
+
+    NMI_HANDLER = 0x0300
+    IRQ_HANDLER = 0x0400
+
+    def machine(self, source, cpu_class=CPU):
+        self.ram = bytearray(0x10000)
+        memory = MemoryMap()
+        memory.map_ram(0x0000, self.ram)
+        memory.map_device(0x4000, 0x0100, write=self.device_write)
+        # NMI: INC $10 / RTI, IRQ: INC $11 / STA $4000 / RTI
+        self.ram[self.NMI_HANDLER:self.NMI_HANDLER + 3] = bytearray([0xE6, 0x10, 0x40])
+        self.ram[self.IRQ_HANDLER:self.IRQ_HANDLER + 6] = bytearray(
+            [0xE6, 0x11, 0x8D, 0x00, 0x40, 0x40])
+        self.ram[0xFFFA:0x10000] = bytearray([0x00, 0x03, 0x00, 0x02, 0x00, 0x04])
+        cart = Cartridge()
+        cart.set_org(0x0200)
+        code = semantic(syntax(lexical(source)), False, cart)
+        self.ram[0x0200:0x0200 + len(code)] = bytearray(code)
+        self.cpu = cpu_class(None, memory)
+        self.scheduler = Scheduler().attach(self.cpu)
+        return self.cpu
+
+    def device_write(self, cycle, address, value):
+        self.cpu.set_irq('device', False)
+
+    def each_cpu(self, source):
+        for cpu_class in [CPU, BlockCPU]:
+            yield self.machine(source, cpu_class)
+
+    def test_events_come_at_instruction_boundaries(self):
+        for cpu in self.each_cpu('''
+            LOOP:
+              INX
+              BNE LOOP
+              JMP LOOP
+        '''):
+            seen = []
+            self.scheduler.schedule(1000, lambda cycle: seen.append((cycle, cpu.cycles)))
+            self.assertTrue(2000 <= cpu.run_cycles(2000) < 2005)
+            self.assertEqual(1, len(seen))
+            due, now = seen[0]
+            self.assertEqual(1000, due)
+            self.assertTrue(1000 <= now < 1005)
+            self.assertEqual(NEVER, cpu.next_event_cycle)
+
+    def test_nmi(self):
+        for cpu in self.each_cpu('''
+            LOOP:
+              INX
+              JMP LOOP
+        '''):
+            self.scheduler.schedule(100, lambda cycle: cpu.nmi())
+            cpu.run_cycles(100)
+            self.assertEqual(0, self.ram[0x10])
+            # 7 cycles to take it, 5 for INC and 6 for RTI
+            self.assertEqual(18, cpu.run_instructions(2))
+            self.assertEqual(1, self.ram[0x10])
+            self.assertEqual(0xFF, cpu.stack_pointer)
+            self.assertIn(cpu.program_counter, (0x0200, 0x0201))
+
+    def test_nmi_pending_at_the_end_of_a_batch(self):
+        cpu = self.machine('''
+            LOOP:
+              JMP LOOP
+        ''')
+        cpu.run_cycles(10)
+        cpu.nmi()
+        self.assertEqual(cpu.cycles, cpu.next_event_cycle)
+        cpu.run_instructions(1)
+        self.assertEqual(self.NMI_HANDLER + 2, cpu.program_counter)
+
+    def test_irq_waits_for_cli(self):
+        for cpu in self.each_cpu('''
+              SEI
+              LDY #$10
+            WAIT:
+              DEY
+              BNE WAIT
+              CLI
+            LOOP:
+              JMP LOOP
+        '''):
+            self.scheduler.schedule(20, lambda cycle: cpu.set_irq('device'))
+            cpu.run_cycles(50)
+            self.assertEqual(0, self.ram[0x11])
+            cpu.run_cycles(200)
+            # taken once: the handler's store released the line
+            self.assertEqual(1, self.ram[0x11])
+            self.assertEqual(set(), cpu.irq_sources)
+            self.assertFalse(cpu.interrupt_disable_flag)
+
+    def test_interrupt_pushes_pc_and_status(self):
+        cpu = self.machine('''
+            LOOP:
+              JMP LOOP
+        ''')
+        cpu.interrupt_disable_flag = 0
+        cpu.set_irq('device')
+        cpu.run_instructions(1)
+        self.assertEqual(0x02, self.ram[0x01FF])
+        self.assertEqual(0x00, self.ram[0x01FE])
+        # B is clear in the pushed status, the unused bit set
+        self.assertEqual(0x20, self.ram[0x01FD] & 0x30)
+        self.assertTrue(cpu.interrupt_disable_flag)
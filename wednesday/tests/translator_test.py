@@ -0,0 +1,593 @@
+from unittest import TestCase
+
+from nesasm.compiler import lexical, semantic, syntax, Cartridge
+from wednesday.cpu6502 import BasicMemory, CPU
+from wednesday.nes import NESMemory
+from wednesday.scheduler import Scheduler
+from wednesday.translator import BlockCPU
+from wednesday.tests import cpu_test
+
+
+class BlockCPUSpecTest(cpu_test.CPUTest):
+    # one instruction per block, so every opcode goes through the translator
+
+    def create_cpu(self):
+        return BlockCPU(self.options, self.memory, max_block_instructions=1)
+
+    def memory_set(self, pos, val):
+        self.memory._mem[pos] = val
+        self.cpu.invalidate(pos)
+
+
+class BlockTranslatorTest(TestCase):
+
+    def assembly(self, source, start_addr=0):
+        cart = Cartridge()
+        if start_addr != 0:
+            cart.set_org(start_addr)
+        return semantic(syntax(lexical(source)), False, cart)
+
+    def load_program(self, code, cpu_class=BlockCPU, start_addr=0xC000):
+        memory = BasicMemory()
+        opcodes = self.assembly(code, start_addr)
+        memory.load(start_addr, opcodes)
+        cpu = cpu_class(None, memory)
+        cpu.program_counter = start_addr
+        # programs end with JMP HALT / HALT: JMP HALT
+        self.stop_addr = start_addr + len(opcodes) - 3
+        return cpu
+
+    def run_program(self, cpu):
+        cycles = cpu.run_until(self.stop_addr, 100000)
+        self.assertEqual(self.stop_addr, cpu.program_counter)
+        return cycles
+
+    def assertSameRun(self, code):
+        interpreted = self.load_program(code, CPU)
+        translated = self.load_program(code, BlockCPU)
+        cycles = self.run_program(interpreted)
+        self.assertEqual(cycles, self.run_program(translated))
+        for name in ['accumulator', 'x_index', 'y_index', 'stack_pointer',
+                     'program_counter', 'carry_flag', 'zero_flag',
+                     'overflow_flag', 'sign_flag']:
+            self.assertEqual(getattr(interpreted, name),
+                             getattr(translated, name), name)
+        self.assertEqual(interpreted.bus._mem, translated.bus._mem)
+        return translated
+
+    def test_block_ends_at_branch(self):
+        cpu = self.load_program('''
+            LOOP:
+              LDA #$01
+              INX
+              BNE LOOP
+        ''')
+        cycles, _ = next(cpu.run())
+        self.assertEqual(2 + 2 + 3, cycles)
+        self.assertEqual(0xC000, cpu.program_counter)
+        self.assertEqual([0xC000], list(cpu.blocks))
+
+    def test_blocks_are_cached(self):
+        cpu = self.load_program('''
+            LOOP:
+              INX
+              BNE LOOP
+              RTS
+        ''')
+        executor = cpu.run()
+        next(executor)
+        block = cpu.blocks[0xC000]
+        next(executor)
+        self.assertIs(block, cpu.blocks[0xC000])
+
+    def test_self_modifying_code(self):
+        # the STA turns the NOP that follows it in the same block into INX
+        cpu = self.assertSameRun('''
+              LDA #$E8
+              STA $C005
+              NOP
+              JMP HALT
+            HALT:
+              JMP HALT
+        ''')
+        self.assertEqual(0x01, cpu.x_index)
+
+    def test_write_to_code_page_invalidates(self):
+        cpu = self.load_program('''
+              LDA #$01
+              RTS
+        ''')
+        next(cpu.run())
+        self.assertIn(0xC000, cpu.blocks)
+        cpu.write_byte(0xC0FF, 0x00)
+        self.assertNotIn(0xC000, cpu.blocks)
+
+    def test_write_elsewhere_keeps_blocks(self):
+        cpu = self.load_program('''
+              LDA #$01
+              RTS
+        ''')
+        next(cpu.run())
+        cpu.write_byte(0x0200, 0x00)
+        self.assertIn(0xC000, cpu.blocks)
+
+    def test_write_through_a_mirror_invalidates(self):
+        # the INC turns STA $10 into STX $10 through the $0800 mirror
+        memory = NESMemory()
+        code = self.assembly('''
+              LDA #$01
+              LDX #$09
+              STA $10
+              INC $0B04
+              JMP $0300
+        ''', 0x0300)
+        memory.ram[0x0300:0x0300 + len(code)] = bytearray(code)
+        cpu = BlockCPU(None, memory)
+        cpu.program_counter = 0x0300
+        cpu.run_cycles(16)
+        self.assertEqual(0x86, memory.ram[0x0304])
+        self.assertEqual(0x01, memory.ram[0x10])
+        cpu.run_cycles(7)
+        self.assertEqual(0x09, memory.ram[0x10])
+
+    def test_reset(self):
+        cpu = self.assertSameRun('''
+            RESET:
+              SEI
+              CLD
+              LDX #$40
+              STX $4017
+              LDX #$FF
+              TXS
+              INX
+              STX $2000
+              STX $2001
+              STX $4010
+              JMP HALT
+            HALT:
+              JMP HALT
+        ''')
+        self.assertEqual(0x40, cpu.bus._mem[0x4017])
+
+    def test_clearmem(self):
+        self.assertSameRun('''
+            CLEARMEM:
+              LDA #$00
+              STA $0000, x
+              STA $0100, x
+              STA $0200, x
+              STA $0400, x
+              STA $0500, x
+              STA $0600, x
+              STA $0700, x
+              LDA #$FE
+              STA $0300, x
+              INX
+              BNE CLEARMEM
+              JMP HALT
+            HALT:
+              JMP HALT
+        ''')
+
+    def test_load_palettes(self):
+        cpu = self.assertSameRun('''
+            LoadPalettes:
+              LDA $2002
+              LDA #$3F
+              STA $2006
+              LDA #$00
+              STA $2006
+              LDX #$00
+            LoadPalettesIntoPPU:
+              LDA palette, x
+              STA $2007
+              INX
+              CPX #32
+              BNE LoadPalettesIntoPPU
+            JMP done
+
+            palette:
+              .db $0F,$01,$02,$03,$04,$05,$06,$07,$08,$09,$0A,$0B,$0C,$0D,$0E,$0F
+              .db $0F,$30,$31,$32,$33,$35,$36,$37,$38,$39,$3A,$3B,$3C,$3D,$3E,$0F
+
+            done:
+            HALT:
+              JMP HALT
+        ''')
+        self.assertEqual(32, cpu.x_index)
+        self.assertEqual(0x0F, cpu.bus._mem[0x2007])
+
+    def test_load_sprites(self):
+        cpu = self.assertSameRun('''
+            LoadSprites:
+              LDX #$00
+            LoadSpritesIntoPPU:
+              LDA sprites, x
+              STA $0200, x
+              INX
+              CPX #4
+              BNE LoadSpritesIntoPPU
+            JMP done
+
+            sprites:
+              .db $80, $00, $03, $80
+
+            done:
+            HALT:
+              JMP HALT
+        ''')
+        self.assertEqual([0x80, 0x00, 0x03, 0x80], list(cpu.bus._mem[0x0200:0x0204]))
+
+    def test_blocks_end_at_breakpoints(self):
+        cpu = self.load_program('''
+              LDA #$01
+              LDX #$02
+              LDY #$03
+              JMP HALT
+            HALT:
+              JMP HALT
+        ''')
+        cpu.run_until(0xC002, 100)
+        self.assertEqual(0xC002, cpu.program_counter)
+        self.assertEqual(0x01, cpu.accumulator)
+        self.assertEqual(0x00, cpu.x_index)
+        cpu.run_until(0xC004, 100)
+        self.assertEqual(0x02, cpu.x_index)
+        self.assertEqual(0x00, cpu.y_index)
+
+    def test_run_cycles(self):
+        cpu = self.load_program('''
+            LOOP:
+              INX
+              BNE LOOP
+              JMP HALT
+            HALT:
+              JMP HALT
+        ''')
+        # 255 iterations of 5 cycles and a last one of 4
+        self.assertEqual(1279, cpu.run_until(0xC003, 10000))
+        cpu.program_counter = 0xC000
+        self.assertEqual(10, cpu.run_cycles(10))
+        self.assertEqual(2, cpu.x_index)
+
+    def test_run_instructions_is_exact(self):
+        cpu = self.load_program('''
+              LDA #$01
+              LDX #$02
+              LDY #$03
+              JMP HALT
+            HALT:
+              JMP HALT
+        ''')
+        self.assertEqual(4, cpu.run_instructions(2))
+        self.assertEqual(0xC004, cpu.program_counter)
+
+
+class PollingPPU(object):
+    # counts the reads of each register
+
+    def __init__(self, status=0x00):
+        self.status = status
+        self.reads = [0] * 8
+
+    def read_register(self, cycle, register):
+        self.reads[register] += 1
+        return self.status
+
+    def write_register(self, cycle, register, value):
+        pass
+
+
+class IdleLoopTest(TestCase):
+
+    def load_program(self, code, skip_idle_loops=True, start_addr=0x0300):
+        self.ppu = PollingPPU()
+        memory = NESMemory(ppu=self.ppu)
+        cart = Cartridge()
+        cart.set_org(start_addr)
+        memory.load(start_addr, semantic(syntax(lexical(code)), False, cart))
+        cpu = BlockCPU(None, memory)
+        cpu.skip_idle_loops = skip_idle_loops
+        cpu.program_counter = start_addr
+        return cpu
+
+    def assertSameCycles(self, code, cycles):
+        reference = self.load_program(code, skip_idle_loops=False)
+        expected = reference.run_cycles(cycles)
+        reference_reads = self.ppu.reads
+        cpu = self.load_program(code)
+        self.assertEqual(expected, cpu.run_cycles(cycles))
+        for name in ['accumulator', 'x_index', 'y_index', 'program_counter', 'p']:
+            self.assertEqual(getattr(reference, name), getattr(cpu, name), name)
+        return cpu, reference_reads
+
+    def test_wait_vblank_skips_to_batch_end(self):
+        cpu, reference_reads = self.assertSameCycles('''
+            WAITVBLANK:
+              BIT $2002
+              BPL WAITVBLANK
+              RTS
+        ''', 100000)
+        self.assertIn(0x0300, cpu.idle_loops)
+        self.assertGreater(reference_reads[2], 10000)
+        self.assertLess(self.ppu.reads[2], 5)
+
+    def test_skip_stops_at_next_event(self):
+        cpu = self.load_program('''
+            WAITVBLANK:
+              BIT $2002
+              BPL WAITVBLANK
+              RTS
+        ''')
+        seen = []
+        Scheduler().attach(cpu).schedule(5000, lambda cycle: seen.append(cpu.cycles))
+        # passes take 7 cycles: two run, the skip lands on 4998, the last
+        # pass ending before the event, and the next one crosses it; one
+        # more pass after the event and the rest of the batch is skipped
+        self.assertEqual(10003, cpu.run_cycles(10000))
+        self.assertEqual([5005], seen)
+        self.assertEqual(5, self.ppu.reads[2])
+
+    def test_registers_settle_before_skipping(self):
+        self.assertSameCycles('''
+            WAIT:
+              LDX $2002
+              LDA $10, x
+              AND #$80
+              BEQ WAIT
+              RTS
+        ''', 50000)
+
+    def test_counting_loop_is_not_skipped(self):
+        cpu, reference_reads = self.assertSameCycles('''
+            WAIT:
+              BIT $2002
+              INY
+              BPL WAIT
+              RTS
+        ''', 20000)
+        self.assertEqual(reference_reads, self.ppu.reads)
+
+    def test_side_effect_reads_are_not_skipped(self):
+        cpu, reference_reads = self.assertSameCycles('''
+            WAIT:
+              LDA $2007
+              BEQ WAIT
+              RTS
+        ''', 20000)
+        self.assertNotIn(0x0300, cpu.idle_loops)
+        self.assertEqual(reference_reads, self.ppu.reads)
+
+    def test_frame_irq_poll_is_not_skipped(self):
+        cpu, reference_reads = self.assertSameCycles('''
+            WAIT:
+              LDA $4015
+              BEQ WAIT
+              RTS
+        ''', 20000)
+        self.assertNotIn(0x0300, cpu.idle_loops)
+
+    def test_reads_are_not_skipped_without_asking_the_bus(self):
+        bus = PlainBus()
+        # WAIT: LDA $10 / BEQ WAIT
+        bus.memory[0x0300:0x0304] = bytearray([0xA5, 0x10, 0xF0, 0xFC])
+        cpu = BlockCPU(None, bus)
+        cpu.program_counter = 0x0300
+        cpu.run_cycles(100)
+        self.assertIn(0x0300, cpu.blocks)
+        self.assertNotIn(0x0300, cpu.idle_loops)
+
+    def test_loop_with_store_is_not_idle(self):
+        cpu = self.load_program('''
+            WAIT:
+              LDA $2002
+              STA $10
+              BPL WAIT
+              RTS
+        ''')
+        cpu.run_cycles(100)
+        self.assertIn(0x0300, cpu.blocks)
+        self.assertNotIn(0x0300, cpu.idle_loops)
+
+
+class PlainBus(object):
+    # 64K behind read_byte and write_byte alone
+
+    def __init__(self):
+        self.memory = bytearray(0x10000)
+
+    def read_byte(self, cycle, address):
+        return self.memory[address]
+
+    def read_word(self, cycle, address):
+        return self.memory[address] | (self.memory[(address + 1) & 0xFFFF] << 8)
+
+    def write_byte(self, cycle, address, value):
+        self.memory[address] = value
+
+
+class RecordingPPU(object):
+
+    def __init__(self):
+        self.writes = []
+
+    def read_register(self, cycle, register):
+        return 0
+
+    def write_register(self, cycle, register, value):
+        self.writes.append((cycle, register, value))
+
+    def write_oam(self, cycle, data):
+        pass
+
+
+class CountedLoopTest(TestCase):
+
+    def load_program(self, code, batch_counted_loops=True):
+        ppu = RecordingPPU()
+        memory = NESMemory(ppu=ppu)
+        prg = bytearray(0x4000)
+        cart = Cartridge()
+        cart.set_org(0xC000)
+        opcodes = semantic(syntax(lexical(code)), False, cart)
+        prg[:len(opcodes)] = bytearray(opcodes)
+        memory.map_rom(0xC000, prg)
+        memory.ram[0x0300:0x0400] = bytearray(range(0x100))
+        cpu = BlockCPU(None, memory)
+        cpu.batch_counted_loops = batch_counted_loops
+        cpu.program_counter = 0xC000
+        # programs end with JMP HALT / HALT: JMP HALT
+        self.stop_addr = 0xC000 + len(opcodes) - 3
+        return cpu
+
+    def assertSameRun(self, code, cycles=None):
+        reference = self.load_program(code, batch_counted_loops=False)
+        cpu = self.load_program(code)
+        for machine in [reference, cpu]:
+            if cycles is None:
+                machine.run_until(self.stop_addr, 100000)
+            else:
+                machine.run_cycles(cycles)
+        self.assertEqual(reference.total_cycles, cpu.total_cycles)
+        for name in ['accumulator', 'x_index', 'y_index', 'program_counter', 'p']:
+            self.assertEqual(getattr(reference, name), getattr(cpu, name), name)
+        self.assertEqual(reference.bus.ram, cpu.bus.ram)
+        self.assertEqual(reference.bus.ppu.writes, cpu.bus.ppu.writes)
+        return cpu
+
+    def test_clearmem(self):
+        cpu = self.assertSameRun('''
+              LDX #$00
+            CLEARMEM:
+              LDA #$00
+              STA $0000, x
+              STA $0100, x
+              STA $0200, x
+              STA $0400, x
+              LDA #$FE
+              STA $0500, x
+              INX
+              BNE CLEARMEM
+              JMP HALT
+            HALT:
+              JMP HALT
+        ''')
+        self.assertIn(0xC002, cpu.counted_loops)
+        self.assertEqual(bytearray([0xFE] * 0x100), cpu.bus.ram[0x0500:0x0600])
+
+    def test_store_through_a_mirror_feeds_a_load(self):
+        # $0801 is $0001, the byte the next pass loads from $0800
+        cpu = self.assertSameRun('''
+              LDA #$42
+              STA $00
+              LDX #$00
+            COPY:
+              LDA $0800, x
+              STA $0001, x
+              INX
+              BNE COPY
+              JMP HALT
+            HALT:
+              JMP HALT
+        ''')
+        self.assertEqual(bytearray([0x42] * 0x100), cpu.bus.ram[0x0000:0x0100])
+
+    def test_dma_stalls_are_kept(self):
+        code = '''
+              LDX #$04
+            COPY:
+              LDA #$02
+              STA $4014
+              DEX
+              BNE COPY
+              JMP HALT
+            HALT:
+              JMP HALT
+        '''
+        runs = []
+        for batch in [False, True]:
+            cpu = self.load_program(code, batch_counted_loops=batch)
+            cpu.bus.cpu = cpu
+            cpu.run_until(self.stop_addr, 100000)
+            runs.append(cpu.total_cycles)
+        self.assertIn(0xC002, cpu.counted_loops)
+        self.assertEqual(runs[0], runs[1])
+        self.assertGreater(runs[1], 4 * 513)
+
+    def test_palettes_reach_the_ppu_in_order(self):
+        cpu = self.assertSameRun('''
+              LDX #$00
+            LOADPALETTES:
+              LDA palette, x
+              STA $2007
+              INX
+              CPX #32
+              BNE LOADPALETTES
+              JMP HALT
+            palette:
+              .db $0F,$01,$02,$03,$04,$05,$06,$07,$08,$09,$0A,$0B,$0C,$0D,$0E,$0F
+              .db $0F,$30,$31,$32,$33,$35,$36,$37,$38,$39,$3A,$3B,$3C,$3D,$3E,$0F
+            HALT:
+              JMP HALT
+        ''')
+        self.assertIn(0xC002, cpu.counted_loops)
+        self.assertEqual(32, len(cpu.bus.ppu.writes))
+
+    def test_batch_ends_with_the_budget(self):
+        code = '''
+              LDX #$00
+            COPY:
+              LDA $0300, x
+              STA $0200, x
+              INX
+              BNE COPY
+              JMP HALT
+            HALT:
+              JMP HALT
+        '''
+        for cycles in [10, 100, 1001, 1500]:
+            self.assertSameRun(code, cycles)
+
+    def test_decrementing_counter_wraps(self):
+        self.assertSameRun('''
+              LDY #$10
+            FILL:
+              LDA #$AA
+              STA $0400, y
+              STA $05F8, y
+              DEY
+              CPY #$F0
+              BNE FILL
+              JMP HALT
+            HALT:
+              JMP HALT
+        ''')
+
+    def test_store_before_load(self):
+        self.assertSameRun('''
+              LDA #$55
+              LDX #$00
+            SHIFT:
+              STA $0200, x
+              LDA $0300, x
+              INX
+              CPX #$20
+              BNE SHIFT
+              JMP HALT
+            HALT:
+              JMP HALT
+        ''')
+
+    def test_overlapping_copy_runs_pass_by_pass(self):
+        self.assertSameRun('''
+              LDX #$00
+            SMEAR:
+              LDA $0300, x
+              STA $0301, x
+              INX
+              CPX #$80
+              BNE SMEAR
+              JMP HALT
+            HALT:
+              JMP HALT
+        ''')
@@ -0,0 +1,483 @@
+from __future__ import print_function
+
+from wednesday.cpu6502 import CPU, signed
+
+
+BRANCHES = frozenset(['BCC', 'BCS', 'BEQ', 'BNE', 'BMI', 'BPL', 'BVC', 'BVS'])
+
+# instructions that end a basic block: after them the program counter is
+# no longer the address of the next instruction in memory
+BLOCK_END = BRANCHES | frozenset(['JMP', 'JSR', 'RTS', 'RTI', 'BRK'])
+
+# instructions that store to memory through write_byte, after which the
+# block may have rewritten itself
+WRITES_MEMORY = frozenset([
+    'STA', 'STX', 'STY', 'INC', 'DEC', 'PHA', 'PHP',
+])
+SHIFTS = frozenset(['ASL', 'LSR', 'ROL', 'ROR'])
+
+# implied mode instructions that still go to the bus (the stack)
+STACK_OPS = frozenset(['PHA', 'PHP', 'PLA', 'PLP'])
+
+# what an addressing mode may read, for modes with an operand address
+READ_SPAN = {
+    'zero_page': 1, 'absolute': 1,
+    'zero_page_x': 0x100, 'zero_page_y': 0x100,
+    'absolute_x': 0x100, 'absolute_y': 0x100,
+}
+
+# index register and address mask of the modes a counted loop may load
+# and store through
+LOOP_MODES = {
+    'zero_page': (None, 0xFF),
+    'absolute': (None, 0xFFFF),
+    'zero_page_x': ('x_index', 0xFF),
+    'absolute_x': ('x_index', 0xFFFF),
+    'absolute_x_rmw': ('x_index', 0xFFFF),
+    'absolute_y': ('y_index', 0xFFFF),
+    'absolute_y_rmw': ('y_index', 0xFFFF),
+}
+LOOP_STEPS = {
+    'INX': ('x_index', 1, 'CPX'), 'DEX': ('x_index', -1, 'CPX'),
+    'INY': ('y_index', 1, 'CPY'), 'DEY': ('y_index', -1, 'CPY'),
+}
+
+
+class CountedLoop(object):
+    # LDA and STA, then one INX, DEX, INY or DEY, maybe a CPX or CPY with
+    # an immediate, and a BNE back to the start. ops are (store, base,
+    # register, mask, cycle, value) with base None for LDA #value; cycle is
+    # where in the pass a store happens, for the bus.
+
+    def __init__(self, ops, step, compare_pc, compare, cycles):
+        self.ops = ops
+        self.step = step
+        self.counter, self.delta, compare_name = LOOP_STEPS[step]
+        self.compare_pc = compare_pc
+        self.compare = compare
+        self.cycles = cycles
+
+
+class BlockCPU(CPU):
+    # Translates straight-line runs of code, up to a branch, JMP, JSR, RTS,
+    # RTI or BRK, into one Python function cached by its entry PC. Operands
+    # are decoded and base cycles summed at translation time.
+    #
+    # Stores to a page holding translated code drop the blocks on that page.
+    # Blocks also end before breakpoints and run_until targets.
+    # Memory written behind the CPU's back (loading a program, poking from a
+    # debugger) must be followed by invalidate(address).
+    #
+    # A block that branches back to itself, stores nothing and reads no
+    # address with side effects (see MemoryMap.read_has_side_effects) is an
+    # idle loop. Once a pass through one leaves the registers as it found
+    # them, every further pass is the same until something outside the CPU
+    # changes, so run_batch counts whole passes up to next_event_cycle or the
+    # end of the batch instead of running them.
+    #
+    # Counted loops that clear or copy memory (see CountedLoop) run all
+    # but their last pass as slice assignments, or as a burst of writes to
+    # the bus for a device register, when nothing they store feeds what
+    # they load. The last pass runs as a block and sets the flags.
+
+    MAX_BLOCK_INSTRUCTIONS = 64
+    skip_idle_loops = True
+    batch_counted_loops = True
+
+    def __init__(self, options, bus, max_block_instructions=None):
+        self.blocks = {}
+        self.code_pages = {}
+        # page_keys of the pages that have held code, and the pages behind
+        # each key, for writes through a mirror of a code page
+        self.code_keys = set()
+        self.aliases = {}
+        self.block_dirty = False
+        self.block_stops = frozenset()
+        self.idle_loops = set()
+        self.counted_loops = {}
+        self.idle_state = None
+        self.idle_cycle = -1
+        if max_block_instructions is None:
+            max_block_instructions = self.MAX_BLOCK_INSTRUCTIONS
+        self.max_block_instructions = max_block_instructions
+        super(BlockCPU, self).__init__(options, bus)
+        self.page_keys = getattr(bus, 'page_keys', None) or list(range(0x100))
+        # bank switches change the code under translated blocks
+        listeners = getattr(bus, 'remap_listeners', None)
+        if listeners is not None:
+            listeners.append(self.invalidate_pages)
+
+    def run(self):
+        # yields once per block, with the cycles of the whole block
+        blocks = self.blocks
+        while True:
+            start = self.cycles
+            if start >= self.next_event_cycle:
+                self.service_events()
+            pc = self.program_counter
+            block = blocks.get(pc)
+            if block is None:
+                block = self.translate(pc)
+                if block is None:
+                    self.unknown_op(pc, self.read_byte(pc))
+                    break
+            block(self)
+            self.block_dirty = False
+            yield self.cycles_run(start), None
+
+    def run_batch(self, end_cycle, count, stops):
+        # an instruction budget needs the interpreter's granularity, the
+        # cycle budget is checked between blocks
+        if count >= 0:
+            return CPU.run_batch(self, end_cycle, count, stops)
+        # blocks must end before a stop, retranslate the ones that don't
+        for address in stops - self.block_stops:
+            self.invalidate(address)
+        self.block_stops = frozenset(stops)
+        blocks = self.blocks
+        idle_loops = self.idle_loops
+        counted_loops = self.counted_loops
+        start = cycles = self.cycles
+        self.start_batch(end_cycle)
+        try:
+            while True:
+                cycles = self.cycles
+                if cycles >= self.next_event_cycle:
+                    if cycles >= end_cycle:
+                        break
+                    self.service_events()
+                    continue
+                pc = self.program_counter
+                if pc in stops:
+                    break
+                block = blocks.get(pc)
+                if block is None:
+                    block = self.translate(pc)
+                    if block is None:
+                        self.unknown_op(pc, self.read_byte(pc))
+                        break
+                loop = counted_loops.get(pc)
+                if loop is not None and self.run_counted_loop(loop):
+                    continue
+                block(self)
+                self.block_dirty = False
+                if pc in idle_loops:
+                    self.skip_idle_loop(cycles)
+        finally:
+            self.end_batch()
+        return self.cycles_run(start)
+
+    def skip_idle_loop(self, start):
+        # the pass that started at start began in the state the one before
+        # it left, if both agree it is spinning
+        cycles = self.cycles - start
+        state = (self.program_counter, self.accumulator, self.x_index,
+                 self.y_index, self.stack_pointer, self.p)
+        if state == self.idle_state and self.idle_cycle == start:
+            # up to the next event or the end of the batch, in whole passes
+            # only, the one crossing it really runs
+            stop = self.next_event_cycle
+            if stop > self.cycles:
+                self.cycles += (stop - self.cycles) // cycles * cycles
+        self.idle_state = state
+        self.idle_cycle = self.cycles
+
+    def run_counted_loop(self, loop):
+        # False when the loop has to run pass by pass
+        counter = getattr(self, loop.counter)
+        passes = ((loop.compare - counter) * loop.delta) % 0x100 or 0x100
+        # as many passes as the batch would run before the next event, the
+        # last one never
+        start = self.cycles
+        budget = self.next_event_cycle - start
+        passes = min(passes - 1, -(-budget // loop.cycles))
+        if passes < 2:
+            return False
+        counters = [(counter + n * loop.delta) & 0xFF for n in range(passes)]
+        read_pages = self.read_pages
+        write_pages = self.write_pages
+        values = [self.accumulator] * passes
+        loaded = None
+        stores = []
+        # loads and stores meet on the memory behind them, not the address,
+        # so a store through a mirror still feeds a load
+        page_keys = self.page_keys
+        touched = set()
+        bus_stores = 0
+        for store, base, register, mask, cycle, value in loop.ops:
+            if base is None:
+                values = loaded = [value] * passes
+                continue
+            addresses = self.loop_addresses(loop, base, register, mask, counters)
+            if addresses is None:
+                return False
+            pages = range(min(addresses) >> 8, (max(addresses) >> 8) + 1)
+            if not store:
+                if any(read_pages[page] is None for page in pages):
+                    return False
+                values = loaded = [read_pages[address >> 8][address & 0xFF]
+                                   for address in addresses]
+                touched.update((page_keys[address >> 8], address & 0xFF)
+                               for address in addresses)
+                continue
+            if all(write_pages[page] is None for page in pages):
+                bus_stores += 1
+            elif any(write_pages[page] is None or page_keys[page] in self.code_keys
+                     for page in pages):
+                return False
+            # each pass stores what it loaded last, or what the pass
+            # before it left in A
+            if loaded is None:
+                values = [self.accumulator]
+                if passes > 1:
+                    last = self.last_loaded(loop, passes, read_pages, counters)
+                    if last is None:
+                        return False
+                    values.extend(last[:-1])
+            stores.append((addresses, values, cycle, write_pages[addresses[0] >> 8] is None))
+        # stores must not feed loads or each other, and bus writes keep
+        # their order only when there is one stream of them
+        written = set()
+        for addresses, values, cycle, bus in stores:
+            addresses = set((page_keys[address >> 8], address & 0xFF)
+                            for address in addresses)
+            if addresses & touched or addresses & written:
+                return False
+            written |= addresses
+        if bus_stores > 1:
+            return False
+        for addresses, values, cycle, bus in stores:
+            if bus:
+                write = self.bus.write_byte
+                for n, (address, value) in enumerate(zip(addresses, values)):
+                    write(start + n * loop.cycles + cycle, address, value)
+            else:
+                self.store_run(addresses, values)
+        if loaded is not None:
+            self.accumulator = loaded[-1]
+        # the step and compare of the last pass batched set the flags
+        setattr(self, loop.counter, counters[-1])
+        getattr(self, loop.step)()
+        if loop.compare_pc is not None:
+            getattr(self, 'CPX' if loop.counter == 'x_index' else 'CPY')(loop.compare_pc + 1)
+        # on top of whatever the stores stalled the CPU for
+        self.cycles += passes * loop.cycles
+        return True
+
+    def loop_addresses(self, loop, base, register, mask, counters):
+        if register is None:
+            return [base] * len(counters)
+        if register == loop.counter:
+            indexes = counters
+        else:
+            indexes = [getattr(self, register)] * len(counters)
+        if mask == 0xFF:
+            return [(base + index) & 0xFF for index in indexes]
+        if base + 0xFF > 0xFFFF:
+            return None
+        return [base + index for index in indexes]
+
+    def last_loaded(self, loop, passes, read_pages, counters):
+        # what the last LDA of each pass loads, for loops that store first
+        for store, base, register, mask, cycle, value in reversed(loop.ops):
+            if store:
+                continue
+            if base is None:
+                return [value] * passes
+            addresses = self.loop_addresses(loop, base, register, mask, counters)
+            if addresses is None or any(read_pages[address >> 8] is None
+                                        for address in addresses):
+                return None
+            return [read_pages[address >> 8][address & 0xFF] for address in addresses]
+        return [self.accumulator] * passes
+
+    def store_run(self, addresses, values):
+        write_pages = self.write_pages
+        first, last = addresses[0], addresses[-1]
+        if first >> 8 == last >> 8:
+            if last - first == len(addresses) - 1:
+                write_pages[first >> 8][first & 0xFF:(last & 0xFF) + 1] = bytes(bytearray(values))
+                return
+            if first - last == len(addresses) - 1:
+                write_pages[first >> 8][last & 0xFF:(first & 0xFF) + 1] = bytes(bytearray(values[::-1]))
+                return
+        for address, value in zip(addresses, values):
+            write_pages[address >> 8][address & 0xFF] = value
+
+    def write_byte(self, address, value):
+        page = self.write_pages[address >> 8]
+        if page is not None:
+            page[address & 0xFF] = value
+        else:
+            self.bus.write_byte(self.cycles, address, value)
+        if self.page_keys[address >> 8] in self.code_keys:
+            self.invalidate_aliases(address)
+
+    def push_byte(self, byte):
+        # through write_byte, code can live on the stack page too
+        self.write_byte(self.STACK_PAGE + self.stack_pointer, byte)
+        self.stack_pointer = (self.stack_pointer - 1) % 0x100
+
+    def invalidate(self, address):
+        entries = self.code_pages.pop(address >> 8, None)
+        if entries:
+            for entry in entries:
+                self.blocks.pop(entry, None)
+            self.block_dirty = True
+
+    def invalidate_aliases(self, address):
+        key = self.page_keys[address >> 8]
+        pages = self.aliases.get(key)
+        if pages is None:
+            pages = self.aliases[key] = [page for page, other in enumerate(self.page_keys)
+                                         if other == key]
+        for page in pages:
+            if page in self.code_pages:
+                self.invalidate((page << 8) | (address & 0xFF))
+
+    def invalidate_pages(self, first, end):
+        self.aliases.clear()
+        for page in range(first, end):
+            if page in self.code_pages:
+                self.invalidate(page << 8)
+
+    def flush_blocks(self):
+        self.blocks.clear()
+        self.code_pages.clear()
+        self.code_keys.clear()
+        self.idle_loops.clear()
+        self.counted_loops.clear()
+
+    def decode(self, entry):
+        instructions = []
+        pc = entry
+        while len(instructions) < self.max_block_instructions:
+            if pc in self.block_stops and pc != entry:
+                break
+            opcode = self.read_byte(pc)
+            if opcode not in self.OPCODES:
+                break
+            instruction, mode = self.OPCODES[opcode]
+            length = self.ADDRESSING_MODES[mode][0]
+            operand = 0
+            for i in range(length):
+                operand |= self.read_byte(pc + 1 + i) << (8 * i)
+            instructions.append((pc, instruction, mode, operand))
+            pc += 1 + length
+            if instruction in BLOCK_END:
+                break
+        return instructions, pc
+
+    def is_idle_loop(self, entry, instructions):
+        pc, instruction, mode, operand = instructions[-1]
+        if instruction not in BRANCHES or pc + 2 + signed(operand) != entry:
+            return False
+        side_effects = getattr(self.bus, 'read_has_side_effects', None)
+        for pc, instruction, mode, operand in instructions[:-1]:
+            if instruction in WRITES_MEMORY or instruction in STACK_OPS:
+                return False
+            if instruction in SHIFTS and self.ADDRESSING_MODES[mode][2] is not None:
+                return False
+            if mode in ('implied', 'immediate'):
+                continue
+            if side_effects is None:
+                # nothing to ask whether the read is safe to skip
+                return False
+            span = READ_SPAN.get(mode)
+            if span is None:
+                # through a pointer, could be anywhere
+                return False
+            if mode.startswith('zero_page') and span > 1:
+                operand = 0
+            for address in range(operand, min(operand + span, 0x10000)):
+                if side_effects(address):
+                    return False
+        return True
+
+    def counted_loop(self, entry, instructions):
+        pc, instruction, mode, operand = instructions[-1]
+        if instruction != 'BNE' or pc + 2 + signed(operand) != entry:
+            return None
+        ops = []
+        step = compare_pc = None
+        compare = 0
+        cycle = 0
+        for pc, instruction, mode, operand in instructions[:-1]:
+            cycle += 2 + self.ADDRESSING_MODES[mode][1]
+            if step is None and instruction == 'LDA' and mode == 'immediate':
+                ops.append((False, None, None, None, cycle, operand))
+            elif step is None and instruction in ('LDA', 'STA') and mode in LOOP_MODES:
+                register, mask = LOOP_MODES[mode]
+                ops.append((instruction == 'STA', operand, register, mask, cycle, None))
+            elif step is None and instruction in LOOP_STEPS:
+                step = instruction
+            elif (step is not None and compare_pc is None and mode == 'immediate' and
+                    instruction == LOOP_STEPS[step][2]):
+                compare_pc = pc
+                compare = operand
+            else:
+                return None
+        if step is None or not any(op[0] for op in ops):
+            return None
+        # the BNE, taken
+        return CountedLoop(ops, step, compare_pc, compare, cycle + 3)
+
+    def block_source(self, name, instructions, end):
+        lines = ['def {}(self):'.format(name)]
+        pending = 0
+        for n, (pc, instruction, mode, operand) in enumerate(instructions):
+            length, cycles, expression = self.ADDRESSING_MODES[mode]
+            next_pc = pc + 1 + length
+            pending += 2 + cycles  # all instructions take 2 as a minimum
+            if mode == 'relative':
+                args = '0x{:04X}'.format(next_pc + signed(operand))
+            elif expression is None:
+                args = ''
+            else:
+                args = expression.format(
+                    pc='0x{:04X}'.format(pc + 1),
+                    byte='0x{:02X}'.format(operand),
+                    word='0x{:04X}'.format(operand))
+            if (expression is not None or instruction in BLOCK_END or
+                    instruction in STACK_OPS):
+                # the instruction may touch the bus, make its cycle stamp right
+                lines.append('    self.cycles += {}'.format(pending))
+                pending = 0
+            if instruction in BLOCK_END:
+                lines.append('    self.program_counter = 0x{:04X}'.format(next_pc))
+            lines.append('    self.{}({})'.format(instruction, args))
+            writes = instruction in WRITES_MEMORY or (
+                instruction in SHIFTS and expression is not None)
+            if writes and n < len(instructions) - 1:
+                lines.append('    if self.block_dirty:')
+                lines.append('        self.program_counter = 0x{:04X}'.format(next_pc))
+                lines.append('        return')
+        if pending:
+            lines.append('    self.cycles += {}'.format(pending))
+        if instructions[-1][1] not in BLOCK_END:
+            lines.append('    self.program_counter = 0x{:04X}'.format(end))
+        return '\n'.join(lines)
+
+    def translate(self, entry):
+        instructions, end = self.decode(entry)
+        if not instructions:
+            return None
+        name = 'block_{:04X}'.format(entry)
+        namespace = {'signed': signed}
+        source = self.block_source(name, instructions, end)
+        exec(compile(source, '<6502 block ${:04X}>'.format(entry), 'exec'), namespace)
+        block = namespace[name]
+        self.blocks[entry] = block
+        if self.skip_idle_loops and self.is_idle_loop(entry, instructions):
+            self.idle_loops.add(entry)
+        else:
+            self.idle_loops.discard(entry)
+        loop = self.batch_counted_loops and self.counted_loop(entry, instructions)
+        if loop:
+            self.counted_loops[entry] = loop
+        else:
+            self.counted_loops.pop(entry, None)
+        for page in range(entry >> 8, ((end - 1) >> 8) + 1):
+            self.code_pages.setdefault(page, set()).add(entry)
+            self.code_keys.add(self.page_keys[page & 0xFF])
+        return block